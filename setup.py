@@ -69,15 +69,22 @@ setup(
         'setuptools',
         'pyramid',
         'requests',
+        'BTrees',
+        'persistent',
+        'six',
         'nti.app.products.courseware',
+        'nti.base',
         'nti.coremetadata',
         'nti.dataserver',
         'nti.externalization',
         'nti.property',
         'nti.schema',
-        'nti.webhooks',
+        'nti.transactions',
+        # batching.BatchShipmentInfo is a ShipmentInfo; see test_batching
+        'nti.webhooks == 0.0.6',
         'zope.cachedescriptors',
         'zope.component',
+        'zope.exceptions',
         'zope.i18nmessageid',
         'zope.interface',
         'zope.lifecycleevent',
@@ -24,9 +24,30 @@ ZAPIER_PATH = "zapier"
 #: Subscriptions view
 SUBSCRIPTIONS_VIEW = "subscriptions"
 
+#: Subscription export view
+EXPORT_SUBSCRIPTIONS_VIEW = "export_subscriptions"
+
 #: Subscription delivery history view
 DELIVERY_HISTORY_VIEW = "DeliveryHistory"
 
+#: Subscription delivery health view
+HEALTH_VIEW = "Health"
+
+#: Site subscription health view
+SUBSCRIPTION_HEALTH_VIEW = "subscription_health"
+
+#: Subscription delivery statistics view
+DELIVERY_STATS_VIEW = "DeliveryStats"
+
+#: Site delivery statistics view
+SITE_DELIVERY_STATS_VIEW = "delivery_stats"
+
+#: Site failed delivery attempts view
+SITE_DELIVERY_FAILURES_VIEW = "delivery_failures"
+
+#: Delivery attempt compaction view
+COMPACT_DELIVERY_ATTEMPTS_VIEW = "compact_delivery_attempts"
+
 #: Delivery attempt request
 DELIVERY_REQUEST_VIEW = "Request"
 
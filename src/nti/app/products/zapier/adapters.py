@@ -91,6 +91,10 @@ class AbstractWebhookSubscriber(ABC):
 
     permission_id = ACT_VIEW_EVENTS.id
 
+    #: Whether deliveries to subscriptions may be coalesced, see
+    #: :class:`~.IDeliveryCoalescing`.
+    coalescable = False
+
     def __init__(self, request):
         self.request = request
 
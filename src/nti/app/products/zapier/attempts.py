@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import zlib
+
+from persistent import Persistent
+
+from persistent.interfaces import IPersistent
+
+from zope import component
+from zope import interface
+
+from zope.schema import getFieldsInOrder
+
+from nti.app.products.zapier.interfaces import IDeliveryAttemptBodyLimits
+
+from nti.webhooks.attempts import WebhookDeliveryAttemptRequest
+from nti.webhooks.attempts import WebhookDeliveryAttemptResponse
+
+from nti.webhooks.interfaces import IWebhookDeliveryAttemptRequest
+from nti.webhooks.interfaces import IWebhookDeliveryAttemptResponse
+
+#: Bodies shorter than this many characters are stored inline.
+MIN_COMPRESSED_LENGTH = 256
+
+#: The default most characters of each body stored.
+DEFAULT_MAX_BODY_LENGTH = 64 * 1024
+
+#: Ends bodies that were truncated when stored.
+TRUNCATION_MARKER = u'\n[truncated]'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@interface.implementer(IDeliveryAttemptBodyLimits)
+class DeliveryAttemptBodyLimits(object):
+
+    def __init__(self, max_request_length=DEFAULT_MAX_BODY_LENGTH,
+                 max_response_length=DEFAULT_MAX_BODY_LENGTH):
+        self.max_request_length = max_request_length
+        self.max_response_length = max_response_length
+
+
+#: The limits used unless configured otherwise.
+DEFAULT_BODY_LIMITS = DeliveryAttemptBodyLimits()
+
+
+def get_body_limits():
+    return component.queryUtility(IDeliveryAttemptBodyLimits,
+                                  default=DEFAULT_BODY_LIMITS)
+
+
+class CompressedText(Persistent):
+    """
+    A text value, stored compressed in its own record so it is only
+    loaded when used.
+    """
+
+    def __init__(self, text):
+        self._data = zlib.compress(text.encode('utf-8'))
+
+    @property
+    def text(self):
+        return zlib.decompress(self._data).decode('utf-8')
+
+
+class _CompressedTextProperty(object):
+    """
+    A data descriptor for a text field, storing long values as
+    :class:`CompressedText`, and the original length of values truncated
+    when stored.
+    """
+
+    def __init__(self, field):
+        self._field = field
+        self._name = '_compressed_' + field.__name__
+        self._length_name = '_original_length_' + field.__name__
+
+    def __get__(self, inst, klass):
+        if inst is None:
+            return self
+        value = inst.__dict__.get(self._name, self._field.default)
+        return value.text if isinstance(value, CompressedText) else value
+
+    def __set__(self, inst, value):
+        self._field.bind(inst).validate(value)
+        self.store(inst, value)
+
+    def store(self, inst, value, max_length=None):
+        """
+        Set the value without validating it. Values longer than
+        *max_length*, if given, are truncated.
+        """
+        inst.__dict__.pop(self._length_name, None)
+        if value is not None and max_length is not None and len(value) > max_length:
+            inst.__dict__[self._length_name] = len(value)
+            value = value[:max(max_length - len(TRUNCATION_MARKER), 0)] + TRUNCATION_MARKER
+        if value is not None and len(value) >= MIN_COMPRESSED_LENGTH:
+            value = CompressedText(value)
+        inst.__dict__[self._name] = value
+
+    def truncated(self, inst):
+        return self._length_name in inst.__dict__
+
+    def original_length(self, inst):
+        """
+        The length of the value before it was stored, or None if there is
+        no value.
+        """
+        length = inst.__dict__.get(self._length_name)
+        if length is None:
+            value = self.__get__(inst, type(inst))
+            length = len(value) if value is not None else None
+        return length
+
+
+class CompressedDeliveryAttemptRequest(WebhookDeliveryAttemptRequest):
+    __external_class_name__ = 'WebhookDeliveryAttemptRequest'
+
+    body = _CompressedTextProperty(IWebhookDeliveryAttemptRequest['body'])
+
+
+class CompressedDeliveryAttemptResponse(WebhookDeliveryAttemptResponse):
+    __external_class_name__ = 'WebhookDeliveryAttemptResponse'
+
+    content = _CompressedTextProperty(IWebhookDeliveryAttemptResponse['content'])
+
+
+#: Fields of requests and responses derived from others, not copied.
+_DERIVED_FIELDS = ('created', 'modified')
+
+
+def _compressed_copy(obj, factory, schema, name, max_length=None):
+    if obj is None or isinstance(obj, factory):
+        return obj
+    result = factory()
+    result.createdTime = obj.createdTime
+    result.lastModified = obj.lastModified
+    for field_name, field in getFieldsInOrder(schema):
+        if field_name in _DERIVED_FIELDS:
+            continue
+        value = field.query(obj)
+        if field_name == name:
+            getattr(factory, name).store(result, value, max_length)
+        elif value is not None:
+            # Required fields not yet set (e.g. of requests never sent)
+            # stay unset
+            field.set(result, value)
+    return result
+
+
+def compress_attempt_bodies(attempt, limits=None):
+    """
+    Replace the request and response of the delivery attempt with copies
+    whose bodies are stored compressed, in their own records. Loading the
+    attempt then no longer loads them. Bodies longer than the
+    :class:`IDeliveryAttemptBodyLimits` (by default, those registered) are
+    truncated.
+
+    Once the attempt is resolved, its ``payload_data`` is dropped, as the
+    request body holds the same payload (see :func:`attempt_payload`). It
+    becomes the request body, truncated like it, if the request was never
+    sent. Until then it is kept in full, to be delivered.
+
+    :return: True if the attempt changed.
+    """
+    limits = limits if limits is not None else get_body_limits()
+    payload = getattr(attempt, 'payload_data', None) if attempt.resolved() else None
+    request = _compressed_copy(attempt.request,
+                               CompressedDeliveryAttemptRequest,
+                               IWebhookDeliveryAttemptRequest,
+                               'body',
+                               limits.max_request_length)
+    response = _compressed_copy(attempt.response,
+                                CompressedDeliveryAttemptResponse,
+                                IWebhookDeliveryAttemptResponse,
+                                'content',
+                                limits.max_response_length)
+    if payload is not None and request is not None and request.body is None:
+        CompressedDeliveryAttemptRequest.body.store(request, payload,
+                                                    limits.max_request_length)
+    if payload is None \
+            and request is attempt.request and response is attempt.response:
+        return False
+    if payload is not None:
+        attempt.payload_data = None
+    attempt.request = request
+    attempt.response = response
+    if IPersistent.providedBy(attempt):
+        attempt._p_changed = True
+    return True
+
+
+def attempt_payload(attempt):
+    """
+    The payload of the delivery attempt: its ``payload_data`` while it is
+    pending, and its request body once it is resolved.
+    """
+    payload = attempt.payload_data
+    if payload is None and attempt.request is not None:
+        payload = attempt.request.body
+    return payload
+
+
+def stored_body_length(obj, name):
+    """
+    Return the original length of the body stored in the attribute *name*
+    of the delivery attempt request or response *obj*, and whether it was
+    truncated when stored.
+    """
+    descriptor = getattr(type(obj), name, None)
+    if isinstance(descriptor, _CompressedTextProperty):
+        return descriptor.original_length(obj), descriptor.truncated(obj)
+    value = getattr(obj, name, None)
+    return (len(value) if value is not None else None), False
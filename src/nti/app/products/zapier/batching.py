@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+
+import requests
+
+import six
+
+import transaction
+
+from ZODB.POSException import ConflictError
+
+from ZODB.interfaces import IDatabase
+
+from persistent import Persistent
+
+from persistent.interfaces import IPersistent
+
+from zope import component
+from zope import interface
+
+from zope.annotation.factory import factory as an_factory
+
+from zope.annotation.interfaces import IAnnotations
+
+from zope.component.hooks import site as current_site
+
+from zope.container.contained import Contained
+
+from zope.exceptions import print_exception
+
+from nti.app.products.zapier import MessageFactory as _
+
+from nti.app.products.zapier.coalescing import record_flushed
+from nti.app.products.zapier.coalescing import record_pending
+
+from nti.app.products.zapier.interfaces import IDeliveryBatching
+
+from nti.site.hostpolicy import get_host_site
+
+from nti.transactions.loop import TransactionLoop
+
+from nti.webhooks.datamanager import WebhookDataManager
+
+from nti.webhooks.delivery_manager import ShipmentInfo
+
+from nti.webhooks.interfaces import IWebhookDeliveryManager
+from nti.webhooks.interfaces import IWebhookSubscription
+
+#: The most attempts sent together, unless configured otherwise.
+DEFAULT_BATCH_SIZE = 100
+
+#: The most seconds an attempt is held, unless configured otherwise.
+DEFAULT_BATCH_WINDOW = 60
+
+#: The name of the :class:`IDeliveryFlush` of batches.
+BATCH_FLUSH = u'batch'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@component.adapter(IWebhookSubscription)
+@interface.implementer(IDeliveryBatching)
+class DeliveryBatching(Persistent, Contained):
+    """
+    An :class:`IDeliveryBatching` stored as an annotation of the
+    subscription.
+
+    Every attempt held updates it, so attempts concurrently added to an
+    open batch are merged. Anything else done concurrently (opening or
+    sending a batch, or configuring it) conflicts.
+    """
+
+    size = None
+    window = DEFAULT_BATCH_WINDOW
+    deadline = None
+
+    def __init__(self):
+        self._names = ()
+        self.deadline = None
+
+    def add(self, name, now=None):
+        now = time.time() if now is None else now
+        opened = not self._names
+        self._names += (name,)
+        if opened:
+            self.deadline = now + self.window
+            return self.deadline
+        # A window that has ended but not yet been flushed is
+        # recorded again, in case that was missed.
+        return self.deadline if self.deadline <= now else None
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        if not self._names:
+            return []
+        if len(self._names) < (self.size or 1) and now < self.deadline:
+            return []
+        result = list(self._names)
+        self._names = ()
+        self.deadline = None
+        return result
+
+    def next_deadline(self):
+        return self.deadline if self._names else None
+
+    def __len__(self):
+        return len(self._names)
+
+    def _p_resolveConflict(self, old_state, committed_state, new_state):
+        old_names = old_state.get('_names', ())
+        committed_names = committed_state.get('_names', ())
+        new_names = new_state.get('_names', ())
+        for key in ('size', 'window', 'deadline'):
+            if not old_state.get(key) == committed_state.get(key) == new_state.get(key):
+                raise ConflictError()
+        # Both only added to the same open batch
+        if not old_names \
+                or committed_names[:len(old_names)] != old_names \
+                or new_names[:len(old_names)] != old_names:
+            raise ConflictError()
+        result = dict(committed_state)
+        result['_names'] = committed_names + new_names[len(old_names):]
+        return result
+
+
+_DELIVERY_BATCHING_KEY = 'nti.app.products.zapier.batching.DeliveryBatching'
+
+_DeliveryBatchingFactory = an_factory(DeliveryBatching,
+                                      _DELIVERY_BATCHING_KEY)
+
+
+def query_delivery_batching(subscription):
+    """
+    The :class:`IDeliveryBatching` of the subscription, or None if it has
+    never been configured. Unlike adapting, this never stores a new one.
+    """
+    annotations = IAnnotations(subscription, None)
+    return annotations.get(_DELIVERY_BATCHING_KEY) if annotations is not None else None
+
+
+def batch_size(subscription):
+    """
+    The most attempts sent together to the subscription, or None if its
+    deliveries are not batched.
+    """
+    batching = query_delivery_batching(subscription)
+    return (batching.size or None) if batching is not None else None
+
+
+def _exception_text(exc_info):
+    """
+    The text of the exception as stored with delivery attempts, without
+    file names, as ``nti.webhooks`` stores it.
+    """
+    f = six.StringIO()
+    print_exception(exc_info[0], exc_info[1], exc_info[2],
+                    file=f, with_filenames=False)
+    result = f.getvalue()
+    return result.decode('latin-1') if isinstance(result, bytes) else result
+
+
+def _text_dict(headers):
+    return {six.text_type(k): six.text_type(v) for k, v in headers.items()}
+
+
+class _BatchTarget(object):
+    """
+    Stands in for the subscription and the attempt when preparing the
+    request for a batch, as :class:`IWebhookDialect` expects. We can't use
+    them in the delivery thread.
+    """
+
+    __slots__ = ('dialect', 'to', 'payload_data')
+
+    def __init__(self, subscription, attempts):
+        self.dialect = subscription.dialect
+        self.to = subscription.to
+        self.payload_data = u'[%s]' % u','.join(attempt.payload_data
+                                                for attempt in attempts)
+
+
+def _attempt_getter(attempt):
+    """
+    A callable of a connection returning the *attempt*, loaded in that
+    connection if it is persistent.
+    """
+    if not IPersistent.providedBy(attempt):
+        return lambda unused_connection: attempt
+    database_name = attempt._p_jar.db().database_name
+    oid = attempt._p_oid
+    return lambda connection: connection.get_connection(database_name).get(oid)
+
+
+class _RunWithDatabase(TransactionLoop):
+    """
+    Runs its handler with a new connection to the database, retrying
+    conflicts.
+    """
+
+    attempts = 10
+
+    _connection = None
+
+    def run_handler(self, *args, **kwargs):
+        return self.handler(self._connection, *args, **kwargs)
+
+    def setUp(self):
+        db = component.getUtility(IDatabase)
+        self._connection = db.open()
+
+    def tearDown(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            finally:
+                self._connection = None
+
+
+class BatchShipmentInfo(ShipmentInfo):
+    """
+    Delivers the attempts of one subscription with a single request
+    whose body is the array of their payloads, in order. Each attempt is
+    resolved with the outcome of that request, storing only its own
+    payload as the request body.
+
+    This is only a :class:`ShipmentInfo` because the delivery manager
+    accepts nothing else; none of its state or methods are used.
+    """
+
+    def __init__(self, subscription, attempts):
+        super(BatchShipmentInfo, self).__init__(())
+        self._batch_target = _BatchTarget(subscription, attempts)
+        self._batch_getters = [_attempt_getter(attempt) for attempt in attempts]
+        self._batch_persistent = any(IPersistent.providedBy(attempt)
+                                     for attempt in attempts)
+
+    def deliver(self):
+        # As for ShipmentInfo, we can't access any attributes of the
+        # subscription or attempts here, only the target.
+        target = self._batch_target
+        created = time.time()
+        http_response = exception_string = None
+        with requests.Session() as http_session:
+            try:
+                prepared_request = target.dialect.prepareRequest(http_session,
+                                                                 target,
+                                                                 target)
+                http_response = http_session.send(prepared_request)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to deliver batch of %s for hook to %s",
+                                 len(self._batch_getters), target.to)
+                exception_string = _exception_text(sys.exc_info())
+
+        if self._batch_persistent:
+            runner = _RunWithDatabase(self._resolve)
+            runner(created, http_response, exception_string)
+        else:
+            self._resolve(None, created, http_response, exception_string)
+
+    def _resolve(self, connection, created, http_response, exception_string):
+        for getter in self._batch_getters:
+            attempt = getter(connection)
+            attempt.request.createdTime = created
+            if exception_string:
+                attempt.response = None
+                attempt.message = self.REMOTE_EXCEPTION_MESSAGE
+                attempt.internal_info.storeExceptionText(exception_string)
+                attempt.status = 'failed'
+                continue
+            try:
+                self._fill(attempt, http_response)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to parse response for attempt %s", attempt)
+                attempt.message = self.LOCAL_EXCEPTION_MESSAGE
+                attempt.internal_info.storeExceptionText(
+                    _exception_text(sys.exc_info()))
+                attempt.status = 'failed'
+            else:
+                attempt.status = 'successful' if http_response.ok else 'failed'
+
+    @staticmethod
+    def _fill(attempt, http_response):
+        attempt.message = u'%s %s' % (http_response.status_code, http_response.reason)
+        http_request = http_response.request
+        request = attempt.request
+        request.url = http_request.url
+        request.method = six.text_type(http_request.method)
+        request.body = attempt.payload_data
+        request.headers = _text_dict(http_request.headers)
+        response = attempt.response
+        response.createdTime = time.time()
+        response.status_code = http_response.status_code
+        response.reason = six.text_type(http_response.reason)
+        response.headers = _text_dict(http_response.headers)
+        response.content = http_response.text
+        response.elapsed = http_response.elapsed
+
+
+def ship_batch(tx, subscription, names):
+    """
+    Deliver the pending attempts of *subscription* with the given *names*
+    as one batch once the transaction *tx* commits successfully.
+
+    :return: The number of attempts in the batch.
+    """
+    attempts = []
+    for name in names:
+        attempt = subscription.get(name)
+        # Missing if removed (e.g. by retention) while held
+        if attempt is not None and attempt.status == 'pending':
+            attempts.append(attempt)
+    if not attempts:
+        return 0
+    jar = subscription._p_jar
+    for attempt in attempts:
+        # Attempts created in this transaction need an oid to be
+        # found again once delivered.
+        if attempt._p_jar is None:
+            jar.add(attempt)
+    shipment_info = BatchShipmentInfo(subscription, attempts)
+
+    def _after_commit(success):
+        if success:
+            delivery_man = component.getUtility(IWebhookDeliveryManager)
+            delivery_man.acceptForDelivery(shipment_info)
+    tx.addAfterCommitHook(_after_commit)
+    return len(attempts)
+
+
+def _hold(tx, subscription, payload):
+    attempt = subscription.createDeliveryAttempt(payload)
+    if attempt.status != 'pending':
+        # The target failed validation
+        return
+    batching = IDeliveryBatching(subscription)
+    deadline = batching.add(attempt.__name__)
+    names = batching.due()
+    if names:
+        ship_batch(tx, subscription, names)
+        record_flushed(subscription, BATCH_FLUSH, None)
+    elif deadline is not None:
+        record_pending(subscription, BATCH_FLUSH, deadline)
+
+
+class _BatchedDeliveries(object):
+    """
+    The deliveries to batched subscriptions made during a transaction,
+    held for their batches just before it commits, when the data is
+    complete.
+    """
+
+    def __init__(self, tx):
+        self.tx = tx
+        self._deliveries = []
+        # As for WebhookDataManager, each data is externalized once per
+        # dialect, however many subscriptions it is delivered to.
+        self._payloads = {}
+
+    def add(self, data, event, subscriptions):
+        self._deliveries.extend((data, event, subscription)
+                                for subscription in subscriptions)
+
+    def __call__(self):
+        seen = set()
+        for delivery in self._deliveries:
+            if delivery in seen:
+                continue
+            seen.add(delivery)
+            data, event, subscription = delivery
+            _hold(self.tx, subscription, self._payload(data, event, subscription))
+
+    def _payload(self, data, event, subscription):
+        dialect = subscription.dialect
+        try:
+            return self._payloads[(data, dialect)]
+        except KeyError:
+            result = dialect.externalizeData(data, event)
+            self._payloads[(data, dialect)] = result
+            return result
+
+
+def join_transaction(transaction_manager, data, event, subscriptions):
+    """
+    As for :meth:`WebhookDataManager.join_transaction`, but deliveries to
+    subscriptions whose deliveries are batched are held for their batch
+    instead. Subscriptions not yet stored are never batched.
+    """
+    immediate = []
+    batched = []
+    for subscription in subscriptions:
+        if getattr(subscription, '_p_oid', None) is None \
+                or not batch_size(subscription):
+            immediate.append(subscription)
+        else:
+            batched.append(subscription)
+    if batched:
+        tx = transaction_manager.get()
+        try:
+            deliveries = tx.data(_BatchedDeliveries)
+        except KeyError:
+            deliveries = _BatchedDeliveries(tx)
+            tx.set_data(_BatchedDeliveries, deliveries)
+            tx.addBeforeCommitHook(deliveries)
+        deliveries.add(data, event, batched)
+    if immediate:
+        WebhookDataManager.join_transaction(transaction_manager, data, event,
+                                            immediate)
+
+
+def _abandon(subscription, names):
+    for name in names:
+        attempt = subscription.get(name)
+        if attempt is not None and attempt.status == 'pending':
+            attempt.message = _(u"The subscription was deactivated before "
+                                u"the batch was delivered.")
+            attempt.status = 'failed'
+
+
+def flush_batch(db, site_name, oid, now=None):
+    """
+    Deliver the batch of the subscription with the given *oid* if its
+    window has ended, in our own connection to *db*, in the named host
+    site. Registered as the :class:`IDeliveryFlush` named
+    :data:`BATCH_FLUSH`.
+
+    :return: The time the window of the open batch ends, if any.
+    """
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    try:
+        tm.begin()
+        ds_folder = conn.root()['nti.dataserver']
+        with current_site(ds_folder):
+            with current_site(get_host_site(site_name)):
+                try:
+                    subscription = conn.get(oid)
+                except KeyError:
+                    return None
+                batching = query_delivery_batching(subscription)
+                if batching is None:
+                    return None
+                names = batching.due(now)
+                delivered = 0
+                if subscription.active and subscription.__parent__ is not None:
+                    delivered = ship_batch(tm.get(), subscription, names)
+                else:
+                    # Deactivated while the batch was open
+                    _abandon(subscription, names)
+                next_deadline = batching.next_deadline()
+                record_flushed(subscription, BATCH_FLUSH, next_deadline)
+                tm.commit()
+                logger.debug('Delivered a batch of %s for %s',
+                             delivered, subscription)
+                return next_deadline
+    finally:
+        tm.abort()
+        conn.close()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import functools
+import threading
+
+from BTrees.OOBTree import OOBTree
+
+from ZODB.POSException import ConflictError
+
+from persistent import Persistent
+
+from zope import component
+from zope import interface
+
+from zope.annotation.factory import factory as an_factory
+
+from zope.annotation.interfaces import IAnnotations
+
+from zope.component.hooks import site as current_site
+
+from zope.container.contained import Contained
+
+from nti.app.products.zapier.interfaces import IDeliveryCoalescing
+from nti.app.products.zapier.interfaces import IDeliveryFlush
+from nti.app.products.zapier.interfaces import IDeliveryFlushSettings
+from nti.app.products.zapier.interfaces import IPendingFlushes
+
+from nti.app.products.zapier.jobs import acquire_lease
+from nti.app.products.zapier.jobs import submit_job
+
+from nti.app.products.zapier.sites import read_only_connection
+from nti.app.products.zapier.sites import scan_host_sites
+
+from nti.site.hostpolicy import get_all_host_sites
+
+from nti.webhooks.interfaces import IWebhookSubscription
+from nti.webhooks.interfaces import IWebhookSubscriptionManager
+
+#: The default most seconds between sweeps for windows that have ended.
+DEFAULT_SWEEP_INTERVAL = 60
+
+#: The name of the lease taken by each sweep.
+SWEEP_LEASE = u'nti.app.products.zapier.coalescing.sweep'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class _PendingDelivery(Persistent):
+    """
+    The latest data for an open coalescing window, and the number of
+    deliveries it stands for.
+
+    Every delivery in the window updates it, so concurrent updates are
+    merged by adding their counts. Once the window is flushed it is
+    closed, and updates to it conflict, so they are retried in a new
+    window.
+    """
+
+    closed = False
+
+    def __init__(self, data, deadline):
+        self.data = data
+        self.deadline = deadline
+        self.count = 1
+        self.closed = False
+
+    def _p_resolveConflict(self, old_state, committed_state, new_state):
+        if committed_state.get('closed') or new_state.get('closed'):
+            raise ConflictError()
+        result = dict(committed_state)
+        result['count'] = committed_state['count'] + new_state['count'] \
+                        - old_state['count']
+        return result
+
+
+@component.adapter(IWebhookSubscription)
+@interface.implementer(IDeliveryCoalescing)
+class DeliveryCoalescing(Persistent, Contained):
+    """
+    An :class:`IDeliveryCoalescing` stored as an annotation of the
+    subscription.
+    """
+
+    window = None
+
+    def __init__(self):
+        self._pending = OOBTree()
+
+    def add(self, key, data, now=None):
+        now = time.time() if now is None else now
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingDelivery(data, now + self.window)
+            return pending.deadline
+        # The data for a key should not change, so we only count
+        if pending.data != data:
+            pending.data = data
+        pending.count += 1
+        # A window that has ended but not yet been flushed is
+        # recorded again, in case that was missed.
+        return pending.deadline if pending.deadline <= now else None
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        result = []
+        for key, pending in list(self._pending.items()):
+            if pending.deadline <= now:
+                pending.closed = True
+                del self._pending[key]
+                result.append((pending.data, pending.count))
+        return result
+
+    def next_deadline(self):
+        deadlines = [pending.deadline for pending in self._pending.values()]
+        return min(deadlines) if deadlines else None
+
+    def __len__(self):
+        return len(self._pending)
+
+
+_DELIVERY_COALESCING_KEY = 'nti.app.products.zapier.coalescing.DeliveryCoalescing'
+
+_DeliveryCoalescingFactory = an_factory(DeliveryCoalescing,
+                                        _DELIVERY_COALESCING_KEY)
+
+
+def query_delivery_coalescing(subscription):
+    """
+    The :class:`IDeliveryCoalescing` of the subscription, or None if it
+    has never been configured. Unlike adapting, this never stores a new
+    one.
+    """
+    annotations = IAnnotations(subscription, None)
+    return annotations.get(_DELIVERY_COALESCING_KEY) if annotations is not None else None
+
+
+def coalescing_window(subscription):
+    """
+    The coalescing window of the subscription, in seconds, or None if its
+    deliveries are not coalesced.
+    """
+    coalescing = query_delivery_coalescing(subscription)
+    return (coalescing.window or None) if coalescing is not None else None
+
+
+@component.adapter(IWebhookSubscriptionManager)
+@interface.implementer(IPendingFlushes)
+class PendingFlushes(Persistent, Contained):
+    """
+    An :class:`IPendingFlushes` stored as an annotation of the
+    subscription manager.
+    """
+
+    def __init__(self):
+        # (name, kind) -> deadline
+        self._deadlines = OOBTree()
+
+    def add(self, name, deadline, kind):
+        key = (name, kind)
+        current = self._deadlines.get(key)
+        if current is None or deadline < current:
+            self._deadlines[key] = deadline
+
+    def flushed(self, name, kind, next_deadline):
+        key = (name, kind)
+        if next_deadline is None:
+            self._deadlines.pop(key, None)
+        elif self._deadlines.get(key) != next_deadline:
+            self._deadlines[key] = next_deadline
+
+    def discard(self, name):
+        for key in list(self._deadlines.keys(min=(name,))):
+            if key[0] != name:
+                break
+            del self._deadlines[key]
+
+    def due(self, now):
+        return [key for key, deadline in self._deadlines.items()
+                if deadline <= now]
+
+    def __len__(self):
+        return len(self._deadlines)
+
+
+_PENDING_FLUSHES_KEY = 'nti.app.products.zapier.coalescing.PendingFlushes'
+
+_PendingFlushesFactory = an_factory(PendingFlushes, _PENDING_FLUSHES_KEY)
+
+
+def query_pending_flushes(sub_manager):
+    """
+    The :class:`IPendingFlushes` of the subscription manager, or None if
+    no window was ever opened. Unlike adapting, this never stores a new
+    one.
+    """
+    annotations = IAnnotations(sub_manager, None)
+    return annotations.get(_PENDING_FLUSHES_KEY) if annotations is not None else None
+
+
+@interface.implementer(IDeliveryFlushSettings)
+class DeliveryFlushSettings(object):
+
+    def __init__(self, sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+
+
+#: The settings used unless configured otherwise.
+DEFAULT_FLUSH_SETTINGS = DeliveryFlushSettings()
+
+
+def get_flush_settings():
+    return component.queryUtility(IDeliveryFlushSettings,
+                                  default=DEFAULT_FLUSH_SETTINGS)
+
+
+def record_pending(subscription, kind, deadline):
+    """
+    Record in the :class:`IPendingFlushes` of its manager that
+    *subscription* has a window ending at *deadline*, to be flushed by
+    the :class:`IDeliveryFlush` named *kind* once a sweep finds it ended.
+    """
+    IPendingFlushes(subscription.__parent__).add(subscription.__name__,
+                                                 deadline, kind)
+
+
+def record_flushed(subscription, kind, next_deadline):
+    """
+    Record in the :class:`IPendingFlushes` of its manager that the
+    windows of *subscription* flushed by the :class:`IDeliveryFlush`
+    named *kind* were flushed, and when the next one ends, if any.
+    """
+    pending = query_pending_flushes(subscription.__parent__) \
+        if subscription.__parent__ is not None else None
+    if pending is not None:
+        pending.flushed(subscription.__name__, kind, next_deadline)
+
+
+def _due_flushes(now, unused_site):
+    result = []
+    for unused_name, sub_manager in component.getUtilitiesFor(IWebhookSubscriptionManager):
+        pending = query_pending_flushes(sub_manager)
+        if not pending:
+            continue
+        for name, kind in pending.due(now):
+            subscription = sub_manager.get(name)
+            if subscription is None:
+                # Removed without the event
+                continue
+            result.append((kind, subscription._p_oid))
+    return result
+
+
+def sweep_flushes(db, now=None):
+    """
+    Flush the windows of every host site that ended by *now*. Flushes that
+    conflict are left for the next sweep.
+
+    :return: The number of subscriptions flushed.
+    """
+    now = time.time() if now is None else now
+    with read_only_connection(db) as conn:
+        with current_site(conn.root()['nti.dataserver']):
+            site_names = [site.__name__ for site in get_all_host_sites()]
+    flushed = 0
+    scanned = scan_host_sites(db, functools.partial(_due_flushes, now),
+                              site_names)
+    for site_name, due in scanned:
+        for kind, oid in due:
+            flush = component.queryUtility(IDeliveryFlush, name=kind)
+            if flush is None:
+                continue
+            try:
+                flush(db, site_name, oid, now)
+            except ConflictError:
+                logger.warning('Conflict flushing %s deliveries in %s, will '
+                               'retry on the next sweep', kind, site_name)
+                continue
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to flush %s deliveries in %s',
+                                 kind, site_name)
+                continue
+            flushed += 1
+    if flushed:
+        logger.info('Flushed the deliveries of %s subscriptions', flushed)
+    return flushed
+
+
+def _sweep(db, interval):
+    # Held until it expires, so all processes together sweep at most
+    # once each interval
+    if acquire_lease(db, SWEEP_LEASE, interval) is None:
+        return 0
+    return sweep_flushes(db)
+
+
+_sweep_lock = threading.Lock()
+_last_sweeps = {}
+
+
+def request_sweep(db, now=None):
+    """
+    Run :func:`sweep_flushes` as a background job (see
+    :func:`~.jobs.submit_job`) if this process has not in the
+    :class:`IDeliveryFlushSettings` sweep interval, and no other process
+    has either. Nothing is swept if the interval is None.
+
+    :return: The :class:`concurrent.futures.Future` of the number of
+        subscriptions flushed, or None if no sweep was needed.
+    """
+    interval = get_flush_settings().sweep_interval
+    if not interval:
+        return None
+    now = time.time() if now is None else now
+    with _sweep_lock:
+        # The first request only starts the interval
+        last = _last_sweeps.setdefault(db.database_name, now)
+        if now - last < interval:
+            return None
+        _last_sweeps[db.database_name] = now
+    return submit_job(_sweep, db, interval)
+
+
+def _sweep_after_commit(success, db):
+    if success:
+        request_sweep(db)
+
+
+def request_sweep_after_commit(tx, subscriptions):
+    """
+    Windows are flushed lazily: each transaction delivering to
+    *subscriptions* calls :func:`request_sweep` once it commits
+    successfully.
+    """
+    jars = (getattr(subscription, '_p_jar', None) for subscription in subscriptions)
+    jar = next((jar for jar in jars if jar is not None), None)
+    if jar is None:
+        return
+    try:
+        tx.data(request_sweep)
+    except KeyError:
+        tx.set_data(request_sweep, True)
+        tx.addAfterCommitHook(_sweep_after_commit, (jar.db(),))
+
+
+def _reset_sweeps():
+    with _sweep_lock:
+        _last_sweeps.clear()
+
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ImportError:  # pragma: no cover
+    pass
+else:
+    addCleanUp(_reset_sweeps)
@@ -63,13 +63,10 @@ def zapier_user_progress(event):
     course = event.context
     user = event.user
     enrollment = get_enrollment_record(course, user)
-    progress = component.queryMultiAdapter((user, course),
-                                           IProgress)
-
+    # Progress is computed once a payload needs it
     return ZapierUserProgressUpdatedEvent(
         enrollment,
-        user,
-        progress
+        user
     )
 
 
@@ -97,7 +94,8 @@ def course_progress_updated_payload(record, event):
                            Progress=progress_details)
 
     payload = ExternalUserProgressUpdatedEvent(EventType=EVENT_PROGESS_UPDATED,
-                                               Data=data)
+                                               Data=data,
+                                               UpdateCount=event.UpdateCount)
     return payload
 
 
@@ -136,6 +134,7 @@ class CourseProgressUpdatedWebhookSubscriber(AbstractWebhookSubscriber):
     for_ = ICourseInstanceEnrollmentRecord
     when = IZapierUserProgressUpdatedEvent
     permission_id = nauth.ACT_READ.id
+    coalescable = True
 
 
 # Course Created adapters
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import transaction
+
+from ZODB.POSException import POSKeyError
+
+from zope import component
+
+from zope.component.hooks import site as current_site
+
+from nti.app.products.zapier.batching import join_transaction
+
+from nti.app.products.zapier.coalescing import coalescing_window
+from nti.app.products.zapier.coalescing import query_delivery_coalescing
+from nti.app.products.zapier.coalescing import record_flushed
+from nti.app.products.zapier.coalescing import record_pending
+from nti.app.products.zapier.coalescing import request_sweep_after_commit
+
+from nti.app.products.zapier.courseware.interfaces import IZapierUserProgressUpdatedEvent
+
+from nti.app.products.zapier.courseware.model import ZapierUserProgressUpdatedEvent
+
+from nti.app.products.zapier.interfaces import IDeliveryCoalescing
+
+from nti.app.products.zapier.subscribers import find_subscriptions_to_deliver
+
+from nti.contenttypes.courses.interfaces import ICourseInstanceEnrollmentRecord
+
+from nti.externalization.oids import from_external_oid
+
+from nti.ntiids.ntiids import get_specific
+
+from nti.ntiids.oids import to_external_ntiid_oid
+
+from nti.site.hostpolicy import get_host_site
+
+from nti.webhooks.datamanager import WebhookDataManager
+
+#: The name of the :class:`IDeliveryFlush` of progress updates.
+PROGRESS_UPDATE_FLUSH = u'course.progress_updated'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def progress_update_key(record):
+    """
+    The key progress updates for the enrollment record are coalesced by,
+    its user and course.
+    """
+    principal = record.Principal
+    return (getattr(principal, 'username', None) or principal.id,
+            to_external_ntiid_oid(record.CourseInstance))
+
+
+def progress_update_event(record, update_count=1):
+    """
+    A :class:`ZapierUserProgressUpdatedEvent` for the user of the
+    enrollment *record*, whose progress is computed once needed.
+    """
+    return ZapierUserProgressUpdatedEvent(record, record.Principal,
+                                          update_count=update_count)
+
+
+@component.adapter(ICourseInstanceEnrollmentRecord, IZapierUserProgressUpdatedEvent)
+def dispatch_progress_update(record, event):
+    """
+    Registered in place of :func:`~.subscribers.dispatch_webhook_event`
+    for progress updates. Updates for subscriptions with a coalescing
+    window are held until the window ends, when the progress at that
+    time is delivered by :func:`flush_progress_updates`. Only deliveries
+    to other subscriptions compute the progress now.
+    """
+    immediate = []
+    ntiid = None
+    subscriptions = find_subscriptions_to_deliver(record, event)
+    for subscription in subscriptions:
+        if coalescing_window(subscription) \
+                and getattr(subscription, '_p_oid', None) is not None:
+            # We hold a reference, not the record, so it can be removed
+            if ntiid is None:
+                ntiid = to_external_ntiid_oid(record, add_to_connection=True)
+            if ntiid is not None:
+                coalescing = IDeliveryCoalescing(subscription)
+                deadline = coalescing.add(progress_update_key(record), ntiid)
+                if deadline is not None:
+                    record_pending(subscription, PROGRESS_UPDATE_FLUSH, deadline)
+                continue
+        immediate.append(subscription)
+    if immediate:
+        join_transaction(transaction.manager, record, event, immediate)
+    request_sweep_after_commit(transaction.get(), subscriptions)
+
+
+def _find_record(conn, ntiid):
+    """
+    The enrollment record with the OID *ntiid*, loaded by *conn*, or
+    None if it no longer exists.
+    """
+    try:
+        oid, db_name, unused_intid = from_external_oid(get_specific(ntiid))
+        if db_name:
+            conn = conn.get_connection(db_name.decode('ascii'))
+        record = conn.get(oid)
+    except (KeyError, ValueError, POSKeyError):
+        return None
+    return record if ICourseInstanceEnrollmentRecord.providedBy(record) else None
+
+
+def _deliver_due(tm, conn, subscription, coalescing, now):
+    delivered = 0
+    due = coalescing.due(now)
+    if not subscription.active or subscription.__parent__ is None:
+        # Removed or deactivated while the windows were open
+        return delivered
+    for ntiid, update_count in due:
+        record = _find_record(conn, ntiid)
+        if record is None or record.__parent__ is None:
+            # Unenrolled while the window was open
+            continue
+        event = progress_update_event(record, update_count)
+        # Applicability (e.g. the owner's access) may have changed
+        if subscription(record, event) is not None:
+            WebhookDataManager.join_transaction(tm, record, event, [subscription])
+            delivered += 1
+    return delivered
+
+
+def flush_progress_updates(db, site_name, oid, now=None):
+    """
+    Deliver the progress updates of the coalescing windows of the
+    subscription with the given *oid* that have ended, in our own
+    connection to *db*, in the named host site. Registered as the
+    :class:`IDeliveryFlush` named :data:`PROGRESS_UPDATE_FLUSH`.
+
+    :return: The time the next open window ends, if any.
+    """
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    try:
+        tm.begin()
+        ds_folder = conn.root()['nti.dataserver']
+        with current_site(ds_folder):
+            with current_site(get_host_site(site_name)):
+                try:
+                    subscription = conn.get(oid)
+                except KeyError:
+                    return None
+                coalescing = query_delivery_coalescing(subscription)
+                if coalescing is None:
+                    return None
+                delivered = _deliver_due(tm, conn, subscription, coalescing, now)
+                next_deadline = coalescing.next_deadline()
+                record_flushed(subscription, PROGRESS_UPDATE_FLUSH, next_deadline)
+                tm.commit()
+                logger.debug('Delivered %s coalesced progress updates for %s',
+                             delivered, subscription)
+                return next_deadline
+    finally:
+        tm.abort()
+        conn.close()
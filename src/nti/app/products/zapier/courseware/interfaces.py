@@ -29,6 +29,7 @@ from nti.ntiids.schema import ValidNTIID
 
 from nti.schema.field import Bool
 from nti.schema.field import Float
+from nti.schema.field import Int
 from nti.schema.field import Object
 from nti.schema.field import ValidChoice
 from nti.schema.field import ValidDatetime
@@ -137,6 +138,14 @@ class IExternalUserProgressUpdatedEvent(IExternalEvent):
                   title=u"Information for the newly created user.",
                   required=True)
 
+    UpdateCount = Int(title=u"Update count",
+                      description=u"The number of progress updates delivered "
+                                  u"as this one, more than one if they were "
+                                  u"coalesced.",
+                      min=1,
+                      default=1,
+                      required=False)
+
 
 class IZapierUserProgressUpdatedEvent(IObjectEvent):
     """
@@ -160,6 +169,13 @@ class IZapierUserProgressUpdatedEvent(IObjectEvent):
                                   u"related course and user.",
                       required=True)
 
+    UpdateCount = Int(title=u"Update count",
+                      description=u"The number of progress updates this event "
+                                  u"stands for.",
+                      min=1,
+                      default=1,
+                      required=False)
+
 
 class ICourseCreatedEvent(IExternalEvent):
     """
@@ -5,8 +5,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from zope import component
 from zope import interface
 
+from zope.cachedescriptors.property import Lazy
+
 from zope.interface.interfaces import ObjectEvent
 
 from nti.app.products.zapier.courseware.interfaces import ICompletionContextProgressDetails
@@ -19,6 +22,8 @@ from nti.app.products.zapier.courseware.interfaces import IProgressSummary
 from nti.app.products.zapier.courseware.interfaces import IUserEnrolledEvent
 from nti.app.products.zapier.courseware.interfaces import IZapierUserProgressUpdatedEvent
 
+from nti.contenttypes.completion.interfaces import IProgress
+
 from nti.externalization.representation import WithRepr
 
 from nti.property.property import alias
@@ -72,10 +77,20 @@ class ZapierUserProgressUpdatedEvent(ObjectEvent):
 
     EnrollmentRecord = alias('object')
 
-    def __init__(self, obj, user, progress):
+    def __init__(self, obj, user, progress=None, update_count=1):
         super(ZapierUserProgressUpdatedEvent, self).__init__(obj)
         self.User = user
-        self.Progress = progress
+        if progress is not None:
+            self.Progress = progress
+        self.UpdateCount = update_count
+
+    @Lazy
+    def Progress(self):
+        # Computing progress is expensive, and not needed for deliveries
+        # that are coalesced, so only done once a payload needs it.
+        return component.queryMultiAdapter((self.User,
+                                            self.EnrollmentRecord.CourseInstance),
+                                           IProgress)
 
 
 @interface.implementer(IProgressDetails)
@@ -12,6 +12,9 @@ from nti.app.products.courseware.views.catalog_views import CourseCollectionView
 from nti.app.products.zapier.courseware.interfaces import ICourseDetails
 from nti.app.products.zapier.courseware.interfaces import IZapierCourseCatalogCollection
 
+from nti.app.products.zapier.view_mixins import ChangeTokenETagMixin
+from nti.app.products.zapier.view_mixins import FieldProjectionMixin
+
 from nti.dataserver import authorization as nauth
 
 from nti.externalization import to_external_object
@@ -25,7 +28,17 @@ logger = __import__('logging').getLogger(__name__)
              renderer='rest',
              context=IZapierCourseCatalogCollection,
              permission=nauth.ACT_READ)
-class ZapierCourseCollectionView(CourseCollectionView):
+class ZapierCourseCollectionView(CourseCollectionView,
+                                 ChangeTokenETagMixin,
+                                 FieldProjectionMixin):
+
+    def _change_token(self):
+        last_modified = getattr(self.context.catalog, 'lastModified', None)
+        return (last_modified,) if last_modified else None
+
+    def __call__(self):
+        self._check_not_modified()
+        return super(ZapierCourseCollectionView, self).__call__()
 
     def _get_items(self):
         """
@@ -36,5 +49,6 @@ class ZapierCourseCollectionView(CourseCollectionView):
         return result
 
     def _externalize_result(self, result):
+        result = self._project_result(result)
         return to_external_object(result,
                                   policy_name='zapier')
@@ -6,17 +6,30 @@ from __future__ import division
 from __future__ import print_function
 
 from zope import component
+
 from zope.event import notify
 
+from zope.interface import implementedBy
+
 from nti.app.products.zapier.courseware.interfaces import IZapierUserProgressUpdatedEvent
 
+from nti.app.products.zapier.courseware.model import ZapierUserProgressUpdatedEvent
+
+from nti.app.products.zapier.subscribers import has_active_subscriptions
+
 from nti.contenttypes.completion.interfaces import IUserProgressUpdatedEvent
 
 from nti.contenttypes.courses.interfaces import ICourseInstance
 
 
 @component.adapter(ICourseInstance, IUserProgressUpdatedEvent)
-def _handle_progress_update(_unused_course, event):
+def _handle_progress_update(course, event):
+    # This is our most frequent event, so only translate it if a
+    # subscription may be listening. The user's progress is computed
+    # only for subscriptions delivered to now, not those coalesced.
+    if not has_active_subscriptions(course,
+                                    implementedBy(ZapierUserProgressUpdatedEvent)):
+        return
     # Convert to internal event more conducive to the permission
     # checks performed by nti.webhooks, since ICourseInstance seems
     # insufficient a check for progress specific to both a user and course
@@ -98,6 +98,7 @@ class TestModel(ZapierTestCase):
             "MimeType": ExternalUserProgressUpdatedEvent.mime_type,
             "Class": "UserProgressUpdatedEvent",
             "Data": not_none(),
+            "UpdateCount": 1,
         }))
 
         assert_that(ext_obj['Data'], has_entries({
@@ -6,13 +6,17 @@ from __future__ import division
 from __future__ import print_function
 
 from hamcrest import assert_that
+from hamcrest import contains_inanyorder
 from hamcrest import has_entries
 from hamcrest import has_length
+from hamcrest import is_not
 from hamcrest import none
 from hamcrest import not_
 
 from nti.app.products.courseware.tests import InstructedCourseApplicationTestLayer
 
+from zope import component
+
 from nti.app.products.zapier.courseware.model import CourseDetails
 
 from nti.app.products.zapier.tests import ZapierTestMixin
@@ -21,6 +25,8 @@ from nti.app.testing.application_webtest import ApplicationLayerTest
 
 from nti.app.testing.decorators import WithSharedApplicationMockDS
 
+from nti.contenttypes.courses.interfaces import ICourseCatalog
+
 from nti.dataserver.tests import mock_dataserver as mock_ds
 
 from nti.externalization.externalization.standard_fields import datetime_to_string
@@ -72,6 +78,32 @@ class TestSearchCourses(ApplicationLayerTest, ZapierTestMixin):
                             "Last Modified": timestamp_to_string(course.lastModified),
                         }))
 
+    @WithSharedApplicationMockDS(users=True, testapp=True)
+    def test_fields(self):
+        res = self._call_FUT(params={"filter": 'CS 1323-995',
+                                     "fields": 'Id,Title,CreatedTime'},
+                             status=200,
+                             expected_length=1)
+        item = res.json_body['Items'][0]
+        assert_that(item, has_entries({
+            "MimeType": CourseDetails.mime_type,
+            "Id": not_(none()),
+            "Title": "Introduction to Computer Programming",
+            "CreatedTime": not_(none()),
+        }))
+        assert_that(list(item),
+                    contains_inanyorder('Class', 'MimeType', 'Id', 'Title',
+                                        'CreatedTime'))
+
+        # Repeated parameters and unknown fields
+        res = self._call_FUT(params=[("filter", 'CS 1323-995'),
+                                     ("fields", 'Id'),
+                                     ("fields", 'Title,Unknown')],
+                             status=200,
+                             expected_length=1)
+        assert_that(list(res.json_body['Items'][0]),
+                    contains_inanyorder('Class', 'MimeType', 'Id', 'Title'))
+
     @WithSharedApplicationMockDS(users=True, testapp=True)
     def test_links(self):
         res = self._call_FUT(params={"filter": 'CS 1323',
@@ -91,3 +123,35 @@ class TestSearchCourses(ApplicationLayerTest, ZapierTestMixin):
         assert_that(links, has_length(2))
         self.require_link_href_with_rel(json_body, "batch-next")
         self.require_link_href_with_rel(json_body, "batch-prev")
+
+    def _touch_catalog(self):
+        with mock_ds.mock_db_trans(site_name='platform.ou.edu'):
+            catalog = component.getUtility(ICourseCatalog)
+            catalog.updateLastMod((catalog.lastModified or 0) + 1)
+
+    @WithSharedApplicationMockDS(users=(u'other.user',), testapp=True)
+    def test_conditional_requests(self):
+        self._touch_catalog()
+        params = {"filter": 'CS 1323'}
+        res = self._call_FUT(params=params, status=200)
+        etag = res.headers['ETag']
+        self._call_FUT(params=params,
+                       headers={'If-None-Match': etag},
+                       status=304)
+
+        # Other parameters and users have their own ETags
+        self._call_FUT(params={"filter": 'CS 1323', "batchSize": 1},
+                       headers={'If-None-Match': etag},
+                       status=200)
+        other_environ = self._make_extra_environ(username=u'other.user')
+        self._call_FUT(params=params,
+                       headers={'If-None-Match': etag},
+                       extra_environ=other_environ,
+                       status=200)
+
+        # Changes to the catalog change the ETag
+        self._touch_catalog()
+        res = self._call_FUT(params=params,
+                             headers={'If-None-Match': etag},
+                             status=200)
+        assert_that(res.headers['ETag'], is_not(etag))
@@ -20,6 +20,8 @@ from zope.securitypolicy.interfaces import IPrincipalRoleManager
 
 from nti.app.products.courseware.tests import PersistentInstructedCourseApplicationTestLayer
 
+from nti.app.products.zapier.attempts import attempt_payload
+
 from nti.app.products.zapier.courseware.model import CourseCreatedEvent
 from nti.app.products.zapier.courseware.model import CourseDetails
 from nti.app.products.zapier.courseware.model import CourseEnrollmentDetails
@@ -112,7 +114,7 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
         with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
             subscription = find_object_with_ntiid(subscription_ntiid)
             assert_that(subscription, has_length(1))
-            assert_that(json.loads(subscription.values()[0].payload_data),
+            assert_that(json.loads(attempt_payload(subscription.values()[0])),
                         has_entries({
                             'MimeType': CourseCreatedEvent.mimeType,
                             'Data': has_entries({
@@ -183,7 +185,7 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
         with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
             subscription = find_object_with_ntiid(subscription_ntiid)
             assert_that(subscription, has_length(1))
-            assert_that(json.loads(subscription.values()[0].payload_data),
+            assert_that(json.loads(attempt_payload(subscription.values()[0])),
                         has_entries({
                             'MimeType': UserEnrolledEvent.mimeType,
                             'Data': has_entries({
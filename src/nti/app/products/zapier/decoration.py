@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from pyramid.threadlocal import get_current_request
+
+from pyramid.traversal import quote_path_segment
+
+from nti.app.products.zapier.index import query_subscription_index
+
+from nti.dataserver.authorization import ACT_DELETE
+from nti.dataserver.authorization import is_admin
+
+from nti.dataserver.authorization_acl import has_permission
+
+from nti.traversal.traversal import normal_resource_path
+
+#: The request environment key of the :class:`DecorationContext`.
+_DECORATION_CONTEXT_KEY = 'nti.app.products.zapier.decoration_context'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class DecorationContext(object):
+    """
+    The values needed to externalize and decorate each object of a
+    response that are the same for all of them, computed once for the
+    request rather than once for each object.
+
+    Subscriptions that still have the grants made when they were added
+    may be deleted by the same principals as every other such subscription
+    of their manager they (don't) own, so whether they may be deleted is
+    checked once for each manager. As with
+    :class:`~.BulkSubscriptionReadEvaluator`, subscriptions the index
+    marks as having custom grants are checked in full.
+    """
+
+    def __init__(self):
+        self._admin = {}
+        self._custom_security = {}
+        self._can_delete = {}
+        self._paths = {}
+
+    def is_admin(self, user):
+        key = getattr(user, 'username', user)
+        if key not in self._admin:
+            self._admin[key] = is_admin(user)
+        return self._admin[key]
+
+    def _has_default_security(self, subscription):
+        sub_manager = subscription.__parent__
+        key = id(sub_manager)
+        if key not in self._custom_security:
+            index = query_subscription_index(sub_manager)
+            custom = frozenset(index.custom_security_names()) if index is not None else None
+            self._custom_security[key] = (index, custom)
+        index, custom = self._custom_security[key]
+        name = subscription.__name__
+        return index is not None and name in index and name not in custom
+
+    def can_delete(self, subscription, principal_id):
+        if not self._has_default_security(subscription):
+            return has_permission(ACT_DELETE, subscription, principal_id)
+        key = (id(subscription.__parent__),
+               principal_id,
+               subscription.owner_id == principal_id)
+        if key not in self._can_delete:
+            self._can_delete[key] = has_permission(ACT_DELETE, subscription,
+                                                   principal_id)
+        return self._can_delete[key]
+
+    def resource_path(self, obj):
+        """
+        The :func:`~nti.traversal.traversal.normal_resource_path` of *obj*,
+        computing that of its parent once.
+        """
+        parent = obj.__parent__
+        key = id(parent)
+        if key not in self._paths:
+            self._paths[key] = normal_resource_path(parent)
+        path = self._paths[key] + '/' + quote_path_segment(obj.__name__)
+        return path.replace('//', '/')
+
+
+def get_decoration_context(request=None):
+    """
+    The :class:`DecorationContext` of the request, by default the current
+    request, or a new context if there is none.
+    """
+    request = request if request is not None else get_current_request()
+    if request is None:
+        return DecorationContext()
+    environ = request.environ
+    context = environ.get(_DECORATION_CONTEXT_KEY)
+    if context is None:
+        context = environ[_DECORATION_CONTEXT_KEY] = DecorationContext()
+    return context
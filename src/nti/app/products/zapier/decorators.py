@@ -17,16 +17,15 @@ from zope.i18n.interfaces import IUserPreferredLanguages
 from nti.app.products.zapier import DELIVERY_HISTORY_VIEW
 from nti.app.products.zapier import DELIVERY_REQUEST_VIEW
 from nti.app.products.zapier import DELIVERY_RESPONSE_VIEW
+from nti.app.products.zapier import DELIVERY_STATS_VIEW
+from nti.app.products.zapier import HEALTH_VIEW
+
+from nti.app.products.zapier.decoration import get_decoration_context
 
 from nti.app.products.zapier.interfaces import IUserDetails
 
 from nti.app.renderers.decorators import AbstractAuthenticatedRequestAwareDecorator
 
-from nti.dataserver.authorization import is_admin
-from nti.dataserver.authorization import ACT_DELETE
-
-from nti.dataserver.authorization_acl import has_permission
-
 from nti.externalization.interfaces import IExternalMappingDecorator
 from nti.externalization.interfaces import StandardExternalFields
 
@@ -79,14 +78,21 @@ class _EnglishFirstAndLastNameDecorator(Singleton):
 class SubscriptionLinkDecorator(AbstractAuthenticatedRequestAwareDecorator):
 
     def _do_decorate_external(self, context, result):
-        if is_admin(self.remoteUser):
-            links = result.setdefault(LINKS, [])
+        decoration = get_decoration_context(self.request)
+        links = result.setdefault(LINKS, [])
+        links.append(Link(context,
+                          rel='health',
+                          elements=(HEALTH_VIEW,)))
+        links.append(Link(context,
+                          rel='delivery_stats',
+                          elements=(DELIVERY_STATS_VIEW,)))
+
+        if decoration.is_admin(self.remoteUser):
             links.append(Link(context,
                               rel='delivery_history',
                               elements=(DELIVERY_HISTORY_VIEW,)))
 
-        if has_permission(ACT_DELETE, context, self.authenticated_userid):
-            links = result.setdefault(LINKS, [])
+        if decoration.can_delete(context, self.authenticated_userid):
             links.append(Link(context,
                               rel='delete',
                               method='DELETE'))
@@ -97,7 +103,7 @@ class SubscriptionLinkDecorator(AbstractAuthenticatedRequestAwareDecorator):
 class DeliveryAttemptLinkDecorator(AbstractAuthenticatedRequestAwareDecorator):
 
     def _do_decorate_external(self, context, result):
-        if is_admin(self.remoteUser):
+        if get_decoration_context(self.request).is_admin(self.remoteUser):
             links = result.setdefault(LINKS, [])
             links.append(Link(context,
                               rel='delivery_request',
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import csv
+import json
+
+import six
+
+from pyramid import httpexceptions as hexc
+
+from pyramid.view import view_config
+
+from zope import component
+
+from zope.component.hooks import getSite
+from zope.component.hooks import site as current_site
+
+from nti.app.base.abstract_views import AbstractAuthenticatedView
+
+from nti.app.products.zapier import MessageFactory as _
+from nti.app.products.zapier import EXPORT_SUBSCRIPTIONS_VIEW
+
+from nti.app.products.zapier.sites import read_only_connection
+
+from nti.app.products.zapier.traversal import IntegrationProviderPathAdapter
+
+from nti.common.string import is_true
+
+from nti.dataserver.authorization import is_admin
+
+from nti.externalization import to_external_object
+
+from nti.externalization.externalization.standard_fields import timestamp_to_string
+
+from nti.ntiids.oids import to_external_ntiid_oid
+
+from nti.webhooks.interfaces import IWebhookSubscriptionManager
+
+#: The content type of newline-delimited JSON.
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+#: The content type of comma-separated values.
+CSV_CONTENT_TYPE = 'text/csv'
+
+#: The columns of delivery attempt CSV exports.
+DELIVERY_ATTEMPT_CSV_COLUMNS = ('Subscription',
+                                'Name',
+                                'CreatedTime',
+                                'LastModified',
+                                'Status',
+                                'Message',
+                                'URL',
+                                'StatusCode',
+                                'Elapsed')
+
+#: The number of subscriptions and delivery attempts exported between
+#: releasing those loaded.
+CACHE_BATCH_SIZE = 100
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def _externalize(obj):
+    return to_external_object(obj,
+                              policy_name='zapier',
+                              name='zapier-webhook',
+                              decorate=False)
+
+
+def _to_line(ext):
+    return (json.dumps(ext) + '\n').encode('utf-8')
+
+
+def _subscription_line(subscription):
+    ext = _externalize(subscription)
+    return ext.get('Id'), _to_line(ext)
+
+
+def _attempt_line(subscription_id, attempt):
+    ext = _externalize(attempt)
+    ext['Subscription'] = subscription_id
+    return _to_line(ext)
+
+
+def iter_subscription_export(db, site_oid, manager_oids, attempts=False):
+    """
+    Iterate newline-delimited JSON, one line for each subscription,
+    followed by those of its delivery attempts if *attempts* is true,
+    for the subscription managers with the given object ids.
+
+    The objects are read in their own connection to *db*, so this may be
+    used after the current transaction has ended, and are released as we
+    go, so memory use does not grow with the number exported.
+    """
+    with read_only_connection(db) as conn:
+        site = conn.get(site_oid)
+        count = 0
+        for manager_oid in manager_oids:
+            manager = conn.get(manager_oid)
+            for name in list(manager.keys()):
+                subscription = manager[name]
+                with current_site(site):
+                    subscription_id, line = _subscription_line(subscription)
+                attempt_names = list(subscription.keys()) if attempts else ()
+                count += 1
+                if count % CACHE_BATCH_SIZE == 0:
+                    conn.cacheMinimize()
+                yield line
+                for attempt_name in attempt_names:
+                    with current_site(site):
+                        line = _attempt_line(subscription_id,
+                                             subscription[attempt_name])
+                    count += 1
+                    if count % CACHE_BATCH_SIZE == 0:
+                        conn.cacheMinimize()
+                    yield line
+
+
+def wants_csv(request):
+    """
+    Whether the request prefers CSV, listing it in its ``Accept`` header
+    ahead of JSON.
+    """
+    offers = request.accept.acceptable_offers(('application/json',
+                                               CSV_CONTENT_TYPE))
+    return bool(offers) and offers[0][0] == CSV_CONTENT_TYPE
+
+
+def _to_csv_line(row):
+    if six.PY2:
+        row = [x.encode('utf-8') if isinstance(x, six.text_type) else x
+               for x in row]
+    out = six.StringIO()
+    csv.writer(out).writerow(row)
+    line = out.getvalue()
+    return line if isinstance(line, bytes) else line.encode('utf-8')
+
+
+def _attempt_row(subscription_id, attempt):
+    def _time(value):
+        return timestamp_to_string(value) if value is not None else None
+    request = attempt.request
+    response = attempt.response
+    elapsed = getattr(response, 'elapsed', None)
+    return (subscription_id,
+            attempt.__name__,
+            _time(attempt.createdTime),
+            _time(attempt.lastModified),
+            attempt.status,
+            attempt.message,
+            getattr(request, 'url', None),
+            getattr(response, 'status_code', None),
+            elapsed.total_seconds() if elapsed is not None else None)
+
+
+def iter_delivery_attempt_csv(db, site_oid, attempts):
+    """
+    Iterate CSV lines, a header followed by one line for each of the
+    *attempts*, ``(subscription_oid, name)`` pairs, in order.
+
+    As with :func:`iter_subscription_export`, the attempts are read in
+    their own connection to *db*, and released as we go.
+    """
+    yield _to_csv_line(DELIVERY_ATTEMPT_CSV_COLUMNS)
+    with read_only_connection(db) as conn:
+        site = conn.get(site_oid)
+        subscription_ids = {}
+        for count, (subscription_oid, name) in enumerate(attempts, 1):
+            subscription = conn.get(subscription_oid)
+            with current_site(site):
+                if subscription_oid not in subscription_ids:
+                    subscription_ids[subscription_oid] = to_external_ntiid_oid(subscription)
+                line = _to_csv_line(_attempt_row(subscription_ids[subscription_oid],
+                                                 subscription[name]))
+            if count % CACHE_BATCH_SIZE == 0:
+                conn.cacheMinimize()
+            yield line
+
+
+def delivery_attempt_csv_response(request, attempts, filename):
+    """
+    Stream the *attempts*, ``(subscription, name)`` pairs, as the CSV
+    response to *request*.
+    """
+    site = getSite()
+    attempts = [(subscription._p_oid, name) for subscription, name in attempts]
+    response = request.response
+    response.content_type = CSV_CONTENT_TYPE
+    response.content_disposition = 'attachment; filename="%s"' % filename
+    response.app_iter = iter_delivery_attempt_csv(site._p_jar.db(),
+                                                  site._p_oid,
+                                                  attempts)
+    return response
+
+
+@view_config(route_name='objects.generic.traversal',
+             request_method='GET',
+             context=IntegrationProviderPathAdapter,
+             name=EXPORT_SUBSCRIPTIONS_VIEW)
+class ExportSubscriptionsView(AbstractAuthenticatedView):
+    """
+    Stream all subscriptions for the current site as newline-delimited
+    JSON. Only available to NTI admins.
+
+    attempts
+            If true, each subscription is followed by its delivery
+            attempts, with the ``Id`` of their ``Subscription``.
+    """
+
+    def __call__(self):
+        if not is_admin(self.remoteUser):
+            raise hexc.HTTPForbidden(_('Cannot export subscriptions.'))
+
+        site = getSite()
+        manager_oids = [sub_manager._p_oid for unused_name, sub_manager
+                        in component.getUtilitiesFor(IWebhookSubscriptionManager)]
+        attempts = is_true(self.request.params.get('attempts'))
+
+        response = self.request.response
+        response.content_type = NDJSON_CONTENT_TYPE
+        response.content_disposition = 'attachment; filename="subscriptions.ndjson"'
+        response.app_iter = iter_subscription_export(site._p_jar.db(),
+                                                     site._p_oid,
+                                                     manager_oids,
+                                                     attempts)
+        return response
@@ -8,12 +8,25 @@ from __future__ import absolute_import
 from zope import component
 from zope import interface
 
+from nti.app.products.zapier.batching import query_delivery_batching
+
+from nti.app.products.zapier.coalescing import coalescing_window
+
+from nti.app.products.zapier.decoration import get_decoration_context
+
+from nti.externalization import to_external_object
+
 from nti.externalization.datastructures import InterfaceObjectIO
 
+from nti.externalization.externalization import to_standard_external_dictionary
+
 from nti.externalization.interfaces import ExternalizationPolicy
+from nti.externalization.interfaces import IExternalizationPolicy
 from nti.externalization.interfaces import IInternalObjectExternalizer
+from nti.externalization.interfaces import LocatedExternalDict
+from nti.externalization.interfaces import StandardExternalFields
 
-from nti.traversal.traversal import normal_resource_path
+from nti.webhooks import externalization as webhook_externalization
 
 from nti.webhooks.externalization import DeliveryAttemptExternalizer
 from nti.webhooks.externalization import SubscriptionExternalizer
@@ -27,6 +40,81 @@ ISODateExternalizationPolicy = ExternalizationPolicy(
     use_iso8601_for_unix_timestamp=True
 )
 
+#: The request parameter naming the external fields to return.
+FIELDS_PARAM = 'fields'
+
+#: The external fields always returned, identifying the type of an object.
+_TYPE_FIELDS = (StandardExternalFields.CLASS, StandardExternalFields.MIMETYPE)
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def requested_fields(request):
+    """
+    The external field names requested with the ``fields`` parameter, which
+    may be comma separated and/or repeated, as a frozenset, or None if no
+    fields were requested.
+    """
+    names = frozenset(name.strip()
+                      for value in request.params.getall(FIELDS_PARAM)
+                      for name in value.split(',')
+                      if name.strip())
+    return names or None
+
+
+def project_external_object(obj, fields, ext_names=None, excluded=(),
+                            policy_name='zapier'):
+    """
+    Externalize only the external *fields* of *obj*, along with its
+    ``Class`` and ``MimeType``, without computing any others.
+
+    The standard external fields are computed as usual, although the
+    result is not decorated, so has no ``Links``. Any other fields must be
+    attributes of an interface *obj* provides and not *excluded*.
+    *ext_names* may map the internal names of fields, or standard external
+    fields, to the external names used instead, or to None if they are
+    never returned. Unknown fields are ignored.
+    """
+    ext_names = ext_names or {}
+    internal_names = dict((ext_name, name)
+                          for name, ext_name in ext_names.items()
+                          if ext_name)
+    policy = component.getUtility(IExternalizationPolicy, name=policy_name)
+    standard = to_standard_external_dictionary(obj, decorate=False,
+                                               policy=policy)
+    spec = interface.providedBy(obj)
+    result = LocatedExternalDict()
+    for name in _TYPE_FIELDS:
+        if name in standard:
+            result[name] = standard[name]
+    for ext_name in fields:
+        name = internal_names.get(ext_name, ext_name)
+        if ext_names.get(name, name) != ext_name:
+            # Renamed or dropped
+            continue
+        if name in standard:
+            result[ext_name] = standard[name]
+        elif not name.startswith('_') \
+                and name not in excluded \
+                and spec.get(name) is not None:
+            result[ext_name] = to_external_object(getattr(obj, name, None),
+                                                  policy=policy)
+    return result
+
+
+def to_external_fields(obj, fields, name='', policy_name='zapier'):
+    """
+    Externalize only the external *fields* of *obj*, as does
+    :func:`project_external_object`, using the ``toExternalFields`` method
+    of the externalizer with the given *name*, if it has one.
+    """
+    externalizer = component.queryAdapter(obj, IInternalObjectExternalizer,
+                                          name=name)
+    to_external = getattr(externalizer, 'toExternalFields', None)
+    if to_external is not None:
+        return to_external(fields, policy_name=policy_name)
+    return project_external_object(obj, fields, policy_name=policy_name)
+
 
 @component.adapter(IWebhookSubscription)
 @interface.implementer(IInternalObjectExternalizer)
@@ -60,15 +148,45 @@ class SubscriptionExternalizer(SubscriptionExternalizer):
     }
 
     def toExternalObject(self, *args, **kwargs): # pylint:disable=signature-differs
-        result = super(SubscriptionExternalizer, self).toExternalObject(*args, **kwargs)
+        # Skip the delivery attempts, ``for_`` and ``when`` added by
+        # nti.webhooks, as we never return them
+        result = super(webhook_externalization.SubscriptionExternalizer,
+                       self).toExternalObject(*args, **kwargs)
         result.pop("OID", None)
         for name, ext_name in self.EXT_FIELD_MAP.items():
             value = result.pop(name, None)
             if value is not None and ext_name:
                 result[ext_name] = value
 
-        result["href"] = normal_resource_path(self._ext_self)
+        result["href"] = get_decoration_context().resource_path(self._ext_self)
+        window = coalescing_window(self._ext_self)
+        if window:
+            result["CoalesceWindow"] = window
+        batching = query_delivery_batching(self._ext_self)
+        if batching is not None and batching.size:
+            result["BatchSize"] = batching.size
+            result["BatchWindow"] = batching.window
+
+        return result
 
+    def toExternalFields(self, fields, policy_name='zapier'):
+        result = project_external_object(self._ext_self, fields,
+                                         ext_names=self.EXT_FIELD_MAP,
+                                         excluded=self._excluded_out_ivars_,
+                                         policy_name=policy_name)
+        if "href" in fields:
+            result["href"] = get_decoration_context().resource_path(self._ext_self)
+        if "CoalesceWindow" in fields:
+            window = coalescing_window(self._ext_self)
+            if window:
+                result["CoalesceWindow"] = window
+        if "BatchSize" in fields or "BatchWindow" in fields:
+            batching = query_delivery_batching(self._ext_self)
+            if batching is not None and batching.size:
+                if "BatchSize" in fields:
+                    result["BatchSize"] = batching.size
+                if "BatchWindow" in fields:
+                    result["BatchWindow"] = batching.window
         return result
 
 
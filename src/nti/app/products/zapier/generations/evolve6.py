@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. $Id$
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from zope import component
+
+from zope.component.hooks import site as current_site
+
+from nti.app.products.zapier.generations.evolve2 import MockDataserver
+
+from nti.app.products.zapier.interfaces import IDeliveryFailureIndex
+
+from nti.dataserver.interfaces import IDataserver
+
+from nti.site.hostpolicy import get_all_host_sites
+
+from nti.webhooks.interfaces import IWebhookSubscriptionManager
+
+generation = 6
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def process_site():
+    indexed = 0
+    utilities_in_current_site = component.getUtilitiesFor(IWebhookSubscriptionManager)
+    for _, sub_manager in utilities_in_current_site:
+        index = IDeliveryFailureIndex(sub_manager)
+        indexed += index.rebuild(sub_manager)
+    return indexed
+
+
+def do_evolve(context, generation=generation):
+    conn = context.connection
+    ds_folder = conn.root()['nti.dataserver']
+
+    mock_ds = MockDataserver()
+    mock_ds.root = ds_folder
+    component.provideUtility(mock_ds, IDataserver)
+
+    with current_site(ds_folder):
+        assert component.getSiteManager() == ds_folder.getSiteManager(), \
+            "Hooks not installed?"
+
+        sites = get_all_host_sites()
+        indexed = 0
+        for site in sites:
+            with current_site(site):
+                indexed += process_site()
+
+    component.getGlobalSiteManager().unregisterUtility(mock_ds, IDataserver)
+    logger.info('Evolution %s done. Indexed %s failed delivery attempts in %d sites',
+                generation, indexed, len(sites))
+
+
+def evolve(context):
+    """
+    Evolve to generation 6 by indexing the failed delivery attempts of
+    each subscription manager.
+    """
+    do_evolve(context, generation)
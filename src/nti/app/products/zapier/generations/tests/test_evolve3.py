@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import assert_that
+from hamcrest import contains
+from hamcrest import contains_inanyorder
+from hamcrest import has_length
+from hamcrest import is_
+
+from zope import component
+from zope import interface
+
+from zope.component.hooks import getSite
+from zope.component.hooks import site
+
+from zope.lifecycleevent import IObjectAddedEvent
+from zope.lifecycleevent import IObjectModifiedEvent
+
+from zope.securitypolicy.interfaces import IPrincipalPermissionManager
+
+from nti.app.products.zapier.generations import evolve3
+
+from nti.app.products.zapier.generations.tests import GenerationLayerTest
+
+from nti.app.products.zapier.interfaces import ISubscriptionIndex
+
+from nti.app.site.hostpolicy import create_site
+
+from nti.coremetadata.interfaces import IDataserver
+
+from nti.dataserver.tests.mock_dataserver import WithMockDSTrans
+
+from nti.webhooks.api import subscribe_to_resource
+
+import nti.dataserver.tests.mock_dataserver as mock_dataserver
+
+
+class TestEvolve3(GenerationLayerTest):
+
+    @WithMockDSTrans
+    def test_evolve3(self):
+
+        conn = mock_dataserver.current_transaction
+
+        class _Context(object):
+            pass
+        context = _Context()
+        context.connection = conn
+
+        site_one = create_site('site.one')
+        with site(site_one):
+            names = []
+            for target in ('https://b.com/', 'https://a.com/'):
+                subscription = \
+                    subscribe_to_resource(getSite().getSiteManager(),
+                                          to=str(target),
+                                          for_=interface.Interface,
+                                          when=IObjectAddedEvent,
+                                          dialect_id='zapier',
+                                          owner_id='site.one.owner',
+                                          permission_id='zope.View')
+                names.append(subscription.__name__)
+            sub_manager = subscription.__parent__
+
+            # Custom grants made before we tracked them
+            prin_perm = IPrincipalPermissionManager(subscription)
+            prin_perm.grantPermissionToPrincipal('zope.View', 'site.one.viewer')
+
+            # Simulate subscriptions created before we indexed
+            index = ISubscriptionIndex(sub_manager)
+            index.clear()
+            assert_that(index, has_length(0))
+
+        # Will need to reset the dataserver util since evolution sets its own
+        mock_ds = component.getUtility(IDataserver)
+        evolve3.do_evolve(context)
+        component.provideUtility(mock_ds, IDataserver)
+
+        with site(site_one):
+            index = ISubscriptionIndex(sub_manager)
+            assert_that(index, has_length(2))
+            targets = [sub_manager[name].to
+                       for _, name in index.sort_keys('to')]
+            assert_that(targets, contains('https://a.com/', 'https://b.com/'))
+            assert_that(list(index.custom_security_names()),
+                        contains(subscription.__name__))
+            assert_that(list(index.filter_names({'owner': 'site.one.owner'})),
+                        contains_inanyorder(*names))
+            assert_that(list(index.filter_names({'target_host': 'a.com'})),
+                        contains_inanyorder(names[1]))
+            assert_that(index.active_event_count(IObjectAddedEvent), is_(2))
+            assert_that(index.active_event_count(IObjectModifiedEvent), is_(0))
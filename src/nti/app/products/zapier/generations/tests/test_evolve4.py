@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import assert_that
+from hamcrest import contains
+from hamcrest import has_length
+from hamcrest import is_
+from hamcrest import none
+
+from zope import component
+from zope import interface
+
+from zope.annotation.interfaces import IAnnotations
+
+from zope.component.hooks import getSite
+from zope.component.hooks import site
+
+from zope.lifecycleevent import IObjectAddedEvent
+
+from nti.app.products.zapier.generations import evolve4
+
+from nti.app.products.zapier.generations.tests import GenerationLayerTest
+
+from nti.app.products.zapier.index import _DELIVERY_ATTEMPT_INDEX_KEY
+from nti.app.products.zapier.index import query_delivery_attempt_index
+
+from nti.app.site.hostpolicy import create_site
+
+from nti.coremetadata.interfaces import IDataserver
+
+from nti.dataserver.tests.mock_dataserver import WithMockDSTrans
+
+from nti.webhooks.api import subscribe_to_resource
+
+import nti.dataserver.tests.mock_dataserver as mock_dataserver
+
+
+class TestEvolve4(GenerationLayerTest):
+
+    @WithMockDSTrans
+    def test_evolve4(self):
+
+        conn = mock_dataserver.current_transaction
+
+        class _Context(object):
+            pass
+        context = _Context()
+        context.connection = conn
+
+        site_one = create_site('site.one')
+        with site(site_one):
+            subscription = \
+                subscribe_to_resource(getSite().getSiteManager(),
+                                      to=str('https://a.com/'),
+                                      for_=interface.Interface,
+                                      when=IObjectAddedEvent,
+                                      dialect_id='zapier',
+                                      owner_id='site.one.owner',
+                                      permission_id='zope.View')
+            attempts = [subscription.createDeliveryAttempt(None)
+                        for unused_i in range(3)]
+            attempts[0].message = u'Connection Timeout'
+            names = [attempt.__name__ for attempt in attempts]
+
+            # Attempts from before we indexed them
+            del IAnnotations(subscription)[_DELIVERY_ATTEMPT_INDEX_KEY]
+            assert_that(query_delivery_attempt_index(subscription), is_(none()))
+
+        # Will need to reset the dataserver util since evolution sets its own
+        mock_ds = component.getUtility(IDataserver)
+        evolve4.do_evolve(context)
+        component.provideUtility(mock_ds, IDataserver)
+
+        with site(site_one):
+            index = query_delivery_attempt_index(subscription)
+            assert_that(index, has_length(3))
+            assert_that([name for unused_value, name in index.sort_keys('createdtime')],
+                        contains(*sorted(names,
+                                         key=lambda x: (subscription[x].createdTime, x))))
+            assert_that(index.search(u'conn time'), contains(names[0]))
+            assert_that(index.search(u'refused'), has_length(0))
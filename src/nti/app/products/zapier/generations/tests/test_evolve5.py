@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, absolute_import, division
+__docformat__ = "restructuredtext en"
+
+# disable: accessing protected members, too many methods
+# pylint: disable=W0212,R0904
+
+from hamcrest import assert_that
+from hamcrest import instance_of
+from hamcrest import is_
+from hamcrest import none
+
+from zope import component
+from zope import interface
+
+from zope.component.hooks import getSite
+from zope.component.hooks import site
+
+from zope.lifecycleevent import IObjectAddedEvent
+
+from nti.app.products.zapier.attempts import CompressedDeliveryAttemptRequest
+from nti.app.products.zapier.attempts import CompressedDeliveryAttemptResponse
+from nti.app.products.zapier.attempts import attempt_payload
+
+from nti.app.products.zapier.generations import evolve5
+
+from nti.app.products.zapier.generations.tests import GenerationLayerTest
+
+from nti.app.site.hostpolicy import create_site
+
+from nti.coremetadata.interfaces import IDataserver
+
+from nti.dataserver.tests.mock_dataserver import WithMockDSTrans
+
+from nti.webhooks.api import subscribe_to_resource
+
+import nti.dataserver.tests.mock_dataserver as mock_dataserver
+
+
+class TestEvolve5(GenerationLayerTest):
+
+    @WithMockDSTrans
+    def test_evolve5(self):
+
+        conn = mock_dataserver.current_transaction
+
+        class _Context(object):
+            pass
+        context = _Context()
+        context.connection = conn
+
+        site_one = create_site('site.one')
+        with site(site_one):
+            subscription = \
+                subscribe_to_resource(getSite().getSiteManager(),
+                                      to=str('https://a.com/'),
+                                      for_=interface.Interface,
+                                      when=IObjectAddedEvent,
+                                      dialect_id='zapier',
+                                      owner_id='site.one.owner',
+                                      permission_id='zope.View')
+            payload = u'{"Data": "%s"}' % (u'x' * 1000,)
+            attempt = subscription.createDeliveryAttempt(payload)
+            attempt.request.body = payload
+            # Resolved before this generation, so without our subscribers
+            attempt.__dict__['status'] = 'successful'
+            pending = subscription.createDeliveryAttempt(payload)
+
+        # Will need to reset the dataserver util since evolution sets its own
+        mock_ds = component.getUtility(IDataserver)
+        evolve5.do_evolve(context)
+        component.provideUtility(mock_ds, IDataserver)
+
+        with site(site_one):
+            assert_that(attempt.request,
+                        instance_of(CompressedDeliveryAttemptRequest))
+            assert_that(attempt.request.body, is_(payload))
+            assert_that(attempt.response,
+                        instance_of(CompressedDeliveryAttemptResponse))
+            assert_that(attempt.payload_data, is_(none()))
+            assert_that(attempt_payload(attempt), is_(payload))
+            # Still needed to deliver
+            assert_that(pending.payload_data, is_(payload))
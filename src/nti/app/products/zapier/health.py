@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import time
+
+from bisect import bisect_left
+
+from BTrees.LOBTree import LOBTree
+
+from BTrees.OOBTree import OOTreeSet
+
+from persistent import Persistent
+
+from zope import component
+from zope import interface
+
+from zope.annotation.factory import factory as an_factory
+
+from zope.annotation.interfaces import IAnnotations
+
+from zope.container.contained import Contained
+
+from nti.app.products.zapier.interfaces import IDeliveryHealth
+from nti.app.products.zapier.interfaces import IDeliveryStats
+from nti.app.products.zapier.interfaces import ISubscriptionManagerHealth
+
+from nti.externalization.externalization.standard_fields import timestamp_to_string
+
+from nti.externalization.interfaces import LocatedExternalDict
+
+from nti.webhooks.interfaces import IWebhookSubscription
+from nti.webhooks.interfaces import IWebhookSubscriptionManager
+
+#: The upper bounds, in seconds, of the buckets of the delivery latency
+#: histogram. Latencies above the last fall in a final, unbounded, bucket.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+#: The length, in seconds, of the intervals delivery statistics may be
+#: bucketed by.
+STATS_INTERVALS = {
+    'hour': 60 * 60,
+    'day': 24 * 60 * 60,
+}
+
+#: The age, in seconds, after which hourly delivery statistics are dropped.
+MAX_STATS_AGE = 90 * 24 * 60 * 60
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def _latency(attempt):
+    elapsed = getattr(getattr(attempt, 'response', None), 'elapsed', None)
+    return elapsed.total_seconds() if elapsed is not None else None
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _merged_counts(old, committed, new):
+    size = len(LATENCY_BUCKETS) + 1
+    old, committed, new = (tuple(x or ()) + (0,) * (size - len(x or ()))
+                           for x in (old, committed, new))
+    return tuple(c + n - o for o, c, n in zip(old, committed, new))
+
+
+@component.adapter(IWebhookSubscription)
+@interface.implementer(IDeliveryHealth)
+class DeliveryHealth(Persistent, Contained):
+    """
+    Delivery statistics, updated in constant time as each attempt is
+    resolved and never recomputed from the attempts.
+
+    Delivery attempts are resolved concurrently, in their own
+    transactions, so conflicting updates are resolved by combining the
+    changes made by each. If both recorded a success, failures recorded
+    by one transaction without a success are assumed to follow the latest
+    success of the other.
+    """
+
+    successes = 0
+    failures = 0
+    consecutive_failures = 0
+    last_success = None
+    last_failure = None
+    max_latency = None
+    latency_counts = ()
+
+    def record(self, attempt):
+        when = getattr(attempt, 'lastModified', None) or time.time()
+        if attempt.succeeded():
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.last_success = _latest(self.last_success, when)
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = _latest(self.last_failure, when)
+
+        latency = _latency(attempt)
+        if latency is not None:
+            counts = list(_merged_counts((), self.latency_counts, ()))
+            counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self.latency_counts = tuple(counts)
+            self.max_latency = _latest(self.max_latency, latency)
+
+    @property
+    def attempts(self):
+        return self.successes + self.failures
+
+    @property
+    def success_rate(self):
+        attempts = self.attempts
+        return self.successes / attempts if attempts else None
+
+    def latency_percentile(self, percent):
+        counts = self.latency_counts
+        total = sum(counts)
+        if not total:
+            return None
+        threshold = total * percent / 100.0
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + (None,), counts):
+            cumulative += count
+            if cumulative >= threshold:
+                break
+        if bound is None or bound > self.max_latency:
+            return self.max_latency
+        return bound
+
+    def merge(self, other):
+        """
+        Add the statistics of *other* to ours.
+        """
+        self.successes += other.successes
+        self.failures += other.failures
+        self.consecutive_failures += other.consecutive_failures
+        self.last_success = _latest(self.last_success, other.last_success)
+        self.last_failure = _latest(self.last_failure, other.last_failure)
+        self.max_latency = _latest(self.max_latency, other.max_latency)
+        self.latency_counts = _merged_counts((), self.latency_counts,
+                                             other.latency_counts)
+
+    def _p_resolveConflict(self, old, committed, new):
+        resolved = dict(new)
+        for name in ('successes', 'failures'):
+            resolved[name] = committed.get(name, 0) + new.get(name, 0) - old.get(name, 0)
+        for name in ('last_success', 'last_failure', 'max_latency'):
+            resolved[name] = _latest(committed.get(name), new.get(name))
+        resolved['latency_counts'] = _merged_counts(old.get('latency_counts'),
+                                                    committed.get('latency_counts'),
+                                                    new.get('latency_counts'))
+
+        old_success = old.get('last_success')
+        if committed.get('last_success') == old_success \
+                and new.get('last_success') == old_success:
+            consecutive = committed.get('consecutive_failures', 0) \
+                + new.get('consecutive_failures', 0) \
+                - old.get('consecutive_failures', 0)
+        else:
+            latest, other = committed, new
+            if (new.get('last_success') or 0) > (committed.get('last_success') or 0):
+                latest, other = new, committed
+            consecutive = latest.get('consecutive_failures', 0)
+            if other.get('last_success') == old_success:
+                consecutive += other.get('failures', 0) - old.get('failures', 0)
+        resolved['consecutive_failures'] = consecutive
+        return resolved
+
+
+@component.adapter(IWebhookSubscriptionManager)
+@interface.implementer(ISubscriptionManagerHealth)
+class SubscriptionManagerHealth(DeliveryHealth):
+    """
+    The delivery statistics of all subscriptions in a subscription
+    manager, and the names of those whose latest attempt failed.
+    """
+
+    def __init__(self):
+        super(SubscriptionManagerHealth, self).__init__()
+        self.failing = OOTreeSet()
+
+    def record(self, attempt):
+        super(SubscriptionManagerHealth, self).record(attempt)
+        name = attempt.__parent__.__name__
+        if attempt.succeeded():
+            self.discard(name)
+        else:
+            self.failing.add(name)
+
+    def discard(self, name):
+        if name in self.failing:
+            self.failing.remove(name)
+
+
+class DeliveryBucket(DeliveryHealth):
+    """
+    The delivery statistics of the attempts resolved in one hour.
+    """
+
+
+@component.adapter(IWebhookSubscription)
+@interface.implementer(IDeliveryStats)
+class DeliveryStats(Persistent, Contained):
+    """
+    Delivery statistics by the hour, each a :class:`DeliveryBucket`
+    updated as attempts are resolved. Longer intervals are the sum of
+    their hours. Stored for subscriptions and subscription managers.
+    """
+
+    def __init__(self):
+        self._hours = LOBTree()
+
+    def record(self, attempt):
+        when = getattr(attempt, 'lastModified', None) or time.time()
+        hour = int(when // STATS_INTERVALS['hour']) * STATS_INTERVALS['hour']
+        bucket = self._hours.get(hour)
+        if bucket is None:
+            bucket = self._hours[hour] = DeliveryBucket()
+            self._prune(hour - MAX_STATS_AGE)
+        bucket.record(attempt)
+
+    def _prune(self, before):
+        for hour in list(self._hours.keys(max=before, excludemax=True)):
+            del self._hours[hour]
+
+    def buckets(self, interval='hour', since=None, until=None):
+        length = STATS_INTERVALS[interval]
+        kwargs = {}
+        if since is not None:
+            kwargs['min'] = int(since // length) * length
+        if until is not None:
+            kwargs.update(max=int(math.ceil(until)), excludemax=True)
+        start = merged = None
+        for hour, bucket in self._hours.items(**kwargs):
+            hour_start = hour // length * length
+            if hour_start != start:
+                if merged is not None:
+                    yield start, merged
+                start, merged = hour_start, DeliveryBucket()
+            merged.merge(bucket)
+        if merged is not None:
+            yield start, merged
+
+
+def merged_buckets(all_stats, interval='hour', since=None, until=None):
+    """
+    Return the sorted ``(start, bucket)`` pairs summing the buckets of
+    each of the :class:`IDeliveryStats` in *all_stats*.
+    """
+    totals = {}
+    for stats in all_stats:
+        for start, bucket in stats.buckets(interval, since, until):
+            totals.setdefault(start, DeliveryBucket()).merge(bucket)
+    return sorted(totals.items())
+
+
+_SUBSCRIPTION_HEALTH_KEY = 'nti.app.products.zapier.health.DeliveryHealth'
+
+_SubscriptionHealthFactory = an_factory(DeliveryHealth,
+                                        _SUBSCRIPTION_HEALTH_KEY)
+
+_MANAGER_HEALTH_KEY = 'nti.app.products.zapier.health.SubscriptionManagerHealth'
+
+_SubscriptionManagerHealthFactory = an_factory(SubscriptionManagerHealth,
+                                               _MANAGER_HEALTH_KEY)
+
+
+_SUBSCRIPTION_STATS_KEY = 'nti.app.products.zapier.health.DeliveryStats'
+
+_SubscriptionDeliveryStatsFactory = an_factory(DeliveryStats,
+                                               _SUBSCRIPTION_STATS_KEY)
+
+_MANAGER_STATS_KEY = 'nti.app.products.zapier.health.ManagerDeliveryStats'
+
+# Registered for IWebhookSubscriptionManager
+_ManagerDeliveryStatsFactory = an_factory(DeliveryStats,
+                                          _MANAGER_STATS_KEY)
+
+
+def _query_annotation(context, key):
+    annotations = IAnnotations(context, None)
+    return annotations.get(key) if annotations is not None else None
+
+
+def query_subscription_health(subscription):
+    """
+    The :class:`IDeliveryHealth` of the subscription, or None if no
+    attempts have been recorded. Unlike adapting, this never stores new
+    statistics.
+    """
+    return _query_annotation(subscription, _SUBSCRIPTION_HEALTH_KEY)
+
+
+def query_manager_health(sub_manager):
+    """
+    The :class:`ISubscriptionManagerHealth` of the subscription manager, or
+    None if no attempts have been recorded.
+    """
+    return _query_annotation(sub_manager, _MANAGER_HEALTH_KEY)
+
+
+def query_delivery_stats(context):
+    """
+    The :class:`IDeliveryStats` of the subscription or subscription
+    manager, or None if no attempts have been recorded.
+    """
+    key = _MANAGER_STATS_KEY if IWebhookSubscriptionManager.providedBy(context) \
+        else _SUBSCRIPTION_STATS_KEY
+    return _query_annotation(context, key)
+
+
+def stats_summary(start, bucket):
+    """
+    An external summary of the bucket of delivery statistics beginning at
+    the timestamp *start*.
+    """
+    result = LocatedExternalDict()
+    result['Start'] = timestamp_to_string(start)
+    result['Attempts'] = bucket.attempts
+    result['Successes'] = bucket.successes
+    result['Failures'] = bucket.failures
+    result['SuccessRate'] = bucket.success_rate
+    result['LatencyP50'] = bucket.latency_percentile(50)
+    result['LatencyP95'] = bucket.latency_percentile(95)
+    return result
+
+
+def health_summary(health):
+    """
+    An external summary of the given :class:`IDeliveryHealth`.
+    """
+    def _time(value):
+        return timestamp_to_string(value) if value is not None else None
+
+    result = LocatedExternalDict()
+    result['Attempts'] = health.attempts
+    result['Successes'] = health.successes
+    result['Failures'] = health.failures
+    result['SuccessRate'] = health.success_rate
+    result['ConsecutiveFailures'] = health.consecutive_failures
+    result['LastSuccess'] = _time(health.last_success)
+    result['LastFailure'] = _time(health.last_failure)
+    result['LatencyP50'] = health.latency_percentile(50)
+    result['LatencyP95'] = health.latency_percentile(95)
+    return result
@@ -0,0 +1,815 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+import json
+import heapq
+import base64
+import numbers
+
+from binascii import hexlify
+
+from BTrees.Length import Length
+
+from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
+from BTrees.OOBTree import intersection
+
+import six
+
+from six.moves.urllib_parse import urlparse
+
+from persistent import Persistent
+
+from zope import component
+from zope import interface
+
+from zope.interface import providedBy
+
+from zope.annotation.factory import factory as an_factory
+
+from zope.annotation.interfaces import IAnnotations
+
+from zope.container.contained import Contained
+
+from nti.app.products.zapier.interfaces import IChangeCounter
+from nti.app.products.zapier.interfaces import IDeliveryAttemptIndex
+from nti.app.products.zapier.interfaces import IDeliveryFailureIndex
+from nti.app.products.zapier.interfaces import ISubscriptionIndex
+
+from nti.base._compat import text_
+
+from nti.webhooks.interfaces import IWebhookSubscription
+from nti.webhooks.interfaces import IWebhookSubscriptionManager
+
+#: The subscription attributes for which sort indexes are maintained.
+SORT_ATTRIBUTES = ('owner_id',
+                   'to',
+                   'active',
+                   'status_message',
+                   'createdTime')
+
+#: The filters for which set indexes are maintained.
+FILTER_NAMES = ('active',
+                'owner',
+                'target_host',
+                'trigger')
+
+#: The delivery attempt attributes for which sort indexes are maintained,
+#: by the (lower case) name they are sorted on.
+ATTEMPT_SORT_ATTRIBUTES = (('createdtime', 'createdTime'),
+                           ('status', 'status'))
+
+# The positions of the active and trigger filter values among the
+# values indexed for a subscription.
+_ACTIVE_POS = len(SORT_ATTRIBUTES) + FILTER_NAMES.index('active')
+_TRIGGER_POS = len(SORT_ATTRIBUTES) + FILTER_NAMES.index('trigger')
+
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+_marker = object()
+
+logger = __import__('logging').getLogger(__name__)
+
+
+def manager_token(sub_manager):
+    """
+    A string identifying the (persistent) subscription manager, for
+    ordering and later retrieving managers across connections.
+    """
+    oid = getattr(sub_manager, '_p_oid', None)
+    return text_(hexlify(oid)) if oid else u''
+
+
+def _sort_value(value):
+    # Normalize so values of a given attribute are always mutually
+    # comparable and safe to persist as BTree keys.
+    if value is None:
+        return u''
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, numbers.Number):
+        return value
+    return text_(value)
+
+
+def target_host(url):
+    """
+    The (lower case) host name of the URL, or an empty string.
+    """
+    try:
+        host = urlparse(url or '').hostname
+    except ValueError:
+        host = None
+    return text_(host.lower()) if host else u''
+
+
+def trigger_key(for_, when):
+    """
+    The filter value for subscriptions to *when* events for *for_* objects.
+    """
+    return tuple(text_(getattr(x, '__identifier__', None) or x or u'')
+                 for x in (for_, when))
+
+
+def _trigger_values(obj):
+    # What a subscription's for_ or when may be, as normalized by
+    # trigger_key, for obj to match: an interface it provides or, as
+    # allowed for adapter registrations, one of its classes.
+    values = set(text_(getattr(spec, '__identifier__', None) or spec)
+                 for spec in providedBy(obj).__sro__)
+    values.update(text_(cls) for cls in type(obj).__mro__)
+    return values
+
+
+def _filter_values(subscription):
+    return (int(bool(getattr(subscription, 'active', False))),
+            _sort_value(getattr(subscription, 'owner_id', None)),
+            target_host(getattr(subscription, 'to', None)),
+            trigger_key(getattr(subscription, 'for_', None),
+                        getattr(subscription, 'when', None)))
+
+
+def _active_event(values):
+    # The (normalized) ``when`` of an active subscription with the given
+    # indexed values, or None.
+    if values is None or not values[_ACTIVE_POS]:
+        return None
+    return values[_TRIGGER_POS][1]
+
+
+def _discard(tree_set, key):
+    try:
+        tree_set.remove(key)
+    except KeyError:
+        pass
+
+
+def _predecessor(tree, key):
+    """
+    The largest key of *tree* less than the tuple *key*, or None.
+    """
+    last = key[-1]
+    if not isinstance(last, six.text_type):
+        # Walks the buckets before the key
+        keys = tree.keys(max=key, excludemax=True)
+        return keys[-1] if len(keys) else None
+    if last:
+        # Any key between this bound and ours begins with it, so there
+        # are few of them (usually none); otherwise the largest key at or
+        # below the bound precedes ours.
+        below = last[:-1] if last[-1] == u'\x00' \
+            else last[:-1] + six.unichr(ord(last[-1]) - 1)
+        bound = key[:-1] + (below,)
+        window = tree.keys(min=bound, max=key, excludemax=True)
+        try:
+            return window[-1]
+        except IndexError:
+            pass
+    else:
+        # Sorts before every key beginning as ours does
+        bound = key[:-1]
+    try:
+        return tree.maxKey(bound)
+    except ValueError:
+        return None
+
+
+def _reversed_keys(tree, min=None, max=None,  # pylint: disable=redefined-builtin
+                   excludemin=False, excludemax=False):
+    try:
+        key = tree.maxKey() if max is None else tree.maxKey(max)
+    except ValueError:
+        return
+    if excludemax and key == max:
+        key = _predecessor(tree, key)
+    while key is not None:
+        if min is not None and (key < min or (excludemin and key == min)):
+            return
+        yield key
+        key = _predecessor(tree, key)
+
+
+def iter_keys(tree, reverse=False, after=None, **kwargs):
+    """
+    Iterate the keys of the BTree or TreeSet *tree*, optionally in reverse.
+    If *after* is given, iteration starts with the first key following it
+    in that order. Any other keyword arguments (e.g. ``min`` and ``max``)
+    are passed to ``keys``.
+
+    In reverse, keys must be tuples. As BTrees only iterate forwards, each
+    key is found from the one following it with ``maxKey`` and a window
+    of the keys just below it, which is efficient when the last element
+    of the keys is text (e.g. a name).
+    """
+    if after is not None:
+        if reverse:
+            kwargs.update(max=after, excludemax=True)
+        else:
+            kwargs.update(min=after, excludemin=True)
+    if not reverse:
+        return iter(tree.keys(**kwargs))
+    return _reversed_keys(tree, **kwargs)
+
+
+def encode_cursor(sort_on, reverse, key):
+    """
+    Return an opaque, URL safe token for the position of the sort *key*
+    (a ``(value, name)`` pair, possibly followed by further tie breakers)
+    when ordering on *sort_on*.
+    """
+    state = [sort_on, bool(reverse)] + list(key)
+    state = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return text_(base64.urlsafe_b64encode(state).rstrip(b'='))
+
+
+def decode_cursor(cursor, sort_on, reverse):
+    """
+    Return the sort key encoded in *cursor* by :func:`encode_cursor`.
+
+    :raises ValueError: If the cursor is malformed or was created for a
+        different ordering.
+    """
+    try:
+        cursor = cursor.encode('ascii')
+        cursor += b'=' * (-len(cursor) % 4)
+        state = json.loads(text_(base64.urlsafe_b64decode(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(state, list) \
+            or len(state) < 4 \
+            or state[:2] != [sort_on, bool(reverse)]:
+        raise ValueError('Invalid cursor')
+    return tuple(state[2:])
+
+
+class _Reversed(object):
+    """
+    Inverts the ordering of the wrapped key.
+    """
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def merge_sorted(iterables, key=None, reverse=False):
+    """
+    Lazily merge the already sorted *iterables* into a single sorted
+    iteration. Items comparing equal are produced in the order of the
+    iterables they came from.
+    """
+    key = key if key is not None else (lambda x: x)
+    wrap = _Reversed if reverse else (lambda x: x)
+    heap = []
+    for order, iterable in enumerate(iterables):
+        it = iter(iterable)
+        item = next(it, _marker)
+        if item is not _marker:
+            heap.append((wrap(key(item)), order, item, it))
+    heapq.heapify(heap)
+    while heap:
+        _, order, item, it = heap[0]
+        yield item
+        item = next(it, _marker)
+        if item is _marker:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (wrap(key(item)), order, item, it))
+
+
+@component.adapter(IWebhookSubscriptionManager)
+@interface.implementer(ISubscriptionIndex)
+class SubscriptionIndex(Persistent, Contained):
+    """
+    Sort indexes for the subscriptions of a subscription manager, stored
+    as an annotation of the manager and kept current by subscribers.
+
+    For each attribute in :data:`SORT_ATTRIBUTES` we keep a tree set of
+    ``(value, name)`` pairs, so ties are broken by name just as iterating
+    the manager and sorting did. For each filter in :data:`FILTER_NAMES`
+    we keep the set of names having each value. We also keep the indexed
+    values for each name, so entries can be replaced when a subscription
+    changes. Lastly we count the active subscriptions to each type of
+    event, so we can tell cheaply whether any are listening.
+    """
+
+    # Created on first change for indexes predating it
+    _changes = None
+
+    # Created when rebuilt for indexes predating it
+    _active_events = None
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._values = OOBTree()
+        self._sorted = OOBTree()
+        for attr in SORT_ATTRIBUTES:
+            self._sorted[attr] = OOTreeSet()
+        self._filters = OOBTree()
+        for filter_name in FILTER_NAMES:
+            self._filters[filter_name] = OOBTree()
+        self._custom_security = OOTreeSet()
+        self._active_events = OOBTree()
+        self._length = Length()
+        # Never reset, so no count is reused for different contents
+        self._changed()
+
+    def _changed(self):
+        if self._changes is None:
+            self._changes = Length()
+        self._changes.change(1)
+
+    @property
+    def change_count(self):
+        return self._changes() if self._changes is not None else 0
+
+    def __len__(self):
+        return self._length()
+
+    def __contains__(self, name):
+        return name in self._values
+
+    @staticmethod
+    def _extract(subscription):
+        # The sort values, followed by the filter values
+        return tuple(_sort_value(getattr(subscription, attr, None))
+                     for attr in SORT_ATTRIBUTES) + _filter_values(subscription)
+
+    def _count_active_event(self, when, delta):
+        if when is None or self._active_events is None:
+            return
+        # Counters are kept when they drop to zero, so subscribing and
+        # unsubscribing only ever conflict on (resolvable) Length changes.
+        count = self._active_events.get(when)
+        if count is None:
+            count = self._active_events[when] = Length()
+        count.change(delta)
+
+    def _filter_insert(self, filter_name, value, name):
+        names = self._filters[filter_name].get(value)
+        if names is None:
+            names = self._filters[filter_name][value] = OOTreeSet()
+        names.insert(name)
+
+    def _filter_discard(self, filter_name, value, name):
+        names = self._filters[filter_name].get(value)
+        if names is not None:
+            _discard(names, name)
+            if not names:
+                del self._filters[filter_name][value]
+
+    def index(self, subscription):
+        name = subscription.__name__
+        new_values = self._extract(subscription)
+        old_values = self._values.get(name)
+        if old_values == new_values:
+            return False
+        for pos, attr in enumerate(SORT_ATTRIBUTES):
+            keys = self._sorted[attr]
+            if old_values is not None:
+                if old_values[pos] == new_values[pos]:
+                    continue
+                _discard(keys, (old_values[pos], name))
+            keys.insert((new_values[pos], name))
+        for pos, filter_name in enumerate(FILTER_NAMES, len(SORT_ATTRIBUTES)):
+            if old_values is not None:
+                if old_values[pos] == new_values[pos]:
+                    continue
+                self._filter_discard(filter_name, old_values[pos], name)
+            self._filter_insert(filter_name, new_values[pos], name)
+        old_event = _active_event(old_values)
+        new_event = _active_event(new_values)
+        if old_event != new_event:
+            self._count_active_event(old_event, -1)
+            self._count_active_event(new_event, 1)
+        self._values[name] = new_values
+        if old_values is None:
+            self._length.change(1)
+        self._changed()
+        return True
+
+    def unindex(self, name):
+        old_values = self._values.pop(name, None)
+        if old_values is None:
+            return False
+        for pos, attr in enumerate(SORT_ATTRIBUTES):
+            _discard(self._sorted[attr], (old_values[pos], name))
+        for pos, filter_name in enumerate(FILTER_NAMES, len(SORT_ATTRIBUTES)):
+            self._filter_discard(filter_name, old_values[pos], name)
+        self._count_active_event(_active_event(old_values), -1)
+        _discard(self._custom_security, name)
+        self._length.change(-1)
+        self._changed()
+        return True
+
+    def sort_keys(self, sort_on, reverse=False, after=None):
+        return iter_keys(self._sorted[sort_on], reverse=reverse, after=after)
+
+    def sort_key(self, name, sort_on):
+        return self._values[name][SORT_ATTRIBUTES.index(sort_on)], name
+
+    def filter_names(self, query):
+        result = None
+        for filter_name, value in query.items():
+            names = self._filters[filter_name].get(value)
+            if not names:
+                return OOTreeSet()
+            result = names if result is None else intersection(result, names)
+        return result
+
+    def owned_by(self, owner_id):
+        owner_id = _sort_value(owner_id)
+        for value, name in self._sorted['owner_id'].keys(min=(owner_id, u'')):
+            if value != owner_id:
+                break
+            yield name
+
+    def triggered_names(self, data, event):
+        active = self._filters['active'].get(1)
+        if not active:
+            return
+        for_values = when_values = None
+        # There are only as many triggers as pairs of interfaces subscribed
+        # to, however many subscriptions there are.
+        for (for_, when), names in self._filters['trigger'].items():
+            if for_values is None:
+                for_values = _trigger_values(data)
+                when_values = _trigger_values(event)
+            if for_ in for_values and when in when_values:
+                for name in names:
+                    if name in active:
+                        yield name
+
+    def active_event_count(self, event_type):
+        if self._active_events is None:
+            return None
+        result = 0
+        for spec in event_type.__sro__:
+            identifier = getattr(spec, '__identifier__', None)
+            count = self._active_events.get(text_(identifier)) if identifier else None
+            if count is not None:
+                result += count()
+        return result
+
+    def mark_custom_security(self, name, custom=True):
+        if custom:
+            changed = self._custom_security.insert(name)
+        else:
+            changed = name in self._custom_security
+            _discard(self._custom_security, name)
+        if changed:
+            self._changed()
+
+    def custom_security_names(self):
+        return iter(self._custom_security)
+
+    def rebuild(self, manager, default_security=None):
+        """
+        Discard all entries and index every subscription in *manager*. If
+        given, *default_security* is called with each subscription to
+        determine whether its security grants are the defaults.
+        """
+        self.clear()
+        for subscription in manager.values():
+            self.index(subscription)
+            if default_security is not None \
+                    and not default_security(subscription):
+                self.mark_custom_security(subscription.__name__)
+        return len(self)
+
+
+# The default key of the annotation factory, kept for existing indexes
+_SUBSCRIPTION_INDEX_KEY = 'nti.app.products.zapier.index.SubscriptionIndex'
+
+_SubscriptionIndexFactory = an_factory(SubscriptionIndex, _SUBSCRIPTION_INDEX_KEY)
+
+
+def get_subscription_index(manager):
+    return ISubscriptionIndex(manager, None)
+
+
+def query_subscription_index(manager):
+    """
+    The :class:`ISubscriptionIndex` of the manager, or None if it has not
+    been created. Unlike adapting, this never stores a new index.
+    """
+    annotations = IAnnotations(manager, None)
+    return annotations.get(_SUBSCRIPTION_INDEX_KEY) if annotations is not None else None
+
+
+@component.adapter(IWebhookSubscription)
+@interface.implementer(IChangeCounter)
+class ChangeCounter(Persistent, Contained):
+    """
+    A conflict resolving :class:`IChangeCounter`, stored as an annotation.
+    """
+
+    def __init__(self):
+        self._count = Length()
+
+    def changed(self):
+        self._count.change(1)
+
+    def __call__(self):
+        return self._count()
+
+
+_DELIVERY_CHANGES_KEY = 'nti.app.products.zapier.index.DeliveryAttemptChanges'
+
+_DeliveryAttemptChangeCounterFactory = an_factory(ChangeCounter,
+                                                  _DELIVERY_CHANGES_KEY)
+
+
+def get_delivery_change_count(subscription):
+    """
+    The count of changes to the delivery attempts of the subscription, or
+    None if no changes have been counted. Unlike adapting to
+    :class:`IChangeCounter`, this never stores a new counter.
+    """
+    annotations = IAnnotations(subscription, None)
+    counter = annotations.get(_DELIVERY_CHANGES_KEY) if annotations is not None else None
+    return counter() if counter is not None else None
+
+
+def message_terms(text):
+    """
+    The distinct (lower case) words of *text*, as indexed for searching
+    delivery attempt messages.
+    """
+    return frozenset(_WORD_PATTERN.findall(text.lower())) if text else frozenset()
+
+
+def message_matches(message, terms):
+    """
+    Whether, for each of *terms*, *message* has a word beginning with it.
+    """
+    words = message_terms(message)
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+@component.adapter(IWebhookSubscription)
+@interface.implementer(IDeliveryAttemptIndex)
+class DeliveryAttemptIndex(Persistent, Contained):
+    """
+    Sort and message indexes for the delivery attempts of a subscription,
+    stored as an annotation of the subscription and kept current by
+    subscribers.
+
+    As with :class:`SubscriptionIndex`, for each attribute in
+    :data:`ATTEMPT_SORT_ATTRIBUTES` we keep a tree set of ``(value, name)``
+    pairs. We also keep the names of the attempts having each word of
+    their messages, and the indexed values (and words) for each name.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._values = OOBTree()
+        self._sorted = OOBTree()
+        for sort_on, unused_attr in ATTEMPT_SORT_ATTRIBUTES:
+            self._sorted[sort_on] = OOTreeSet()
+        self._words = OOBTree()
+        self._length = Length()
+
+    def __len__(self):
+        return self._length()
+
+    def __contains__(self, name):
+        return name in self._values
+
+    @staticmethod
+    def _extract(attempt):
+        # The sort values, followed by the message words
+        return tuple(_sort_value(getattr(attempt, attr, None))
+                     for unused_sort_on, attr in ATTEMPT_SORT_ATTRIBUTES) \
+            + (tuple(sorted(message_terms(getattr(attempt, 'message', None)))),)
+
+    def _word_insert(self, word, name):
+        names = self._words.get(word)
+        if names is None:
+            names = self._words[word] = OOTreeSet()
+        names.insert(name)
+
+    def _word_discard(self, word, name):
+        names = self._words.get(word)
+        if names is not None:
+            _discard(names, name)
+            if not names:
+                del self._words[word]
+
+    def index(self, attempt):
+        name = attempt.__name__
+        new_values = self._extract(attempt)
+        old_values = self._values.get(name)
+        if old_values == new_values:
+            return False
+        for pos, (sort_on, unused_attr) in enumerate(ATTEMPT_SORT_ATTRIBUTES):
+            keys = self._sorted[sort_on]
+            if old_values is not None:
+                if old_values[pos] == new_values[pos]:
+                    continue
+                _discard(keys, (old_values[pos], name))
+            keys.insert((new_values[pos], name))
+        old_words = set(old_values[-1]) if old_values is not None else set()
+        new_words = set(new_values[-1])
+        for word in old_words - new_words:
+            self._word_discard(word, name)
+        for word in new_words - old_words:
+            self._word_insert(word, name)
+        self._values[name] = new_values
+        if old_values is None:
+            self._length.change(1)
+        return True
+
+    def unindex(self, name):
+        old_values = self._values.pop(name, None)
+        if old_values is None:
+            return False
+        for pos, (sort_on, unused_attr) in enumerate(ATTEMPT_SORT_ATTRIBUTES):
+            _discard(self._sorted[sort_on], (old_values[pos], name))
+        for word in old_values[-1]:
+            self._word_discard(word, name)
+        self._length.change(-1)
+        return True
+
+    def sort_keys(self, sort_on, reverse=False, after=None):
+        return iter_keys(self._sorted[sort_on], reverse=reverse, after=after)
+
+    def sort_key(self, name, sort_on):
+        pos = [x for x, unused_attr in ATTEMPT_SORT_ATTRIBUTES].index(sort_on)
+        return self._values[name][pos], name
+
+    def created_between(self, since=None, until=None):
+        kwargs = {}
+        if since is not None:
+            kwargs['min'] = (since,)
+        if until is not None:
+            # Sorts before every key with this time
+            kwargs['max'] = (until,)
+        return set(name for unused_time, name
+                   in self._sorted['createdtime'].keys(**kwargs))
+
+    def _prefixed(self, term):
+        result = set()
+        for word in self._words.keys(min=term):
+            if not word.startswith(term):
+                break
+            result.update(self._words[word])
+        return result
+
+    def search(self, text):
+        result = None
+        for term in message_terms(text):
+            names = self._prefixed(term)
+            result = names if result is None else result & names
+            if not result:
+                break
+        return result or set()
+
+    def rebuild(self, subscription):
+        """
+        Discard all entries and index every delivery attempt of
+        *subscription*.
+        """
+        self.clear()
+        for attempt in subscription.values():
+            self.index(attempt)
+        return len(self)
+
+
+_DELIVERY_ATTEMPT_INDEX_KEY = 'nti.app.products.zapier.index.DeliveryAttemptIndex'
+
+_DeliveryAttemptIndexFactory = an_factory(DeliveryAttemptIndex,
+                                          _DELIVERY_ATTEMPT_INDEX_KEY)
+
+
+def query_delivery_attempt_index(subscription):
+    """
+    The :class:`IDeliveryAttemptIndex` of the subscription, or None if it
+    has not been created. Unlike adapting, this never stores a new index.
+    """
+    annotations = IAnnotations(subscription, None)
+    return annotations.get(_DELIVERY_ATTEMPT_INDEX_KEY) if annotations is not None else None
+
+
+@component.adapter(IWebhookSubscriptionManager)
+@interface.implementer(IDeliveryFailureIndex)
+class DeliveryFailureIndex(Persistent, Contained):
+    """
+    The failed delivery attempts of the subscriptions of a subscription
+    manager, stored as an annotation of the manager and kept current by
+    subscribers.
+
+    We keep a tree set of ``(created, subscription_name, name)`` keys, and,
+    for each subscription, the creation time of each of its indexed
+    attempts, so they can be removed along with it.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._sorted = OOTreeSet()
+        self._subscriptions = OOBTree()
+        self._length = Length()
+
+    def __len__(self):
+        return self._length()
+
+    def index(self, attempt):
+        subscription_name = attempt.__parent__.__name__
+        name = attempt.__name__
+        attempts = self._subscriptions.get(subscription_name)
+        if attempts is None:
+            attempts = self._subscriptions[subscription_name] = OOBTree()
+        if name in attempts:
+            return False
+        created = _sort_value(attempt.createdTime)
+        attempts[name] = created
+        self._sorted.insert((created, subscription_name, name))
+        self._length.change(1)
+        return True
+
+    def unindex(self, subscription_name, name):
+        attempts = self._subscriptions.get(subscription_name)
+        created = attempts.pop(name, _marker) if attempts is not None else _marker
+        if created is _marker:
+            return False
+        _discard(self._sorted, (created, subscription_name, name))
+        if not attempts:
+            del self._subscriptions[subscription_name]
+        self._length.change(-1)
+        return True
+
+    def unindex_subscription(self, subscription_name):
+        attempts = self._subscriptions.pop(subscription_name, None)
+        if not attempts:
+            return 0
+        for name, created in attempts.items():
+            _discard(self._sorted, (created, subscription_name, name))
+        count = len(attempts)
+        self._length.change(-count)
+        return count
+
+    def failure_keys(self, reverse=False, after=None, since=None, until=None):
+        kwargs = {}
+        if since is not None:
+            kwargs['min'] = (since,)
+        if until is not None:
+            # Sorts before every key with this time
+            kwargs['max'] = (until,)
+        if after is not None:
+            after = tuple(after)
+            # The window may be narrower than what follows the key
+            bound = kwargs.get('max' if reverse else 'min')
+            if bound is not None \
+                    and (after >= bound if reverse else after < bound):
+                after = None
+        return iter_keys(self._sorted, reverse=reverse, after=after, **kwargs)
+
+    def subscription_count(self, subscription_name):
+        attempts = self._subscriptions.get(subscription_name)
+        return len(attempts) if attempts is not None else 0
+
+    def rebuild(self, manager):
+        """
+        Discard all entries and index every failed delivery attempt of the
+        subscriptions in *manager*.
+        """
+        self.clear()
+        for subscription in manager.values():
+            for attempt in subscription.values():
+                if attempt.failed():
+                    self.index(attempt)
+        return len(self)
+
+
+_DELIVERY_FAILURE_INDEX_KEY = 'nti.app.products.zapier.index.DeliveryFailureIndex'
+
+_DeliveryFailureIndexFactory = an_factory(DeliveryFailureIndex,
+                                          _DELIVERY_FAILURE_INDEX_KEY)
+
+
+def query_delivery_failure_index(sub_manager):
+    """
+    The :class:`IDeliveryFailureIndex` of the subscription manager, or None
+    if it has not been created. Unlike adapting, this never stores a new
+    index.
+    """
+    annotations = IAnnotations(sub_manager, None)
+    return annotations.get(_DELIVERY_FAILURE_INDEX_KEY) if annotations is not None else None
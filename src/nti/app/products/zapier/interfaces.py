@@ -9,6 +9,7 @@ from zope import interface
 
 from zope.interface import Attribute
 
+from zope.schema import Int
 from zope.schema import TextLine
 from zope.schema import vocabulary
 
@@ -72,6 +73,27 @@ class ISubscriptionRequest(ICreated):
     target = HTTPURL(title=u"Target Url",
                      required=True)
 
+    coalesce_window = Int(title=u"Coalescing window",
+                          description=u"For event types that support it, the "
+                                      u"number of seconds over which deliveries "
+                                      u"for the same object are coalesced into "
+                                      u"one.",
+                          min=1,
+                          required=False)
+
+    batch_size = Int(title=u"Batch size",
+                     description=u"The most deliveries sent together, as one "
+                                 u"array, when deliveries are batched.",
+                     min=1,
+                     required=False)
+
+    batch_window = Int(title=u"Batch window",
+                       description=u"The most seconds a delivery is held for "
+                                   u"its batch to fill, when deliveries are "
+                                   u"batched.",
+                       min=1,
+                       required=False)
+
 
 class IExternalEvent(interface.Interface):
 
@@ -116,3 +138,492 @@ class IZapierWorkspace(IWorkspace):
     """
     A workspace for Zapier info and links.
     """
+
+
+class ISubscriptionIndex(interface.Interface):
+    """
+    Indexes maintained for the subscriptions held by an
+    :class:`nti.webhooks.interfaces.IWebhookSubscriptionManager`, allowing
+    subscriptions to be listed in sorted order without loading them.
+    """
+
+    def index(subscription):
+        """
+        Add or update the index entries for the given subscription.
+
+        :return: True if the index changed.
+        """
+
+    def unindex(name):
+        """
+        Remove the index entries for the subscription with the given name.
+
+        :return: True if the index changed.
+        """
+
+    def sort_keys(sort_on, reverse=False, after=None):
+        """
+        Iterate ``(value, name)`` pairs for all indexed subscriptions, ordered
+        by the value of the given subscription attribute.
+
+        If *after* is given, it is a ``(value, name)`` pair and iteration
+        resumes with the first pair following it in the requested order.
+        """
+
+    def sort_key(name, sort_on):
+        """
+        The ``(value, name)`` sort key of the subscription with the given
+        name when ordering on the given subscription attribute.
+        """
+
+    def filter_names(query):
+        """
+        Return the set of names of the indexed subscriptions matching all
+        of the filters in *query*, a mapping of filter names to (normalized)
+        values. The query must not be empty.
+        """
+
+    def owned_by(owner_id):
+        """
+        Iterate the names of the indexed subscriptions with the given owner.
+        """
+
+    def triggered_names(data, event):
+        """
+        Iterate the names of the indexed, active subscriptions whose ``for_``
+        is provided by *data* and whose ``when`` is provided by *event*,
+        those that may be delivered for the event.
+        """
+
+    def active_event_count(event_type):
+        """
+        The number of indexed, active subscriptions whose ``when`` is
+        *event_type* (an interface or specification) or one of its bases,
+        those events of that type may be delivered to. None if the index
+        predates counting them.
+        """
+
+    def mark_custom_security(name, custom=True):
+        """
+        Record whether the security grants of the subscription with the
+        given name differ from those applied when subscriptions are added.
+        """
+
+    def custom_security_names():
+        """
+        Iterate the names of the indexed subscriptions marked as having
+        custom security grants.
+        """
+
+    def __len__():
+        """
+        The number of indexed subscriptions.
+        """
+
+    change_count = interface.Attribute(
+        "A count of the changes made to the index, usable as a change "
+        "token for listings of the subscriptions")
+
+
+class IChangeCounter(interface.Interface):
+    """
+    A count of changes made to the content of some object, usable as a
+    change token. For subscriptions, this counts changes to their delivery
+    attempts.
+    """
+
+    def changed():
+        """
+        Note a change.
+        """
+
+    def __call__():
+        """
+        The current count.
+        """
+
+
+class IDeliveryAttemptIndex(interface.Interface):
+    """
+    Sort and message indexes for the delivery attempts of an
+    :class:`nti.webhooks.interfaces.IWebhookSubscription`, allowing a page
+    of its delivery history to be listed, or searched, without loading the
+    others.
+    """
+
+    def index(attempt):
+        """
+        Add or update the index entries for the given delivery attempt.
+
+        :return: True if the index changed.
+        """
+
+    def unindex(name):
+        """
+        Remove the index entries for the delivery attempt with the given
+        name.
+
+        :return: True if the index changed.
+        """
+
+    def sort_keys(sort_on, reverse=False, after=None):
+        """
+        Iterate ``(value, name)`` pairs for all indexed delivery attempts,
+        ordered on ``createdtime`` or ``status``.
+
+        If *after* is given, it is a ``(value, name)`` pair and iteration
+        resumes with the first pair following it in the requested order.
+        """
+
+    def sort_key(name, sort_on):
+        """
+        The ``(value, name)`` sort key of the delivery attempt with the
+        given name when ordering on ``createdtime`` or ``status``.
+        """
+
+    def created_between(since=None, until=None):
+        """
+        Return the set of names of the indexed delivery attempts created
+        at or after the timestamp *since* and before the timestamp *until*,
+        either of which may be None.
+        """
+
+    def search(text):
+        """
+        Return the set of names of the indexed delivery attempts whose
+        messages have, for each word of *text*, a word beginning with it
+        (ignoring case).
+        """
+
+    def __len__():
+        """
+        The number of indexed delivery attempts.
+        """
+
+
+class IDeliveryFailureIndex(interface.Interface):
+    """
+    The failed delivery attempts of all subscriptions of an
+    :class:`nti.webhooks.interfaces.IWebhookSubscriptionManager`, ordered
+    by the time they were created, allowing a page of them to be listed
+    without visiting the subscriptions.
+    """
+
+    def index(attempt):
+        """
+        Add the given failed delivery attempt.
+
+        :return: True if the index changed.
+        """
+
+    def unindex(subscription_name, name):
+        """
+        Remove the named delivery attempt of the named subscription.
+
+        :return: True if the index changed.
+        """
+
+    def unindex_subscription(subscription_name):
+        """
+        Remove all delivery attempts of the named subscription.
+
+        :return: The number of delivery attempts removed.
+        """
+
+    def failure_keys(reverse=False, after=None, since=None, until=None):
+        """
+        Iterate ``(created, subscription_name, name)`` keys for the indexed
+        delivery attempts, in order of creation, optionally reversed.
+
+        If *after* is given, iteration resumes with the first key
+        following it in the requested order. Only attempts created at or
+        after the timestamp *since*, and before the timestamp *until*, are
+        included.
+        """
+
+    def subscription_count(subscription_name):
+        """
+        The number of indexed delivery attempts of the named subscription.
+        """
+
+    def __len__():
+        """
+        The number of indexed delivery attempts.
+        """
+
+
+class IDeliveryHealth(interface.Interface):
+    """
+    Delivery statistics for webhook subscriptions, updated as each
+    delivery attempt is resolved.
+    """
+
+    successes = interface.Attribute("The number of successful attempts")
+
+    failures = interface.Attribute("The number of failed attempts")
+
+    consecutive_failures = interface.Attribute(
+        "The number of attempts that failed since the last success")
+
+    last_success = interface.Attribute(
+        "The time of the last successful attempt, or None")
+
+    last_failure = interface.Attribute(
+        "The time of the last failed attempt, or None")
+
+    attempts = interface.Attribute("The number of resolved attempts")
+
+    success_rate = interface.Attribute(
+        "The fraction of attempts that succeeded, or None if there are none")
+
+    def record(attempt):
+        """
+        Add the given resolved delivery attempt to the statistics.
+        """
+
+    def latency_percentile(percent):
+        """
+        An estimate, in seconds, of the given percentile of delivery
+        latency, or None if no latencies have been recorded.
+        """
+
+
+class IDeliveryStats(interface.Interface):
+    """
+    Delivery statistics for webhook subscriptions, bucketed by time and
+    updated as each delivery attempt is resolved.
+    """
+
+    def record(attempt):
+        """
+        Add the outcome of the resolved delivery attempt to the bucket for
+        the time it was resolved.
+        """
+
+    def buckets(interval='hour', since=None, until=None):
+        """
+        Iterate, in order, ``(start, bucket)`` pairs for each ``hour`` or
+        ``day`` *interval* with resolved attempts, optionally only those
+        overlapping the timestamps *since* to *until*. Each *bucket* is an
+        :class:`IDeliveryHealth`; the timestamp *start* is in UTC.
+        """
+
+
+class ISubscriptionManagerHealth(IDeliveryHealth):
+    """
+    The delivery statistics of all subscriptions held by an
+    :class:`nti.webhooks.interfaces.IWebhookSubscriptionManager`.
+    """
+
+    failing = interface.Attribute(
+        "The names of the subscriptions whose latest attempt failed")
+
+    def discard(name):
+        """
+        Forget any failures of the subscription with the given name.
+        """
+
+
+class IDeliveryAttemptRetentionPolicy(interface.Interface):
+    """
+    Which delivery attempts of each subscription are kept when compacting.
+    Registered as a utility, and may be overridden by sites. Attempts that
+    have not been resolved are always kept.
+    """
+
+    max_attempts = interface.Attribute(
+        "The most delivery attempts kept for each subscription, the oldest "
+        "being removed first, or None for no limit")
+
+    max_age = interface.Attribute(
+        "The age, in seconds, after which delivery attempts are removed, "
+        "or None for no limit")
+
+
+class IDeliveryAttemptBodyLimits(interface.Interface):
+    """
+    The longest delivery attempt request and response bodies stored.
+    Longer bodies are truncated, with a marker, as their attempt is
+    resolved. Registered as a utility, and may be overridden by sites.
+    """
+
+    max_request_length = interface.Attribute(
+        "The most characters of each request body stored, or None for no "
+        "limit")
+
+    max_response_length = interface.Attribute(
+        "The most characters of each response body stored, or None for no "
+        "limit")
+
+
+class IDeliveryRollup(interface.Interface):
+    """
+    Per-day counts of the outcomes of delivery attempts of a subscription
+    that have been removed when compacting.
+    """
+
+    def record(attempt):
+        """
+        Count the (resolved) delivery attempt on the day it was created.
+        """
+
+    def days():
+        """
+        Iterate ``(day, successes, failures)`` tuples, in order, where
+        *day* is an ISO 8601 date (in UTC).
+        """
+
+
+class IDeliveryCoalescing(interface.Interface):
+    """
+    The coalescing of deliveries to a subscription. Rather than delivering
+    each event, only the latest data for each key (e.g. the user and
+    course of a progress update) is delivered once a window of time
+    opened by its first event ends. Stored as an annotation of the
+    subscription.
+    """
+
+    window = interface.Attribute(
+        "The length, in seconds, of each coalescing window, or None if "
+        "deliveries are not coalesced")
+
+    def add(key, data, now=None):
+        """
+        Record *data* as the latest for *key*, opening a window for the key
+        if one is not already open. The data is stored, so should be a
+        reference such as an NTIID rather than a persistent object.
+        Concurrent additions to an open window do not conflict.
+
+        :return: The time the window ends if it must be recorded to be
+            flushed, that is, if it was opened or should already have ended,
+            otherwise None.
+        """
+
+    def due(now=None):
+        """
+        Close the windows that have ended, returning a list of ``(data,
+        count)`` pairs, where *count* is the number of times data was
+        added for the key in the window.
+        """
+
+    def next_deadline():
+        """
+        The time the earliest open window ends, or None.
+        """
+
+    def __len__():
+        """
+        The number of open windows.
+        """
+
+
+class IPendingFlushes(interface.Interface):
+    """
+    The subscriptions of a subscription manager with windows (e.g. of
+    :class:`IDeliveryCoalescing`) open, and when the earliest of them
+    ends, for sweeps to find those to flush. Stored as an annotation of
+    the manager.
+    """
+
+    def add(name, deadline, kind):
+        """
+        Record that the subscription with the given *name* has a window
+        ending at *deadline*, to be flushed by the :class:`IDeliveryFlush`
+        named *kind*.
+        """
+
+    def flushed(name, kind, next_deadline):
+        """
+        Record that the windows of the named subscription were flushed,
+        and when the next one ends, or None if none are open.
+        """
+
+    def discard(name):
+        """
+        Forget the named subscription.
+        """
+
+    def due(now):
+        """
+        Return a list of ``(name, kind)`` pairs for the subscriptions with a
+        window that ended by *now*.
+        """
+
+    def __len__():
+        """
+        The number of subscriptions with open windows.
+        """
+
+
+class IDeliveryFlush(interface.Interface):
+    """
+    A named utility that flushes the windows of a subscription that have
+    ended, see :class:`IPendingFlushes`.
+    """
+
+    def __call__(db, site_name, oid, now=None):
+        """
+        Flush the windows of the subscription with the given *oid* in the
+        named host site that have ended by *now*, in our own connection to
+        *db*. Raises :class:`~ZODB.POSException.ConflictError` if that
+        conflicts, leaving them to be flushed again.
+
+        :return: The time the next open window ends, if any.
+        """
+
+
+class IDeliveryFlushSettings(interface.Interface):
+    """
+    How windows that have ended (see :class:`IPendingFlushes`) are found
+    and flushed. Registered as a utility.
+    """
+
+    sweep_interval = interface.Attribute(
+        "The most seconds between sweeps for windows that have ended, run "
+        "in the background of a process delivering events, or None to "
+        "never sweep")
+
+
+class IDeliveryBatching(interface.Interface):
+    """
+    The batching of deliveries to a subscription. Rather than sending
+    each delivery attempt on its own, pending attempts are held until
+    there are :attr:`size` of them, or :attr:`window` seconds have
+    passed since the first, then sent together as one array. Each
+    attempt is still resolved with the outcome of that request. Stored
+    as an annotation of the subscription.
+    """
+
+    size = interface.Attribute(
+        "The most attempts sent together, or None if deliveries are not "
+        "batched")
+
+    window = interface.Attribute(
+        "The most seconds an attempt is held for its batch to fill")
+
+    def add(name, now=None):
+        """
+        Hold the attempt with the given *name* for the open batch,
+        opening one if there is none.
+
+        :return: The time the batch window ends if it must be recorded
+            to be flushed, that is, if it was opened or should already
+            have ended, otherwise None.
+        """
+
+    def due(now=None):
+        """
+        Close the batch if it is full or its window has ended, returning
+        the names of its attempts in the order they were added, otherwise
+        return an empty list.
+        """
+
+    def next_deadline():
+        """
+        The time the open batch window ends, or None.
+        """
+
+    def __len__():
+        """
+        The number of attempts held.
+        """
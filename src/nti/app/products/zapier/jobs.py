@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import uuid
+import socket
+import threading
+
+from concurrent import futures
+
+import transaction
+
+from BTrees.OOBTree import OOBTree
+
+from ZODB.POSException import ConflictError
+
+#: The key of the leases in the database root.
+_LEASES_KEY = 'nti.app.products.zapier.jobs.leases'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class _JobExecutor(object):
+    """
+    Runs background jobs one at a time, in a single thread started when
+    the first job is submitted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, func, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(1)
+            return self._executor.submit(_run_job, func, *args)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+def _run_job(func, *args):
+    try:
+        return func(*args)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Failed to run background job %s', func)
+
+
+_executor = _JobExecutor()
+
+
+def submit_job(func, *args):
+    """
+    Call ``func(*args)`` in the background, after any jobs already
+    submitted by this process. Exceptions are logged.
+
+    :return: A :class:`concurrent.futures.Future` of the result.
+    """
+    return _executor.submit(func, *args)
+
+
+def _holder():
+    return u'%s:%s:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+
+
+def acquire_lease(db, name, duration, now=None):
+    """
+    Take the lease with the given *name*, shared by all processes using
+    *db*, for *duration* seconds, unless it is already held. The lease is
+    taken in our own transaction, so two processes taking it at once
+    conflict and only one succeeds.
+
+    :return: A token for :func:`release_lease`, or None if the lease is
+        held.
+    """
+    now = time.time() if now is None else now
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    try:
+        tm.begin()
+        root = conn.root()
+        leases = root.get(_LEASES_KEY)
+        if leases is None:
+            leases = root[_LEASES_KEY] = OOBTree()
+        current = leases.get(name)
+        if current is not None and current[1] > now:
+            return None
+        holder = _holder()
+        leases[name] = (holder, now + duration)
+        tm.commit()
+        return holder
+    except ConflictError:
+        return None
+    finally:
+        tm.abort()
+        conn.close()
+
+
+def release_lease(db, name, holder):
+    """
+    Release the lease with the given *name* taken by :func:`acquire_lease`
+    if we still hold it.
+    """
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    try:
+        tm.begin()
+        leases = conn.root().get(_LEASES_KEY)
+        current = leases.get(name) if leases is not None else None
+        if current is not None and current[0] == holder:
+            del leases[name]
+            tm.commit()
+    except ConflictError:
+        # It expires anyway
+        logger.warning('Conflict releasing lease %s', name)
+    finally:
+        tm.abort()
+        conn.close()
+
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ImportError:  # pragma: no cover
+    pass
+else:
+    addCleanUp(_executor.shutdown)
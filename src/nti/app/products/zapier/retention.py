@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+from datetime import datetime
+
+import transaction
+
+from BTrees.OOBTree import OOBTree
+
+from persistent import Persistent
+
+from zope import component
+from zope import interface
+
+from zope.annotation.factory import factory as an_factory
+
+from zope.annotation.interfaces import IAnnotations
+
+from zope.component.hooks import site as current_site
+
+from zope.container.contained import Contained
+
+from nti.app.products.zapier.index import query_delivery_attempt_index
+
+from nti.app.products.zapier.interfaces import IDeliveryAttemptRetentionPolicy
+from nti.app.products.zapier.interfaces import IDeliveryRollup
+
+from nti.app.products.zapier.jobs import acquire_lease
+from nti.app.products.zapier.jobs import release_lease
+from nti.app.products.zapier.jobs import submit_job
+
+from nti.site.hostpolicy import get_host_site
+
+from nti.transactions.loop import TransactionLoop
+
+from nti.webhooks.interfaces import IWebhookSubscription
+from nti.webhooks.interfaces import IWebhookSubscriptionManager
+
+#: The default age, in seconds, after which delivery attempts are removed.
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+#: The most delivery attempts removed in each transaction when compacting.
+COMPACTION_BATCH_SIZE = 100
+
+#: The longest, in seconds, a compaction of a site is expected to take.
+#: Another compaction of the site cannot start until it ends, or for this
+#: long if the process running it stops.
+COMPACTION_LEASE_DURATION = 6 * 60 * 60
+
+#: The status of delivery attempts that have not been resolved.
+_PENDING = 'pending'
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@interface.implementer(IDeliveryAttemptRetentionPolicy)
+class DeliveryAttemptRetentionPolicy(object):
+
+    def __init__(self, max_attempts=None, max_age=DEFAULT_MAX_AGE):
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+
+
+#: The policy used unless configured otherwise.
+DEFAULT_RETENTION_POLICY = DeliveryAttemptRetentionPolicy()
+
+
+def get_retention_policy():
+    return component.queryUtility(IDeliveryAttemptRetentionPolicy,
+                                  default=DEFAULT_RETENTION_POLICY)
+
+
+def _day(timestamp):
+    return datetime.utcfromtimestamp(timestamp).date().isoformat()
+
+
+@component.adapter(IWebhookSubscription)
+@interface.implementer(IDeliveryRollup)
+class DeliveryRollup(Persistent, Contained):
+    """
+    Per-day delivery attempt outcomes, only written when compacting.
+    """
+
+    def __init__(self):
+        self._days = OOBTree()
+
+    def record(self, attempt):
+        day = _day(attempt.createdTime)
+        successes, failures = self._days.get(day, (0, 0))
+        if attempt.succeeded():
+            successes += 1
+        else:
+            failures += 1
+        self._days[day] = (successes, failures)
+
+    def days(self):
+        for day, (successes, failures) in self._days.items():
+            yield day, successes, failures
+
+
+_DELIVERY_ROLLUP_KEY = 'nti.app.products.zapier.retention.DeliveryRollup'
+
+_DeliveryRollupFactory = an_factory(DeliveryRollup, _DELIVERY_ROLLUP_KEY)
+
+
+def query_delivery_rollup(subscription):
+    """
+    The :class:`IDeliveryRollup` of the subscription, or None if no
+    attempts have been compacted.
+    """
+    annotations = IAnnotations(subscription, None)
+    return annotations.get(_DELIVERY_ROLLUP_KEY) if annotations is not None else None
+
+
+def _attempt_keys(subscription):
+    # (createdTime, name, status) of all attempts, oldest first, from the
+    # index if we can.
+    index = query_delivery_attempt_index(subscription)
+    if index is not None and len(index) == len(subscription):
+        return ((created, name, index.sort_key(name, 'status')[0])
+                for created, name in index.sort_keys('createdtime'))
+    return iter(sorted((x.createdTime, x.__name__, x.status)
+                       for x in subscription.values()))
+
+
+def expired_attempt_names(subscription, policy=None, now=None):
+    """
+    The names of the delivery attempts of *subscription* not retained by
+    the *policy* (by default, the current policy), oldest first.
+    """
+    policy = get_retention_policy() if policy is None else policy
+    now = time.time() if now is None else now
+    excess = 0
+    if policy.max_attempts is not None:
+        excess = len(subscription) - policy.max_attempts
+    cutoff = now - policy.max_age if policy.max_age is not None else None
+
+    result = []
+    for pos, (created, name, status) in enumerate(_attempt_keys(subscription)):
+        if pos >= excess and (cutoff is None or created >= cutoff):
+            break
+        if status != _PENDING:
+            result.append(name)
+    return result
+
+
+def site_subscriptions():
+    """
+    Iterate the subscriptions of the current site.
+    """
+    utilities_in_site = component.getUtilitiesFor(IWebhookSubscriptionManager)
+    for unused_name, sub_manager in utilities_in_site:
+        for subscription in sub_manager.values():
+            yield subscription
+
+
+def remove_attempt(subscription, name):
+    """
+    Remove the named delivery attempt from *subscription*, adding its
+    outcome to the subscription's :class:`IDeliveryRollup`.
+    """
+    attempt = subscription.get(name)
+    if attempt is None:
+        return False
+    IDeliveryRollup(subscription).record(attempt)
+    del subscription[name]
+    return True
+
+
+class _CompactionLoop(TransactionLoop):
+    """
+    Runs its handler with a new connection to *db*, retrying conflicts
+    with fresh state.
+    """
+
+    attempts = 5
+
+    _connection = None
+
+    def __init__(self, handler, db):
+        super(_CompactionLoop, self).__init__(handler)
+        self._db = db
+
+    def run_handler(self, *args, **kwargs):
+        return self.handler(self._connection, *args, **kwargs)
+
+    def setUp(self):
+        self._connection = self._db.open()
+
+    def tearDown(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            finally:
+                self._connection = None
+
+
+def _remove_batch(conn, site_name, now, batch_size):
+    # Remove up to batch_size of the expired attempts of the site, as
+    # they are now.
+    removed = 0
+    ds_folder = conn.root()['nti.dataserver']
+    with current_site(ds_folder):
+        with current_site(get_host_site(site_name)):
+            policy = get_retention_policy()
+            for subscription in site_subscriptions():
+                for name in expired_attempt_names(subscription, policy, now):
+                    removed += remove_attempt(subscription, name)
+                    if removed >= batch_size:
+                        return removed
+    return removed
+
+
+def compact_site(db, site_name, now=None, batch_size=COMPACTION_BATCH_SIZE):
+    """
+    Remove the delivery attempts that are not retained from all
+    subscriptions of the named host site, committing every *batch_size*
+    removals in our own connection to *db*. Returns the number removed.
+
+    A batch that conflicts is found again and retried; if it keeps
+    conflicting, the :class:`~ZODB.POSException.ConflictError` is raised
+    and the attempts not yet removed are left for the next compaction.
+    """
+    loop = _CompactionLoop(_remove_batch, db)
+    removed = 0
+    while True:
+        count = loop(site_name, now, batch_size)
+        removed += count
+        if count < batch_size:
+            return removed
+
+
+def compact_host_sites(db, site_names, now=None,
+                       batch_size=COMPACTION_BATCH_SIZE):
+    """
+    Compact the delivery attempts of the named host sites, one at a time.
+    """
+    for site_name in site_names:
+        try:
+            removed = compact_site(db, site_name, now, batch_size)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Failed to compact delivery attempts for %s',
+                             site_name)
+        else:
+            logger.info('Removed %s delivery attempts for %s',
+                        removed, site_name)
+
+
+def _compaction_lease(site_name):
+    return u'nti.app.products.zapier.retention.compaction:%s' % site_name
+
+
+def _compact(db, site_name, now, holder):
+    try:
+        compact_host_sites(db, [site_name], now)
+    finally:
+        _release_compaction(db, site_name, holder)
+
+
+def _submit_compaction(success, db, site_name, now, holder):
+    if success:
+        submit_job(_compact, db, site_name, now, holder)
+    else:
+        _release_compaction(db, site_name, holder)
+
+
+def _release_compaction(db, site_name, holder):
+    release_lease(db, _compaction_lease(site_name), holder)
+
+
+def start_compaction(db, site_name, now=None):
+    """
+    Compact the delivery attempts of the named host site as a background
+    job (see :func:`~.jobs.submit_job`) once the current transaction
+    commits, unless a compaction of the site is already running in any
+    process.
+
+    :return: Whether the compaction was started.
+    """
+    holder = acquire_lease(db, _compaction_lease(site_name),
+                           COMPACTION_LEASE_DURATION)
+    if holder is None:
+        return False
+    tx = transaction.get()
+    tx.addAfterCommitHook(_submit_compaction, (db, site_name, now, holder))
+    tx.addAfterAbortHook(_release_compaction, (db, site_name, holder))
+    return True
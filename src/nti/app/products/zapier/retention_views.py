@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+from pyramid import httpexceptions as hexc
+
+from pyramid.view import view_config
+
+from zope.component.hooks import getSite
+
+from nti.app.base.abstract_views import AbstractAuthenticatedView
+
+from nti.app.externalization.error import raise_json_error
+
+from nti.app.products.zapier import MessageFactory as _
+from nti.app.products.zapier import COMPACT_DELIVERY_ATTEMPTS_VIEW
+
+from nti.app.products.zapier.retention import expired_attempt_names
+from nti.app.products.zapier.retention import get_retention_policy
+from nti.app.products.zapier.retention import site_subscriptions
+from nti.app.products.zapier.retention import start_compaction
+
+from nti.app.products.zapier.traversal import IntegrationProviderPathAdapter
+
+from nti.common.string import is_true
+
+from nti.dataserver.authorization import is_admin
+
+from nti.externalization.interfaces import LocatedExternalDict
+from nti.externalization.interfaces import StandardExternalFields
+
+CLASS = StandardExternalFields.CLASS
+ITEMS = StandardExternalFields.ITEMS
+TOTAL = StandardExternalFields.TOTAL
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@view_config(route_name='objects.generic.traversal',
+             request_method='POST',
+             context=IntegrationProviderPathAdapter,
+             renderer='rest',
+             name=COMPACT_DELIVERY_ATTEMPTS_VIEW)
+class CompactDeliveryAttemptsView(AbstractAuthenticatedView):
+    """
+    Remove the delivery attempts of the current site's subscriptions that
+    the retention policy does not keep, counting their outcomes by day.
+    Removal happens in the background; the response reports the number of
+    attempts of each subscription to be removed. Only one compaction of a
+    site runs at a time; requests while one is running are refused with a
+    409. Only available to NTI admins.
+
+    dry_run
+            If true, only report what would be removed.
+    """
+
+    def __call__(self):
+        if not is_admin(self.remoteUser):
+            raise hexc.HTTPForbidden(_('Cannot compact delivery attempts.'))
+
+        now = time.time()
+        policy = get_retention_policy()
+        dry_run = is_true(self.request.params.get('dry_run'))
+
+        expired = {}
+        for subscription in site_subscriptions():
+            names = expired_attempt_names(subscription, policy, now)
+            if names:
+                expired[subscription.__name__] = len(names)
+
+        result = LocatedExternalDict()
+        result[CLASS] = 'DeliveryAttemptCompaction'
+        result['DryRun'] = dry_run
+        result['MaxAttempts'] = policy.max_attempts
+        result['MaxAge'] = policy.max_age
+        result[ITEMS] = expired
+        result[TOTAL] = sum(expired.values())
+
+        if not dry_run and expired:
+            site = getSite()
+            if not start_compaction(site._p_jar.db(), site.__name__, now):
+                raise_json_error(self.request,
+                                 hexc.HTTPConflict,
+                                 {
+                                     'message': _(u"Delivery attempts are already "
+                                                  u"being compacted."),
+                                 },
+                                 None)
+            self.request.response.status_int = 202
+        return result
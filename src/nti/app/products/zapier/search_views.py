@@ -13,6 +13,8 @@ from nti.app.products.zapier import USER_SEARCH
 
 from nti.app.products.zapier.interfaces import IUserDetails
 
+from nti.app.products.zapier.view_mixins import FieldProjectionMixin
+
 from nti.appserver.usersearch_views import UserSearchView
 
 from nti.coremetadata.interfaces import IUser
@@ -31,7 +33,8 @@ logger = __import__('logging').getLogger(__name__)
              context=ISiteAuthentication,
              permission=nauth.ACT_SEARCH,
              name=USER_SEARCH)
-class ZapierUserSearchView(UserSearchView):
+class ZapierUserSearchView(UserSearchView,
+                           FieldProjectionMixin):
 
     def filter_result(self, all_results):
         results = []
@@ -41,5 +44,6 @@ class ZapierUserSearchView(UserSearchView):
         return super(ZapierUserSearchView, self).filter_result(results)
 
     def externalize_objects(self, results):
-        return [to_external_object(user_details, policy_name='zapier')
+        return [to_external_object(self._project_result(user_details),
+                                   policy_name='zapier')
                 for user_details in results]
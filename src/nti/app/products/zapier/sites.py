@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import contextlib
+import functools
+
+from multiprocessing.pool import ThreadPool
+
+import transaction
+
+from zope.component.hooks import site as current_site
+
+from nti.site.hostpolicy import get_all_host_sites
+from nti.site.hostpolicy import get_host_site
+
+#: The most host sites scanned concurrently by :func:`scan_host_sites`.
+MAX_SITE_SCAN_WORKERS = 8
+
+logger = __import__('logging').getLogger(__name__)
+
+
+@contextlib.contextmanager
+def read_only_connection(db):
+    """
+    A context manager opening a connection to *db* with its own
+    transaction manager, independent of the current transaction and
+    thread. The transaction is always aborted, and the connection closed,
+    on exit.
+    """
+    tm = transaction.TransactionManager()
+    conn = db.open(transaction_manager=tm)
+    try:
+        tm.begin()
+        yield conn
+    finally:
+        # We only ever read
+        tm.abort()
+        conn.close()
+
+
+def _scan_site(db, site_name, func):
+    with read_only_connection(db) as conn:
+        ds_folder = conn.root()['nti.dataserver']
+        with current_site(ds_folder):
+            site = get_host_site(site_name)
+            with current_site(site):
+                return func(site)
+
+
+def scan_host_sites(db, func, site_names=None,
+                    max_workers=MAX_SITE_SCAN_WORKERS):
+    """
+    Call *func* with each host site, while that site is the current site,
+    and return a list of ``(site_name, result)`` pairs.
+
+    Sites are scanned concurrently by, at most, *max_workers* workers, each
+    using its own connection to *db* and its own transaction, which is
+    always aborted. The results must therefore not include any persistent
+    objects; the object ids of anything needed afterwards can be returned
+    instead.
+
+    If *site_names* is not given, all host sites are scanned. Otherwise,
+    they are looked up in the current site.
+    """
+    if site_names is None:
+        site_names = [site.__name__ for site in get_all_host_sites()]
+    if not site_names:
+        return []
+    pool = ThreadPool(min(max_workers, len(site_names)))
+    try:
+        results = pool.map(functools.partial(_scan_site, db, func=func),
+                           site_names)
+    finally:
+        pool.close()
+        pool.join()
+    return list(zip(site_names, results))
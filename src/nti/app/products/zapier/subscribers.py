@@ -5,16 +5,57 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from itertools import chain
+
+import transaction
+
 from zope import component
 
+from zope.interface.interfaces import IRegistered
+from zope.interface.interfaces import IUnregistered
+
 from zope.lifecycleevent import IObjectAddedEvent
+from zope.lifecycleevent import IObjectModifiedEvent
+from zope.lifecycleevent import IObjectRemovedEvent
 
+from zope.securitypolicy.interfaces import Allow
+from zope.securitypolicy.interfaces import Deny
+from zope.securitypolicy.interfaces import IPrincipalPermissionMap
+from zope.securitypolicy.interfaces import IPrincipalRoleMap
 from zope.securitypolicy.interfaces import IRolePermissionManager
+from zope.securitypolicy.interfaces import IRolePermissionMap
+
+from nti.app.products.zapier.attempts import compress_attempt_bodies
+
+from nti.app.products.zapier.batching import join_transaction
+
+from nti.app.products.zapier.coalescing import query_pending_flushes
+from nti.app.products.zapier.coalescing import request_sweep_after_commit
+
+from nti.app.products.zapier.health import query_manager_health
+
+from nti.app.products.zapier.index import get_subscription_index
+from nti.app.products.zapier.index import query_delivery_attempt_index
+from nti.app.products.zapier.index import query_delivery_failure_index
+from nti.app.products.zapier.index import query_subscription_index
+
+from nti.app.products.zapier.interfaces import IChangeCounter
+from nti.app.products.zapier.interfaces import IDeliveryAttemptIndex
+from nti.app.products.zapier.interfaces import IDeliveryFailureIndex
+from nti.app.products.zapier.interfaces import IDeliveryHealth
+from nti.app.products.zapier.interfaces import IDeliveryStats
+from nti.app.products.zapier.interfaces import ISubscriptionManagerHealth
 
 from nti.dataserver.authorization import ROLE_ADMIN
 from nti.dataserver.authorization import ROLE_SITE_ADMIN
 
+from nti.webhooks.interfaces import ILimitedApplicabilityPreconditionFailureWebhookSubscription
+from nti.webhooks.interfaces import IWebhookDeliveryAttempt
+from nti.webhooks.interfaces import IWebhookDeliveryAttemptFailedEvent
+from nti.webhooks.interfaces import IWebhookDeliveryAttemptResolvedEvent
 from nti.webhooks.interfaces import IWebhookSubscription
+from nti.webhooks.interfaces import IWebhookSubscriptionApplicabilityPreconditionFailureLimitReached
+from nti.webhooks.interfaces import IWebhookSubscriptionManager
 
 
 _DEFAULT_PERMISSIONS = (
@@ -29,3 +70,298 @@ def apply_security_to_subscription(subscription, _event):
     for perm_id in _DEFAULT_PERMISSIONS:
         role_per.denyPermissionToRole(perm_id, ROLE_SITE_ADMIN.id)
         role_per.grantPermissionToRole(perm_id, ROLE_ADMIN.id)
+
+
+def has_default_security(subscription):
+    """
+    Whether the only security grants made on the subscription itself are
+    those made when it was added: the owner's grants from
+    :mod:`nti.webhooks` and the role grants from
+    :func:`apply_security_to_subscription`. If so, the subscription can be
+    read only by its owner and NTI admins.
+    """
+    owner_grants = set()
+    if subscription.owner_id:
+        owner_grants = set((perm_id, subscription.owner_id, Allow)
+                           for perm_id in _DEFAULT_PERMISSIONS)
+    principal_grants = IPrincipalPermissionMap(subscription).getPrincipalsAndPermissions()
+    if set(principal_grants) != owner_grants:
+        return False
+
+    role_grants = set()
+    for perm_id in _DEFAULT_PERMISSIONS:
+        role_grants.add((perm_id, ROLE_SITE_ADMIN.id, Deny))
+        role_grants.add((perm_id, ROLE_ADMIN.id, Allow))
+    if set(IRolePermissionMap(subscription).getRolesAndPermissions()) != role_grants:
+        return False
+
+    return not IPrincipalRoleMap(subscription).getPrincipalsAndRoles()
+
+
+@component.adapter(IWebhookSubscription, IObjectAddedEvent)
+def index_added_subscription(subscription, event):
+    # Registered after apply_security_to_subscription, so the grants have
+    # been applied by now.
+    index = get_subscription_index(event.newParent)
+    if index is not None:
+        index.index(subscription)
+        index.mark_custom_security(subscription.__name__,
+                                   not has_default_security(subscription))
+
+
+@component.adapter(IWebhookSubscription, IObjectRemovedEvent)
+def unindex_removed_subscription(_unused_subscription, event):
+    index = get_subscription_index(event.oldParent)
+    if index is not None:
+        index.unindex(event.oldName)
+
+
+def _reindex(subscription):
+    index = get_subscription_index(subscription.__parent__)
+    # Only update existing entries, adding is handled on IObjectAddedEvent.
+    # This keeps us from resurrecting entries for subscriptions that are
+    # being removed, which are deactivated (and modified) during removal.
+    if index is not None and subscription.__name__ in index:
+        index.index(subscription)
+
+
+@component.adapter(IWebhookSubscription, IObjectModifiedEvent)
+def reindex_modified_subscription(subscription, _event):
+    _reindex(subscription)
+
+
+@component.adapter(IWebhookSubscription, IRegistered)
+def reindex_activated_subscription(subscription, _event):
+    _reindex(subscription)
+
+
+@component.adapter(IWebhookSubscription, IUnregistered)
+def reindex_deactivated_subscription(subscription, _event):
+    _reindex(subscription)
+
+
+def subscriptions_to_deliver(sub_manager, data, event):
+    """
+    The subscriptions of *sub_manager* that *event* for *data* should be
+    delivered to, as returned by its ``subscriptionsToDeliver``.
+
+    The manager's registry holds the registration of every active
+    subscription, so loading it costs more the more subscriptions there
+    are. Instead we look up the names of those subscribed to what *data*
+    and *event* provide in the manager's :class:`ISubscriptionIndex` and
+    load only them. Managers without a complete index use their registry.
+    """
+    index = query_subscription_index(sub_manager)
+    if index is None or len(index) != len(sub_manager):
+        return sub_manager.subscriptionsToDeliver(data, event)
+    result = []
+    for name in index.triggered_names(data, event):
+        subscription = sub_manager.get(name)
+        if subscription is None or not subscription.active:
+            continue
+        # As for registry subscribers, None if the subscription does
+        # not apply (e.g. its owner may not view the data).
+        subscription = subscription(data, event)
+        if subscription is not None:
+            result.append(subscription)
+    return result
+
+
+def find_subscription_managers(data):
+    """
+    Iterate the subscription managers events for *data* are dispatched to,
+    once each: those of the current site, of the site of *data*, and each
+    next one up the tree from there.
+    """
+    # The same lookup as the private
+    # ``nti.webhooks.subscribers._find_subscription_managers``, which
+    # dispatch uses; kept here so we don't depend on its internals.
+    # Both lookups are needed, getUtilitiesFor alone misses managers only
+    # found through the bases of a site manager.
+    managers = chain(component.getUtilitiesFor(IWebhookSubscriptionManager),
+                     component.getUtilitiesFor(IWebhookSubscriptionManager, data))
+    seen = set()
+    for unused_name, sub_manager in managers:
+        if sub_manager not in seen:
+            seen.add(sub_manager)
+            yield sub_manager
+    sub_manager = component.queryNextUtility(data, IWebhookSubscriptionManager)
+    while sub_manager is not None:
+        if sub_manager not in seen:
+            seen.add(sub_manager)
+            yield sub_manager
+        sub_manager = component.queryNextUtility(sub_manager,
+                                                 IWebhookSubscriptionManager)
+
+
+def has_active_subscriptions(context, event_type):
+    """
+    Whether any of the subscription managers events for *context* are
+    dispatched to may have an active subscription to events of
+    *event_type* (an interface or specification, such as the
+    ``implementedBy`` a class of event). This is answered from the
+    managers' :class:`ISubscriptionIndex` without loading subscriptions;
+    managers without a complete index are assumed to have one if they
+    have any subscriptions.
+    """
+    for sub_manager in find_subscription_managers(context):
+        if not len(sub_manager):
+            continue
+        index = query_subscription_index(sub_manager)
+        count = None
+        if index is not None and len(index) == len(sub_manager):
+            count = index.active_event_count(event_type)
+        if count is None or count > 0:
+            return True
+    return False
+
+
+def find_subscriptions_to_deliver(data, event):
+    """
+    The subscriptions of all the managers the *event* for *data* is
+    dispatched to that it should be delivered to, found with
+    :func:`subscriptions_to_deliver`.
+    """
+    subscriptions = []
+    for sub_manager in find_subscription_managers(data):
+        subscriptions.extend(subscriptions_to_deliver(sub_manager, data, event))
+    return subscriptions
+
+
+def dispatch_webhook_event(data, event):
+    """
+    Registered in place of :func:`nti.webhooks.subscribers.dispatch_webhook_event`
+    for the events subscriptions may be made to, delivering to those found
+    by :func:`find_subscriptions_to_deliver`, in batches for those whose
+    deliveries are batched. Batch windows that have ended are flushed by
+    the sweep this may request.
+    """
+    subscriptions = find_subscriptions_to_deliver(data, event)
+    if subscriptions:
+        join_transaction(transaction.manager, data, event, subscriptions)
+        request_sweep_after_commit(transaction.get(), subscriptions)
+
+
+@component.adapter(IWebhookDeliveryAttemptFailedEvent)
+def reindex_subscription_for_failed_attempt(event):
+    # nti.webhooks may deactivate the subscription and update its
+    # status message (without further events) on failure
+    subscription = event.object.__parent__
+    if subscription is not None:
+        _reindex(subscription)
+
+
+@component.adapter(ILimitedApplicabilityPreconditionFailureWebhookSubscription,
+                   IWebhookSubscriptionApplicabilityPreconditionFailureLimitReached)
+def reindex_subscription_for_precondition_failure(subscription, _event):
+    _reindex(subscription)
+
+
+def _delivery_attempts_changed(subscription):
+    if IWebhookSubscription.providedBy(subscription):
+        IChangeCounter(subscription).changed()
+
+
+@component.adapter(IWebhookDeliveryAttempt, IObjectAddedEvent)
+def count_added_delivery_attempt(_unused_attempt, event):
+    _delivery_attempts_changed(event.newParent)
+
+
+@component.adapter(IWebhookDeliveryAttempt, IObjectRemovedEvent)
+def count_removed_delivery_attempt(_unused_attempt, event):
+    _delivery_attempts_changed(event.oldParent)
+
+
+@component.adapter(IWebhookDeliveryAttemptResolvedEvent)
+def count_resolved_delivery_attempt(event):
+    _delivery_attempts_changed(event.object.__parent__)
+
+
+@component.adapter(IWebhookDeliveryAttempt, IObjectAddedEvent)
+def index_added_delivery_attempt(attempt, event):
+    if IWebhookSubscription.providedBy(event.newParent):
+        IDeliveryAttemptIndex(event.newParent).index(attempt)
+
+
+@component.adapter(IWebhookDeliveryAttempt, IObjectRemovedEvent)
+def unindex_removed_delivery_attempt(_unused_attempt, event):
+    if IWebhookSubscription.providedBy(event.oldParent):
+        index = query_delivery_attempt_index(event.oldParent)
+        if index is not None:
+            index.unindex(event.oldName)
+
+
+@component.adapter(IWebhookDeliveryAttemptResolvedEvent)
+def reindex_resolved_delivery_attempt(event):
+    # The status changes as the attempt is resolved
+    attempt = event.object
+    subscription = attempt.__parent__
+    if IWebhookSubscription.providedBy(subscription):
+        index = query_delivery_attempt_index(subscription)
+        if index is not None and attempt.__name__ in index:
+            index.index(attempt)
+
+
+@component.adapter(IWebhookDeliveryAttemptFailedEvent)
+def index_failed_delivery_attempt(event):
+    attempt = event.object
+    subscription = attempt.__parent__
+    sub_manager = getattr(subscription, '__parent__', None)
+    if IWebhookSubscription.providedBy(subscription) \
+            and IWebhookSubscriptionManager.providedBy(sub_manager):
+        IDeliveryFailureIndex(sub_manager).index(attempt)
+
+
+@component.adapter(IWebhookDeliveryAttempt, IObjectRemovedEvent)
+def unindex_removed_failed_delivery_attempt(_unused_attempt, event):
+    # Attempts removed along with their subscription are unindexed with it
+    subscription = event.oldParent
+    if IWebhookSubscription.providedBy(subscription) \
+            and IWebhookSubscriptionManager.providedBy(subscription.__parent__):
+        index = query_delivery_failure_index(subscription.__parent__)
+        if index is not None:
+            index.unindex(subscription.__name__, event.oldName)
+
+
+@component.adapter(IWebhookSubscription, IObjectRemovedEvent)
+def unindex_removed_subscription_failures(_unused_subscription, event):
+    if IWebhookSubscriptionManager.providedBy(event.oldParent):
+        index = query_delivery_failure_index(event.oldParent)
+        if index is not None:
+            index.unindex_subscription(event.oldName)
+
+
+@component.adapter(IWebhookDeliveryAttemptResolvedEvent)
+def compress_resolved_delivery_attempt(event):
+    # The bodies are complete once the attempt is resolved
+    compress_attempt_bodies(event.object)
+
+
+@component.adapter(IWebhookDeliveryAttemptResolvedEvent)
+def record_delivery_attempt_health(event):
+    attempt = event.object
+    subscription = attempt.__parent__
+    if not IWebhookSubscription.providedBy(subscription):
+        return
+    IDeliveryHealth(subscription).record(attempt)
+    IDeliveryStats(subscription).record(attempt)
+    sub_manager = subscription.__parent__
+    if IWebhookSubscriptionManager.providedBy(sub_manager):
+        ISubscriptionManagerHealth(sub_manager).record(attempt)
+        IDeliveryStats(sub_manager).record(attempt)
+
+
+@component.adapter(IWebhookSubscription, IObjectRemovedEvent)
+def discard_removed_subscription_health(_unused_subscription, event):
+    if IWebhookSubscriptionManager.providedBy(event.oldParent):
+        health = query_manager_health(event.oldParent)
+        if health is not None:
+            health.discard(event.oldName)
+
+
+@component.adapter(IWebhookSubscription, IObjectRemovedEvent)
+def discard_removed_subscription_flushes(_unused_subscription, event):
+    if IWebhookSubscriptionManager.providedBy(event.oldParent):
+        pending = query_pending_flushes(event.oldParent)
+        if pending is not None:
+            pending.discard(event.oldName)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# pylint: disable=protected-access,too-many-public-methods
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import ends_with
+from hamcrest import has_length
+from hamcrest import instance_of
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import raises
+
+from zope.schema.interfaces import RequiredMissing
+
+from nti.app.products.zapier.attempts import CompressedDeliveryAttemptRequest
+from nti.app.products.zapier.attempts import CompressedDeliveryAttemptResponse
+from nti.app.products.zapier.attempts import TRUNCATION_MARKER
+from nti.app.products.zapier.attempts import CompressedText
+from nti.app.products.zapier.attempts import DeliveryAttemptBodyLimits
+from nti.app.products.zapier.attempts import attempt_payload
+from nti.app.products.zapier.attempts import compress_attempt_bodies
+from nti.app.products.zapier.attempts import stored_body_length
+
+from nti.webhooks.attempts import PersistentWebhookDeliveryAttempt
+
+
+class TestCompressedBodies(unittest.TestCase):
+
+    def test_compress(self):
+        attempt = PersistentWebhookDeliveryAttempt()
+        attempt.request.url = u'https://example.com/hook'
+        attempt.request.createdTime = 1000
+        attempt.request.body = u'{"Data": "%s"}' % (u'x' * 1000,)
+        attempt.response.content = u'OK'
+        attempt.response.status_code = 200
+
+        assert_that(compress_attempt_bodies(attempt), is_(True))
+        assert_that(compress_attempt_bodies(attempt), is_(False))
+
+        request = attempt.request
+        assert_that(request, instance_of(CompressedDeliveryAttemptRequest))
+        assert_that(request.url, is_(u'https://example.com/hook'))
+        assert_that(request.createdTime, is_(1000))
+        assert_that(request.body, is_(u'{"Data": "%s"}' % (u'x' * 1000,)))
+        assert_that(request.__dict__['_compressed_body'],
+                    instance_of(CompressedText))
+
+        # Short bodies stay inline
+        response = attempt.response
+        assert_that(response, instance_of(CompressedDeliveryAttemptResponse))
+        assert_that(response.status_code, is_(200))
+        assert_that(response.content, is_(u'OK'))
+        assert_that(response.__dict__['_compressed_content'], is_(u'OK'))
+
+        assert_that(calling(setattr).with_args(request, 'body', None),
+                    raises(RequiredMissing))
+
+    def test_failed(self):
+        attempt = PersistentWebhookDeliveryAttempt()
+        attempt.response = None
+        compress_attempt_bodies(attempt)
+        assert_that(attempt.response, is_(none()))
+        assert_that(attempt.request.body, is_(none()))
+
+    def test_truncate(self):
+        attempt = PersistentWebhookDeliveryAttempt()
+        attempt.request.body = u'x' * 1000
+        attempt.response.content = u'y' * 100
+        assert_that(stored_body_length(attempt.request, 'body'),
+                    is_((1000, False)))
+
+        limits = DeliveryAttemptBodyLimits(max_request_length=500,
+                                           max_response_length=None)
+        compress_attempt_bodies(attempt, limits)
+        body = attempt.request.body
+        assert_that(body, has_length(500))
+        assert_that(body, ends_with(TRUNCATION_MARKER))
+        assert_that(stored_body_length(attempt.request, 'body'),
+                    is_((1000, True)))
+        assert_that(attempt.response.content, is_(u'y' * 100))
+        assert_that(stored_body_length(attempt.response, 'content'),
+                    is_((100, False)))
+
+        # Setting a new value forgets the original length
+        attempt.request.body = u'z'
+        assert_that(stored_body_length(attempt.request, 'body'),
+                    is_((1, False)))
+
+    def _resolved(self, payload, body=None):
+        attempt = PersistentWebhookDeliveryAttempt()
+        attempt.payload_data = payload
+        if body is not None:
+            attempt.request.body = body
+        attempt.status = 'successful' if body is not None else 'failed'
+        return attempt
+
+    def test_payload_dropped(self):
+        payload = u'{"Data": "%s"}' % (u'x' * 1000,)
+
+        # Kept until resolved, it's needed to deliver
+        attempt = PersistentWebhookDeliveryAttempt()
+        attempt.payload_data = payload
+        compress_attempt_bodies(attempt)
+        assert_that(attempt.payload_data, is_(payload))
+        assert_that(attempt_payload(attempt), is_(payload))
+
+        # Then the request body holds it
+        attempt = self._resolved(payload, payload)
+        assert_that(compress_attempt_bodies(attempt), is_(True))
+        assert_that(compress_attempt_bodies(attempt), is_(False))
+        assert_that(attempt.payload_data, is_(none()))
+        assert_that(attempt_payload(attempt), is_(payload))
+
+        # Even if it was never sent
+        attempt = self._resolved(payload)
+        compress_attempt_bodies(attempt)
+        assert_that(attempt.payload_data, is_(none()))
+        assert_that(attempt.request.__dict__['_compressed_body'],
+                    instance_of(CompressedText))
+        assert_that(attempt_payload(attempt), is_(payload))
+
+    def test_payload_truncated(self):
+        attempt = self._resolved(u'x' * 1000)
+        limits = DeliveryAttemptBodyLimits(max_request_length=500)
+        compress_attempt_bodies(attempt, limits)
+        # Nothing left on the attempt itself
+        assert_that(attempt.payload_data, is_(none()))
+        payload = attempt_payload(attempt)
+        assert_that(payload, has_length(500))
+        assert_that(payload, ends_with(TRUNCATION_MARKER))
+        assert_that(stored_body_length(attempt.request, 'body'),
+                    is_((1000, True)))
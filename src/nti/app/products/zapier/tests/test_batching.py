@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import unittest
+
+import fudge
+
+import requests
+
+import responses
+
+import transaction
+
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import contains
+from hamcrest import has_length
+from hamcrest import has_property
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import raises
+
+from ZODB import DB
+
+from ZODB.DemoStorage import DemoStorage
+
+from ZODB.POSException import ConflictError
+
+from nti.app.products.zapier.batching import BatchShipmentInfo
+from nti.app.products.zapier.batching import _BatchedDeliveries
+from nti.app.products.zapier.batching import DeliveryBatching
+
+from nti.webhooks.attempts import WebhookDeliveryAttempt
+from nti.webhooks.attempts import WebhookDeliveryAttemptInternalInfo
+
+from nti.webhooks.delivery_manager import DefaultDeliveryManager
+from nti.webhooks.delivery_manager import ShipmentInfo
+
+from nti.webhooks.dialect import DefaultWebhookDialect
+
+from nti.webhooks.testing import SequentialExecutorService
+
+
+class TestDeliveryBatching(unittest.TestCase):
+
+    def test_batching(self):
+        batching = DeliveryBatching()
+        batching.size = 3
+        batching.window = 60
+        assert_that(batching.next_deadline(), is_(none()))
+
+        # The first attempt opens a window
+        assert_that(batching.add(u'one', now=100), is_(160))
+        assert_that(batching.add(u'two', now=110), is_(none()))
+        assert_that(batching, has_length(2))
+        assert_that(batching.next_deadline(), is_(160))
+        assert_that(batching.due(now=159), has_length(0))
+
+        # Sent once full...
+        assert_that(batching.add(u'three', now=120), is_(none()))
+        assert_that(batching.due(now=120), contains(u'one', u'two', u'three'))
+        assert_that(batching, has_length(0))
+        assert_that(batching.next_deadline(), is_(none()))
+
+        # ...or once the window ends
+        assert_that(batching.add(u'four', now=200), is_(260))
+        assert_that(batching.due(now=260), contains(u'four'))
+
+        # Windows that should have been flushed are flushed again
+        batching.add(u'five', now=300)
+        assert_that(batching.add(u'six', now=400), is_(360))
+        assert_that(batching.due(now=400), contains(u'five', u'six'))
+
+
+class TestConcurrentBatching(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB(DemoStorage())
+        self.addCleanup(self.db.close)
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        batching = conn.root()['batching'] = DeliveryBatching()
+        batching.size = 10
+        batching.add(u'one', now=100)
+        tm.commit()
+        conn.close()
+
+    def _open(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        self.addCleanup(conn.close)
+        self.addCleanup(tm.abort)
+        return tm, conn.root()['batching']
+
+    def test_concurrent_add(self):
+        tm1, batching1 = self._open()
+        tm2, batching2 = self._open()
+        batching1.add(u'two', now=110)
+        batching2.add(u'three', now=120)
+        batching2.add(u'four', now=130)
+        tm1.commit()
+        tm2.commit()
+
+        unused_tm, batching = self._open()
+        assert_that(batching.next_deadline(), is_(160))
+        assert_that(batching.due(now=160),
+                    contains(u'one', u'two', u'three', u'four'))
+
+    def test_add_to_sent(self):
+        tm1, batching1 = self._open()
+        tm2, batching2 = self._open()
+        assert_that(batching1.due(now=160), contains(u'one'))
+        batching2.add(u'two', now=150)
+        tm1.commit()
+        # Retried, in a new batch
+        assert_that(calling(tm2.commit), raises(ConflictError))
+
+    def test_add_to_reconfigured(self):
+        tm1, batching1 = self._open()
+        tm2, batching2 = self._open()
+        batching1.size = 2
+        batching2.add(u'two', now=150)
+        tm1.commit()
+        assert_that(calling(tm2.commit), raises(ConflictError))
+
+
+class _Subscription(object):
+
+    to = u'https://example.com/hook'
+    dialect = DefaultWebhookDialect()
+
+
+class TestBatchShipmentInfo(unittest.TestCase):
+
+    def _attempts(self, *payloads):
+        result = []
+        for payload in payloads:
+            attempt = WebhookDeliveryAttempt()
+            attempt.payload_data = payload
+            result.append(attempt)
+        return result
+
+    @responses.activate
+    def test_deliver(self):
+        responses.add(responses.POST, _Subscription.to, status=200)
+        attempts = self._attempts(u'{"Item": 1}', u'{"Item": 2}')
+        BatchShipmentInfo(_Subscription(), attempts).deliver()
+
+        # One request with every payload
+        assert_that(responses.calls, has_length(1))
+        assert_that(json.loads(responses.calls[0].request.body),
+                    contains({u'Item': 1}, {u'Item': 2}))
+
+        # Each attempt resolved with its own payload
+        for attempt in attempts:
+            assert_that(attempt.status, is_('successful'))
+            assert_that(attempt.response.status_code, is_(200))
+            assert_that(attempt.request.body, is_(attempt.payload_data))
+
+    @responses.activate
+    def test_deliver_failed(self):
+        responses.add(responses.POST, _Subscription.to, status=500)
+        attempts = self._attempts(u'{"Item": 1}', u'{"Item": 2}')
+        BatchShipmentInfo(_Subscription(), attempts).deliver()
+
+        for attempt in attempts:
+            assert_that(attempt.status, is_('failed'))
+            assert_that(attempt.message, is_(u'500 Internal Server Error'))
+
+    @responses.activate
+    def test_deliver_error(self):
+        responses.add(responses.POST, _Subscription.to,
+                      body=requests.ConnectionError())
+        attempts = self._attempts(u'{"Item": 1}', u'{"Item": 2}')
+        BatchShipmentInfo(_Subscription(), attempts).deliver()
+
+        for attempt in attempts:
+            assert_that(attempt.status, is_('failed'))
+            assert_that(attempt.response, is_(none()))
+            assert_that(attempt.message,
+                        is_(ShipmentInfo.REMOTE_EXCEPTION_MESSAGE))
+            assert_that(attempt.internal_info.exception_history, has_length(1))
+
+    @responses.activate
+    def test_accept_for_delivery(self):
+        # What we rely on from nti.webhooks (pinned in setup.py): the
+        # delivery manager only accepts a ShipmentInfo, and runs its
+        # deliver(). Fails if a release changes that.
+        for name in ('REMOTE_EXCEPTION_MESSAGE', 'LOCAL_EXCEPTION_MESSAGE'):
+            assert_that(ShipmentInfo, has_property(name))
+        assert_that(WebhookDeliveryAttemptInternalInfo,
+                    has_property('storeExceptionText'))
+
+        responses.add(responses.POST, _Subscription.to, status=200)
+        attempts = self._attempts(u'{"Item": 1}')
+        delivery_man = DefaultDeliveryManager('test')
+        delivery_man.executor_service = SequentialExecutorService()
+        delivery_man.acceptForDelivery(BatchShipmentInfo(_Subscription(), attempts))
+        delivery_man.waitForPendingDeliveries()
+        assert_that(responses.calls, has_length(1))
+        assert_that(attempts[0].status, is_('successful'))
+
+
+class _CountingDialect(DefaultWebhookDialect):
+
+    def __init__(self):
+        self.externalized = []
+
+    def externalizeData(self, data, event):
+        self.externalized.append(data)
+        return u'%s %s' % (data, len(self.externalized))
+
+
+class TestBatchedDeliveries(unittest.TestCase):
+
+    @fudge.patch('nti.app.products.zapier.batching._hold')
+    def test_payload_externalized_once(self, fake_hold):
+        held = []
+        fake_hold.is_callable().calls(
+            lambda unused_tx, subscription, payload: held.append((subscription, payload)))
+
+        dialect = _CountingDialect()
+        one = _Subscription()
+        one.dialect = dialect
+        two = _Subscription()
+        two.dialect = dialect
+        other = _Subscription()
+        other.dialect = _CountingDialect()
+
+        deliveries = _BatchedDeliveries(None)
+        deliveries.add(u'data', None, [one, two, other])
+        deliveries.add(u'more', None, [one])
+        deliveries()
+        # Once for each data and dialect
+        assert_that(held, contains((one, u'data 1'),
+                                   (two, u'data 1'),
+                                   (other, u'data 1'),
+                                   (one, u'more 2')))
+        assert_that(dialect.externalized, contains(u'data', u'more'))
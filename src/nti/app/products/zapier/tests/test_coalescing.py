@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# pylint: disable=protected-access
+
+import time
+import unittest
+
+import fudge
+
+import transaction
+
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import contains
+from hamcrest import contains_inanyorder
+from hamcrest import has_length
+from hamcrest import is_
+from hamcrest import none
+from hamcrest import raises
+
+from zope import component
+
+from ZODB import DB
+
+from ZODB.DemoStorage import DemoStorage
+
+from ZODB.POSException import ConflictError
+
+from nti.app.products.zapier.coalescing import DEFAULT_SWEEP_INTERVAL
+from nti.app.products.zapier.coalescing import DeliveryCoalescing
+from nti.app.products.zapier.coalescing import DeliveryFlushSettings
+from nti.app.products.zapier.coalescing import PendingFlushes
+from nti.app.products.zapier.coalescing import _reset_sweeps
+from nti.app.products.zapier.coalescing import request_sweep
+
+from nti.app.products.zapier.interfaces import IDeliveryFlushSettings
+
+
+class TestDeliveryCoalescing(unittest.TestCase):
+
+    def test_coalescing(self):
+        coalescing = DeliveryCoalescing()
+        coalescing.window = 60
+        assert_that(coalescing.next_deadline(), is_(none()))
+
+        # The first update opens a window, later ones merge into it
+        assert_that(coalescing.add(u'one', u'first', now=100), is_(160))
+        assert_that(coalescing.add(u'one', u'second', now=110), is_(none()))
+        assert_that(coalescing.add(u'two', u'other', now=120), is_(180))
+        assert_that(coalescing, has_length(2))
+        assert_that(coalescing.next_deadline(), is_(160))
+
+        assert_that(coalescing.due(now=159), has_length(0))
+        assert_that(coalescing.due(now=160), contains((u'second', 2)))
+        assert_that(coalescing, has_length(1))
+        assert_that(coalescing.next_deadline(), is_(180))
+
+        # Windows that should have been flushed are flushed again
+        assert_that(coalescing.add(u'two', u'late', now=200), is_(180))
+        assert_that(coalescing.due(now=200), contains((u'late', 2)))
+        assert_that(coalescing, has_length(0))
+        assert_that(coalescing.next_deadline(), is_(none()))
+
+        # Once flushed, the next update opens a new window
+        assert_that(coalescing.add(u'one', u'third', now=300), is_(360))
+
+
+class TestConcurrentCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB(DemoStorage())
+        self.addCleanup(self.db.close)
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        coalescing = conn.root()['coalescing'] = DeliveryCoalescing()
+        coalescing.window = 60
+        coalescing.add(u'one', u'data', now=100)
+        tm.commit()
+        conn.close()
+
+    def _open(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        self.addCleanup(conn.close)
+        self.addCleanup(tm.abort)
+        return tm, conn.root()['coalescing']
+
+    def test_concurrent_add(self):
+        tm1, coalescing1 = self._open()
+        tm2, coalescing2 = self._open()
+        coalescing1.add(u'one', u'data', now=110)
+        coalescing2.add(u'one', u'data', now=120)
+        coalescing2.add(u'one', u'data', now=130)
+        tm1.commit()
+        tm2.commit()
+
+        unused_tm, coalescing = self._open()
+        assert_that(coalescing.due(now=160), contains((u'data', 4)))
+
+    def test_add_to_flushed(self):
+        tm1, coalescing1 = self._open()
+        tm2, coalescing2 = self._open()
+        assert_that(coalescing1.due(now=160), contains((u'data', 1)))
+        coalescing2.add(u'one', u'data', now=150)
+        tm1.commit()
+        # Retried, in a new window
+        assert_that(calling(tm2.commit), raises(ConflictError))
+
+    def test_resolve_conflict(self):
+        old = {'data': u'data', 'deadline': 160, 'count': 1, 'closed': False}
+        committed = dict(old, count=3)
+        new = dict(old, count=2)
+        pending = DeliveryCoalescing()
+        pending.window = 60
+        pending.add(u'one', u'data', now=100)
+        pending = pending._pending[u'one']
+        assert_that(pending._p_resolveConflict(old, committed, new),
+                    is_(dict(old, count=4)))
+
+        closed = dict(committed, closed=True)
+        assert_that(calling(pending._p_resolveConflict).with_args(old, closed, new),
+                    raises(ConflictError))
+
+
+class TestPendingFlushes(unittest.TestCase):
+
+    def test_pending_flushes(self):
+        pending = PendingFlushes()
+        pending.add(u'one', 160, u'batch')
+        # The earliest deadline is kept
+        pending.add(u'one', 200, u'batch')
+        pending.add(u'one', 180, u'course.progress_updated')
+        pending.add(u'two', 150, u'batch')
+        assert_that(pending, has_length(3))
+        assert_that(pending.due(now=160),
+                    contains_inanyorder((u'one', u'batch'), (u'two', u'batch')))
+
+        pending.flushed(u'one', u'batch', 220)
+        pending.flushed(u'two', u'batch', None)
+        assert_that(pending.due(now=200),
+                    contains((u'one', u'course.progress_updated')))
+
+        pending.discard(u'one')
+        assert_that(pending, has_length(0))
+
+
+class TestRequestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB(DemoStorage())
+        self.addCleanup(self.db.close)
+        self.addCleanup(_reset_sweeps)
+
+    @fudge.patch('nti.app.products.zapier.coalescing.sweep_flushes')
+    def test_request_sweep(self, fake_sweep):
+        fake_sweep.expects_call().with_args(self.db).returns(1)
+        now = time.time()
+        # The first request only starts the interval
+        assert_that(request_sweep(self.db, now=now), is_(none()))
+        assert_that(request_sweep(self.db, now=now + 30), is_(none()))
+        future = request_sweep(self.db, now=now + DEFAULT_SWEEP_INTERVAL)
+        assert_that(future.result(5), is_(1))
+
+        # Another process that has not swept waits for the first
+        _reset_sweeps()
+        request_sweep(self.db, now=now)
+        future = request_sweep(self.db, now=now + DEFAULT_SWEEP_INTERVAL)
+        assert_that(future.result(5), is_(0))
+
+    def test_disabled(self):
+        settings = DeliveryFlushSettings(sweep_interval=None)
+        component.provideUtility(settings, IDeliveryFlushSettings)
+        self.addCleanup(component.getGlobalSiteManager().unregisterUtility,
+                        settings, IDeliveryFlushSettings)
+        now = time.time()
+        assert_that(request_sweep(self.db, now=now), is_(none()))
+        assert_that(request_sweep(self.db, now=now + DEFAULT_SWEEP_INTERVAL),
+                    is_(none()))
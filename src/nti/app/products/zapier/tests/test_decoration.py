@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from hamcrest import assert_that
+from hamcrest import is_
+
+from zope import interface
+
+from zope.component.hooks import getSite
+
+from zope.lifecycleevent import IObjectAddedEvent
+
+from zope.securitypolicy.interfaces import IPrincipalPermissionManager
+
+from nti.app.products.zapier.decoration import DecorationContext
+
+from nti.app.products.zapier.interfaces import ISubscriptionIndex
+
+from nti.app.testing.application_webtest import ApplicationLayerTest
+
+from nti.app.testing.decorators import WithSharedApplicationMockDS
+
+from nti.dataserver.authorization import ACT_DELETE
+
+from nti.dataserver.authorization_acl import has_permission
+
+from nti.dataserver.tests import mock_dataserver as mock_ds
+
+from nti.traversal.traversal import normal_resource_path
+
+from nti.webhooks.api import subscribe_to_resource
+
+
+class TestDecorationContext(ApplicationLayerTest):
+
+    def _subscribe(self, owner_id):
+        return subscribe_to_resource(getSite().getSiteManager(),
+                                     to=str('https://a.com/'),
+                                     for_=interface.Interface,
+                                     when=IObjectAddedEvent,
+                                     dialect_id='zapier',
+                                     owner_id=owner_id,
+                                     permission_id='zope.View')
+
+    @WithSharedApplicationMockDS(users=("owner.one", "owner.two"))
+    def test_decoration_context(self):
+        with mock_ds.mock_db_trans(self.ds, site_name="janux.ou.edu"):
+            subscriptions = [self._subscribe(u'owner.one'),
+                             self._subscribe(u'owner.one'),
+                             self._subscribe(u'owner.two')]
+
+            # Custom grants are checked in full
+            custom = subscriptions[1]
+            IPrincipalPermissionManager(custom).grantPermissionToPrincipal(ACT_DELETE.id,
+                                                                           u'owner.two')
+            ISubscriptionIndex(custom.__parent__).mark_custom_security(custom.__name__)
+
+            context = DecorationContext()
+            for subscription in subscriptions:
+                assert_that(context.resource_path(subscription),
+                            is_(normal_resource_path(subscription)))
+                for principal_id in (u'owner.one', u'owner.two', self.default_username):
+                    assert_that(context.can_delete(subscription, principal_id),
+                                is_(has_permission(ACT_DELETE, subscription, principal_id)))
+
+            assert_that(context.can_delete(custom, u'owner.two'), is_(True))
+            assert_that(context.can_delete(subscriptions[2], u'owner.one'), is_(False))
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# pylint: disable=protected-access,too-many-public-methods
+
+import unittest
+
+from datetime import timedelta
+
+from hamcrest import assert_that
+from hamcrest import contains
+from hamcrest import has_length
+from hamcrest import is_
+from hamcrest import none
+
+from nti.app.products.zapier.health import MAX_STATS_AGE
+from nti.app.products.zapier.health import STATS_INTERVALS
+from nti.app.products.zapier.health import DeliveryHealth
+from nti.app.products.zapier.health import DeliveryStats
+from nti.app.products.zapier.health import SubscriptionManagerHealth
+from nti.app.products.zapier.health import merged_buckets
+
+
+class _Response(object):
+
+    def __init__(self, elapsed):
+        self.elapsed = timedelta(seconds=elapsed)
+
+
+class _Subscription(object):
+    __name__ = u'subscription'
+
+
+class _Attempt(object):
+
+    def __init__(self, success, when, elapsed=None):
+        self._success = success
+        self.lastModified = when
+        self.response = _Response(elapsed) if elapsed is not None else None
+        self.__parent__ = _Subscription()
+
+    def succeeded(self):
+        return self._success
+
+
+class TestDeliveryHealth(unittest.TestCase):
+
+    def test_record(self):
+        health = DeliveryHealth()
+        assert_that(health.success_rate, is_(none()))
+        assert_that(health.latency_percentile(50), is_(none()))
+
+        health.record(_Attempt(True, 1, 0.02))
+        health.record(_Attempt(False, 2))
+        health.record(_Attempt(False, 3, 0.3))
+        assert_that(health.attempts, is_(3))
+        assert_that(health.success_rate, is_(1 / 3))
+        assert_that(health.consecutive_failures, is_(2))
+        assert_that(health.last_success, is_(1))
+        assert_that(health.last_failure, is_(3))
+
+        for _ in range(17):
+            health.record(_Attempt(True, 4, 0.04))
+        health.record(_Attempt(True, 5, 45))
+        assert_that(health.consecutive_failures, is_(0))
+        assert_that(health.last_success, is_(5))
+        # Estimated by bucket bounds, up to the largest latency seen
+        assert_that(health.latency_percentile(50), is_(0.05))
+        assert_that(health.latency_percentile(95), is_(0.5))
+        assert_that(health.latency_percentile(100), is_(45))
+
+    def test_resolve_conflict(self):
+        health = DeliveryHealth()
+        old = {'successes': 1, 'failures': 1, 'consecutive_failures': 1,
+               'last_success': 1, 'last_failure': 2,
+               'latency_counts': (1,)}
+
+        # Both failed
+        committed = dict(old, failures=2, consecutive_failures=2,
+                         last_failure=3, latency_counts=(2,))
+        new = dict(old, failures=3, consecutive_failures=3, last_failure=4)
+        resolved = health._p_resolveConflict(old, committed, new)
+        assert_that(resolved['failures'], is_(4))
+        assert_that(resolved['consecutive_failures'], is_(4))
+        assert_that(resolved['last_failure'], is_(4))
+        assert_that(resolved['latency_counts'][0], is_(2))
+        assert_that(resolved['latency_counts'], has_length(10))
+
+        # One succeeded, the other failed
+        committed = dict(old, successes=2, consecutive_failures=0,
+                         last_success=5)
+        resolved = health._p_resolveConflict(old, committed, new)
+        assert_that(resolved['successes'], is_(2))
+        assert_that(resolved['failures'], is_(3))
+        assert_that(resolved['consecutive_failures'], is_(2))
+        assert_that(resolved['last_success'], is_(5))
+
+    def test_manager_health(self):
+        health = SubscriptionManagerHealth()
+        health.record(_Attempt(False, 1))
+        assert_that(list(health.failing), contains(u'subscription'))
+        health.record(_Attempt(True, 2))
+        assert_that(list(health.failing), has_length(0))
+
+        health.record(_Attempt(False, 3))
+        health.discard(u'subscription')
+        assert_that(list(health.failing), has_length(0))
+
+        total = DeliveryHealth()
+        total.merge(health)
+        total.merge(health)
+        assert_that(total.attempts, is_(6))
+        assert_that(total.last_failure, is_(3))
+
+
+class TestDeliveryStats(unittest.TestCase):
+
+    def _counts(self, buckets):
+        return [(start, bucket.successes, bucket.failures)
+                for start, bucket in buckets]
+
+    def test_buckets(self):
+        stats = DeliveryStats()
+        day = STATS_INTERVALS['day']
+        hour = STATS_INTERVALS['hour']
+        stats.record(_Attempt(True, 10, 0.02))
+        stats.record(_Attempt(False, 20))
+        stats.record(_Attempt(True, hour + 5, 0.3))
+        stats.record(_Attempt(True, day + 5))
+
+        assert_that(self._counts(stats.buckets()),
+                    contains((0, 1, 1), (hour, 1, 0), (day, 1, 0)))
+        assert_that(self._counts(stats.buckets('day')),
+                    contains((0, 2, 1), (day, 1, 0)))
+        assert_that(self._counts(stats.buckets(since=hour + 10)),
+                    contains((hour, 1, 0), (day, 1, 0)))
+        assert_that(self._counts(stats.buckets(until=hour + 0.5)),
+                    contains((0, 1, 1), (hour, 1, 0)))
+        assert_that(self._counts(stats.buckets('day', since=10, until=day)),
+                    contains((0, 2, 1)))
+
+        bucket = list(stats.buckets('day'))[0][1]
+        assert_that(bucket.latency_percentile(50), is_(0.05))
+
+        other = DeliveryStats()
+        other.record(_Attempt(False, day + 10))
+        assert_that(self._counts(merged_buckets([stats, other], 'day')),
+                    contains((0, 2, 1), (day, 1, 1)))
+
+        # Old hours are dropped as new ones begin
+        stats.record(_Attempt(True, MAX_STATS_AGE + hour + 5))
+        assert_that(self._counts(stats.buckets()),
+                    contains((hour, 1, 0), (day, 1, 0),
+                             (MAX_STATS_AGE + hour, 1, 0)))
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# pylint: disable=protected-access,too-many-public-methods
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import contains
+from hamcrest import contains_inanyorder
+from hamcrest import has_length
+from hamcrest import calling
+from hamcrest import is_
+from hamcrest import raises
+
+from BTrees.OOBTree import OOTreeSet
+
+from zope import interface
+
+from nti.app.products.zapier.index import DeliveryAttemptIndex
+from nti.app.products.zapier.index import DeliveryFailureIndex
+from nti.app.products.zapier.index import SubscriptionIndex
+from nti.app.products.zapier.index import decode_cursor
+from nti.app.products.zapier.index import encode_cursor
+from nti.app.products.zapier.index import iter_keys
+from nti.app.products.zapier.index import manager_token
+from nti.app.products.zapier.index import merge_sorted
+from nti.app.products.zapier.index import message_matches
+from nti.app.products.zapier.index import target_host
+from nti.app.products.zapier.index import trigger_key
+
+
+class _Subscription(object):
+
+    def __init__(self, name, owner_id, to, createdTime,
+                 active=True, status_message=u'Active',
+                 for_=None, when=None):
+        self.__name__ = name
+        self.for_ = for_
+        self.when = when
+        self.owner_id = owner_id
+        self.to = to
+        self.createdTime = createdTime
+        self.active = active
+        self.status_message = status_message
+
+
+class _Attempt(object):
+
+    def __init__(self, name, createdTime, status=u'pending', message=None):
+        self.__name__ = name
+        self.createdTime = createdTime
+        self.status = status
+        self.message = message
+
+    def failed(self):
+        return self.status == u'failed'
+
+
+class TestSubscriptionIndex(unittest.TestCase):
+
+    def _names(self, index, sort_on, reverse=False, after=None):
+        return [name for _, name in index.sort_keys(sort_on, reverse, after)]
+
+    def test_index(self):
+        index = SubscriptionIndex()
+        one = _Subscription(u'one', u'zed', u'https://a.com', 3)
+        two = _Subscription(u'two', u'amy', u'https://c.com', 1, active=False)
+        three = _Subscription(u'three', u'bob', u'https://b.com', 2,
+                              status_message=None)
+        for subscription in (one, two, three):
+            assert_that(index.index(subscription), is_(True))
+
+        assert_that(index, has_length(3))
+        assert_that(self._names(index, 'createdTime'),
+                    contains(u'two', u'three', u'one'))
+        assert_that(self._names(index, 'createdTime', reverse=True),
+                    contains(u'one', u'three', u'two'))
+        assert_that(self._names(index, 'owner_id'),
+                    contains(u'two', u'three', u'one'))
+        assert_that(self._names(index, 'to'),
+                    contains(u'one', u'three', u'two'))
+        assert_that(self._names(index, 'active'),
+                    contains(u'two', u'one', u'three'))
+        assert_that(self._names(index, 'status_message'),
+                    contains(u'three', u'one', u'two'))
+
+        # Resuming
+        assert_that(self._names(index, 'createdTime', after=(2, u'three')),
+                    contains(u'one'))
+        assert_that(self._names(index, 'createdTime', reverse=True,
+                                after=(2, u'three')),
+                    contains(u'two'))
+        assert_that(self._names(index, 'owner_id', after=(u'b', u'')),
+                    contains(u'three', u'one'))
+
+        assert_that(index.sort_key(u'two', 'to'), is_((u'https://c.com', u'two')))
+        assert_that(list(index.owned_by(u'bob')), contains(u'three'))
+        assert_that(list(index.owned_by(u'bo')), has_length(0))
+
+        # Custom security
+        index.mark_custom_security(u'two')
+        index.mark_custom_security(u'three')
+        index.mark_custom_security(u'three', False)
+        assert_that(list(index.custom_security_names()), contains(u'two'))
+
+        # Unchanged
+        assert_that(index.index(one), is_(False))
+
+        # Modified
+        one.createdTime = 0
+        assert_that(index.index(one), is_(True))
+        assert_that(index, has_length(3))
+        assert_that(self._names(index, 'createdTime'),
+                    contains(u'one', u'two', u'three'))
+
+        # Removed
+        assert_that(index.unindex(u'two'), is_(True))
+        assert_that(index.unindex(u'two'), is_(False))
+        assert_that(list(index.custom_security_names()), has_length(0))
+        assert_that(index, has_length(2))
+        assert_that(self._names(index, 'createdTime'),
+                    contains(u'one', u'three'))
+
+    def test_filters(self):
+        index = SubscriptionIndex()
+        one = _Subscription(u'one', u'zed', u'https://A.com/x', 3,
+                            for_=TestCursor, when=TestSubscriptionIndex)
+        two = _Subscription(u'two', u'amy', u'https://b.com:8080/', 1,
+                            active=False)
+        three = _Subscription(u'three', u'zed', u'https://a.com/y', 2)
+        for subscription in (one, two, three):
+            index.index(subscription)
+
+        def names(**query):
+            return sorted(index.filter_names(query))
+
+        assert_that(names(active=1), contains(u'one', u'three'))
+        assert_that(names(active=0), contains(u'two'))
+        assert_that(names(owner=u'zed'), contains(u'one', u'three'))
+        assert_that(names(target_host=u'a.com'), contains(u'one', u'three'))
+        assert_that(names(target_host=u'b.com'), contains(u'two'))
+        assert_that(names(trigger=trigger_key(TestCursor, TestSubscriptionIndex)),
+                    contains(u'one'))
+        assert_that(names(owner=u'zed', active=0), has_length(0))
+        assert_that(names(owner=u'zed', target_host=u'a.com', active=1),
+                    contains(u'one', u'three'))
+        assert_that(names(owner=u'bob'), has_length(0))
+
+        # Modified
+        one.active = False
+        index.index(one)
+        assert_that(names(active=0), contains(u'one', u'two'))
+        assert_that(names(active=1), contains(u'three'))
+
+        # Removed
+        index.unindex(u'two')
+        assert_that(names(active=0), contains(u'one'))
+        assert_that(names(target_host=u'b.com'), has_length(0))
+
+    def test_triggered_names(self):
+
+        class IData(interface.Interface):
+            pass
+
+        class ISpecialData(IData):
+            pass
+
+        class IEvent(interface.Interface):
+            pass
+
+        @interface.implementer(ISpecialData)
+        class Data(object):
+            pass
+
+        @interface.implementer(IEvent)
+        class Event(object):
+            pass
+
+        index = SubscriptionIndex()
+        for subscription in (_Subscription(u'one', u'zed', u'https://a.com', 1,
+                                           for_=IData, when=IEvent),
+                             _Subscription(u'two', u'zed', u'https://a.com', 2,
+                                           for_=ISpecialData, when=IEvent),
+                             _Subscription(u'three', u'zed', u'https://a.com', 3,
+                                           for_=IData, when=IEvent, active=False),
+                             _Subscription(u'four', u'zed', u'https://a.com', 4,
+                                           for_=Data, when=IEvent),
+                             _Subscription(u'five', u'zed', u'https://a.com', 5,
+                                           for_=IEvent, when=IData)):
+            index.index(subscription)
+
+        assert_that(list(index.triggered_names(Data(), Event())),
+                    contains_inanyorder(u'one', u'two', u'four'))
+        assert_that(list(index.triggered_names(object(), Event())),
+                    has_length(0))
+        assert_that(list(SubscriptionIndex().triggered_names(Data(), Event())),
+                    has_length(0))
+
+    def test_active_event_count(self):
+
+        class IEvent(interface.Interface):
+            pass
+
+        class ISpecialEvent(IEvent):
+            pass
+
+        class IOtherEvent(interface.Interface):
+            pass
+
+        index = SubscriptionIndex()
+        one = _Subscription(u'one', u'zed', u'https://a.com', 1, when=IEvent)
+        two = _Subscription(u'two', u'zed', u'https://a.com', 2, when=ISpecialEvent)
+        three = _Subscription(u'three', u'zed', u'https://a.com', 3,
+                              when=IEvent, active=False)
+        for subscription in (one, two, three):
+            index.index(subscription)
+
+        assert_that(index.active_event_count(IEvent), is_(1))
+        assert_that(index.active_event_count(ISpecialEvent), is_(2))
+        assert_that(index.active_event_count(IOtherEvent), is_(0))
+
+        # (De)activated
+        three.active = True
+        index.index(three)
+        one.active = False
+        index.index(one)
+        assert_that(index.active_event_count(ISpecialEvent), is_(2))
+
+        # Subscribed to another event
+        two.when = IOtherEvent
+        index.index(two)
+        assert_that(index.active_event_count(ISpecialEvent), is_(1))
+        assert_that(index.active_event_count(IOtherEvent), is_(1))
+
+        # Removed
+        index.unindex(u'three')
+        index.unindex(u'one')
+        assert_that(index.active_event_count(ISpecialEvent), is_(0))
+
+    def test_target_host(self):
+        assert_that(target_host(u'https://Example.COM:443/hook'),
+                    is_(u'example.com'))
+        assert_that(target_host(None), is_(u''))
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_cursor(self):
+        cursor = encode_cursor('createdTime', True, (1602264343.6, u'name'))
+        assert_that(decode_cursor(cursor, 'createdTime', True),
+                    is_((1602264343.6, u'name')))
+
+        cursor = encode_cursor('to', False, (u'https://b.com/\u2713', u'name'))
+        assert_that(decode_cursor(cursor, 'to', False),
+                    is_((u'https://b.com/\u2713', u'name')))
+
+        # Different ordering
+        assert_that(calling(decode_cursor).with_args(cursor, 'to', True),
+                    raises(ValueError))
+        assert_that(calling(decode_cursor).with_args(cursor, 'owner_id', False),
+                    raises(ValueError))
+
+        # Further tie breakers
+        cursor = encode_cursor('to', False, (u'https://b.com/', u'name', u'01'))
+        assert_that(decode_cursor(cursor, 'to', False),
+                    is_((u'https://b.com/', u'name', u'01')))
+
+        # Malformed
+        for bad in (u'', u'abc', u'\u2713', encode_cursor('to', False, ())):
+            assert_that(calling(decode_cursor).with_args(bad, 'to', False),
+                        raises(ValueError))
+
+
+class TestIterKeys(unittest.TestCase):
+
+    def test_reverse(self):
+        keys = [(1, u''), (1, u'a'), (1, u'a\x00'), (1, u'a\x00b'), (1, u'aa'),
+                (1, u'b'), (2, u'a'), (2, u'ab'), (2, u'b\U0010ffff')]
+        tree = OOTreeSet(keys)
+        assert_that(list(iter_keys(tree, reverse=True)),
+                    contains(*reversed(keys)))
+        for pos, key in enumerate(keys):
+            assert_that(list(iter_keys(tree, reverse=True, after=key)),
+                        contains(*reversed(keys[:pos])))
+        # Bounds need not be keys
+        assert_that(list(iter_keys(tree, reverse=True, after=(2,))),
+                    contains(*reversed(keys[:6])))
+        assert_that(list(iter_keys(tree, reverse=True, min=(1, u'aa'),
+                                   max=(2, u'b'))),
+                    contains((2, u'ab'), (2, u'a'), (1, u'b'), (1, u'aa')))
+        assert_that(list(iter_keys(OOTreeSet(), reverse=True)), has_length(0))
+
+        # Keys not ending in text
+        tree = OOTreeSet([(u'a', 1), (u'a', 2), (u'b', 1)])
+        assert_that(list(iter_keys(tree, reverse=True, after=(u'b', 1))),
+                    contains((u'a', 2), (u'a', 1)))
+
+
+class TestManagerToken(unittest.TestCase):
+
+    def test_manager_token(self):
+        manager = _Subscription(u'manager', None, None, None)
+        assert_that(manager_token(manager), is_(u''))
+        manager._p_oid = b'\x00\x00\x00\x00\x00\x00\x01\x0f'
+        assert_that(manager_token(manager), is_(u'000000000000010f'))
+
+
+class TestMergeSorted(unittest.TestCase):
+
+    def test_merge(self):
+        assert_that(list(merge_sorted([(1, 4, 7), (2, 5), (), (3, 6)])),
+                    contains(1, 2, 3, 4, 5, 6, 7))
+        assert_that(list(merge_sorted([(7, 4, 1), (5, 2), (6, 3)],
+                                      reverse=True)),
+                    contains(7, 6, 5, 4, 3, 2, 1))
+        assert_that(list(merge_sorted([[(u'b', 2)], [(u'a', 1)]],
+                                      key=lambda x: x[1])),
+                    contains((u'a', 1), (u'b', 2)))
+
+
+class TestDeliveryAttemptIndex(unittest.TestCase):
+
+    def _names(self, index, sort_on, reverse=False, after=None):
+        return [name for _, name in index.sort_keys(sort_on, reverse, after)]
+
+    def test_index(self):
+        index = DeliveryAttemptIndex()
+        one = _Attempt(u'one', 2, u'successful')
+        two = _Attempt(u'two', 1, u'failed')
+        three = _Attempt(u'three', 3)
+        for attempt in (one, two, three):
+            assert_that(index.index(attempt), is_(True))
+        assert_that(index.index(three), is_(False))
+
+        assert_that(index, has_length(3))
+        assert_that(self._names(index, 'createdtime'),
+                    contains(u'two', u'one', u'three'))
+        assert_that(self._names(index, 'createdtime', reverse=True,
+                                after=(2, u'one')),
+                    contains(u'two'))
+        assert_that(self._names(index, 'status'),
+                    contains(u'two', u'three', u'one'))
+
+        # Resolving
+        three.status = u'successful'
+        assert_that(index.index(three), is_(True))
+        assert_that(index, has_length(3))
+        assert_that(self._names(index, 'status'),
+                    contains(u'two', u'one', u'three'))
+
+        assert_that(index.unindex(u'one'), is_(True))
+        assert_that(index.unindex(u'one'), is_(False))
+        assert_that(u'one' in index, is_(False))
+        assert_that(self._names(index, 'createdtime'),
+                    contains(u'two', u'three'))
+
+    def test_search(self):
+        index = DeliveryAttemptIndex()
+        one = _Attempt(u'one', 1, message=u'Connection timeout')
+        two = _Attempt(u'two', 2, message=u'Read Timeout, retrying')
+        three = _Attempt(u'three', 3)
+        for attempt in (one, two, three):
+            index.index(attempt)
+
+        assert_that(index.search(u'TIMEOUT'), contains_inanyorder(u'one', u'two'))
+        assert_that(index.search(u'time'), contains_inanyorder(u'one', u'two'))
+        assert_that(index.search(u'timeout conn'), contains(u'one'))
+        assert_that(index.search(u'refused'), has_length(0))
+        assert_that(index.search(u'!!'), has_length(0))
+        assert_that(index.sort_key(u'two', 'createdtime'), is_((2, u'two')))
+
+        # Resolving changes the message
+        three.message = u'Connection refused'
+        one.message = u'200 OK'
+        index.index(three)
+        index.index(one)
+        assert_that(index.search(u'connection'), contains(u'three'))
+        assert_that(index.search(u'ok'), contains(u'one'))
+
+        index.unindex(u'two')
+        assert_that(index.search(u'timeout'), has_length(0))
+        assert_that(index._words, has_length(4))
+
+    def test_created_between(self):
+        index = DeliveryAttemptIndex()
+        for name, createdTime in ((u'one', 1), (u'two', 2), (u'three', 3)):
+            index.index(_Attempt(name, createdTime))
+        assert_that(index.created_between(2), contains_inanyorder(u'two', u'three'))
+        assert_that(index.created_between(until=2), contains(u'one'))
+        assert_that(index.created_between(1.5, 3), contains(u'two'))
+        assert_that(index.created_between(3, 1), has_length(0))
+        assert_that(index.created_between(), has_length(3))
+
+    def test_message_matches(self):
+        assert_that(message_matches(u'Read Timeout', {u'time', u'read'}), is_(True))
+        assert_that(message_matches(u'Read Timeout', {u'out'}), is_(False))
+        assert_that(message_matches(None, {u'out'}), is_(False))
+
+    def test_rebuild(self):
+        index = DeliveryAttemptIndex()
+        index.index(_Attempt(u'gone', 1))
+
+        class _Subscription(dict):
+            pass
+        subscription = _Subscription(one=_Attempt(u'one', 2),
+                                     two=_Attempt(u'two', 1))
+        assert_that(index.rebuild(subscription), is_(2))
+        assert_that(self._names(index, 'createdtime'),
+                    contains(u'two', u'one'))
+
+
+class TestDeliveryFailureIndex(unittest.TestCase):
+
+    def _failure(self, subscription, name, createdTime):
+        attempt = _Attempt(name, createdTime, u'failed')
+        attempt.__parent__ = subscription
+        subscription[name] = attempt
+        return attempt
+
+    def test_index(self):
+        class _Subscription(dict):
+            def __init__(self, name):
+                super(_Subscription, self).__init__()
+                self.__name__ = name
+        first = _Subscription(u'first')
+        second = _Subscription(u'second')
+        index = DeliveryFailureIndex()
+        for attempt in (self._failure(first, u'one', 1),
+                        self._failure(second, u'two', 2),
+                        self._failure(first, u'three', 3),
+                        self._failure(second, u'four', 3)):
+            assert_that(index.index(attempt), is_(True))
+        assert_that(index.index(first[u'one']), is_(False))
+        assert_that(index, has_length(4))
+        assert_that(index.subscription_count(u'first'), is_(2))
+
+        assert_that(list(index.failure_keys(True)),
+                    contains((3, u'second', u'four'),
+                             (3, u'first', u'three'),
+                             (2, u'second', u'two'),
+                             (1, u'first', u'one')))
+        assert_that(list(index.failure_keys(True, after=(3, u'first', u'three'))),
+                    contains((2, u'second', u'two'),
+                             (1, u'first', u'one')))
+        assert_that(list(index.failure_keys(since=2, until=3)),
+                    contains((2, u'second', u'two')))
+        # Cursors from outside of the window
+        assert_that(list(index.failure_keys(True, after=(4, u'a', u'a'), until=3)),
+                    contains((2, u'second', u'two'),
+                             (1, u'first', u'one')))
+
+        assert_that(index.unindex(u'second', u'two'), is_(True))
+        assert_that(index.unindex(u'second', u'two'), is_(False))
+        assert_that(index.unindex_subscription(u'first'), is_(2))
+        assert_that(index, has_length(1))
+        assert_that(list(index.failure_keys()),
+                    contains((3, u'second', u'four')))
+
+        # Only failures are indexed on rebuild
+        first[u'five'] = _Attempt(u'five', 5, u'successful')
+        self._failure(first, u'six', 6)
+        manager = {u'first': first, u'second': second}
+        assert_that(index.rebuild(manager), is_(5))
+        assert_that(index.subscription_count(u'first'), is_(3))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from hamcrest import assert_that
+from hamcrest import is_
+from hamcrest import is_not
+from hamcrest import none
+
+from ZODB import DB
+
+from ZODB.DemoStorage import DemoStorage
+
+from nti.app.products.zapier.jobs import acquire_lease
+from nti.app.products.zapier.jobs import release_lease
+from nti.app.products.zapier.jobs import submit_job
+
+
+class TestJobs(unittest.TestCase):
+
+    def test_submit_job(self):
+        assert_that(submit_job(lambda x: x + 1, 1).result(5), is_(2))
+        # Failures are logged
+        assert_that(submit_job(lambda: 1 / 0).result(5), is_(none()))
+
+
+class TestLeases(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB(DemoStorage())
+        self.addCleanup(self.db.close)
+
+    def test_lease(self):
+        holder = acquire_lease(self.db, u'lease', 60, now=100)
+        assert_that(holder, is_not(none()))
+        assert_that(acquire_lease(self.db, u'lease', 60, now=150), is_(none()))
+        # Others are independent
+        assert_that(acquire_lease(self.db, u'other', 60, now=150),
+                    is_not(none()))
+
+        release_lease(self.db, u'lease', holder)
+        assert_that(acquire_lease(self.db, u'lease', 60, now=150),
+                    is_not(none()))
+
+    def test_expired(self):
+        holder = acquire_lease(self.db, u'lease', 60, now=100)
+        other = acquire_lease(self.db, u'lease', 60, now=160)
+        assert_that(other, is_not(none()))
+        # Only the holder releases it
+        release_lease(self.db, u'lease', holder)
+        assert_that(acquire_lease(self.db, u'lease', 60, now=170), is_(none()))
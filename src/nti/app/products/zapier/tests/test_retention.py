@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+# pylint: disable=protected-access,too-many-public-methods
+
+import unittest
+
+import transaction
+
+from hamcrest import assert_that
+from hamcrest import calling
+from hamcrest import contains
+from hamcrest import has_length
+from hamcrest import is_
+from hamcrest import raises
+
+from persistent.mapping import PersistentMapping
+
+from ZODB import DB
+
+from ZODB.DemoStorage import DemoStorage
+
+from ZODB.POSException import ConflictError
+
+from nti.app.products.zapier.jobs import submit_job
+
+from nti.app.products.zapier.retention import DeliveryAttemptRetentionPolicy
+from nti.app.products.zapier.retention import DeliveryRollup
+from nti.app.products.zapier.retention import _CompactionLoop
+from nti.app.products.zapier.retention import start_compaction
+from nti.app.products.zapier.retention import expired_attempt_names
+
+_DAY = 24 * 60 * 60
+
+
+class _Attempt(object):
+
+    def __init__(self, name, createdTime, status=u'successful'):
+        self.__name__ = name
+        self.createdTime = createdTime
+        self.status = status
+
+    def succeeded(self):
+        return self.status == u'successful'
+
+
+class _Subscription(dict):
+
+    def __init__(self, *attempts):
+        super(_Subscription, self).__init__((x.__name__, x) for x in attempts)
+
+
+class TestRetention(unittest.TestCase):
+
+    def test_expired_attempt_names(self):
+        subscription = _Subscription(_Attempt(u'a', 1 * _DAY),
+                                     _Attempt(u'b', 2 * _DAY, u'pending'),
+                                     _Attempt(u'c', 3 * _DAY, u'failed'),
+                                     _Attempt(u'd', 4 * _DAY))
+        now = 5 * _DAY
+
+        policy = DeliveryAttemptRetentionPolicy(max_age=None)
+        assert_that(expired_attempt_names(subscription, policy, now),
+                    has_length(0))
+
+        # Pending attempts are always kept
+        policy = DeliveryAttemptRetentionPolicy(max_age=3.5 * _DAY)
+        assert_that(expired_attempt_names(subscription, policy, now),
+                    contains(u'a'))
+        policy = DeliveryAttemptRetentionPolicy(max_age=1.5 * _DAY)
+        assert_that(expired_attempt_names(subscription, policy, now),
+                    contains(u'a', u'c'))
+
+        policy = DeliveryAttemptRetentionPolicy(max_attempts=1, max_age=None)
+        assert_that(expired_attempt_names(subscription, policy, now),
+                    contains(u'a', u'c'))
+        policy = DeliveryAttemptRetentionPolicy(max_attempts=3,
+                                                max_age=2.5 * _DAY)
+        assert_that(expired_attempt_names(subscription, policy, now),
+                    contains(u'a'))
+
+    def test_rollup(self):
+        rollup = DeliveryRollup()
+        rollup.record(_Attempt(u'a', 0))
+        rollup.record(_Attempt(u'b', 60, u'failed'))
+        rollup.record(_Attempt(u'c', _DAY))
+        assert_that(list(rollup.days()),
+                    contains((u'1970-01-01', 1, 1),
+                             (u'1970-01-02', 1, 0)))
+
+
+class TestCompactionLoop(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB(DemoStorage())
+        self.addCleanup(self.db.close)
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        conn.root()['counts'] = PersistentMapping(removed=0)
+        tm.commit()
+        conn.close()
+
+    def _conflict(self):
+        # Another process changes what we are changing
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        conn.root()['counts']['removed'] += 10
+        tm.commit()
+        conn.close()
+
+    def test_retry(self):
+        seen = []
+
+        def remove(conn):
+            counts = conn.root()['counts']
+            counts['removed'] += 1
+            seen.append(counts['removed'])
+            if len(seen) == 1:
+                self._conflict()
+            return 1
+
+        assert_that(_CompactionLoop(remove, self.db)(), is_(1))
+        # Retried with the committed state
+        assert_that(seen, contains(1, 11))
+
+    def test_keeps_conflicting(self):
+        seen = []
+
+        def remove(conn):
+            conn.root()['counts']['removed'] += 1
+            seen.append(None)
+            self._conflict()
+            return 1
+
+        loop = _CompactionLoop(remove, self.db)
+        assert_that(calling(loop), raises(ConflictError))
+        assert_that(seen, has_length(loop.attempts))
+
+
+class TestStartCompaction(unittest.TestCase):
+
+    def setUp(self):
+        self.db = DB(DemoStorage())
+        self.addCleanup(self.db.close)
+        transaction.begin()
+        self.addCleanup(transaction.abort)
+
+    def test_start_compaction(self):
+        assert_that(start_compaction(self.db, u'site'), is_(True))
+        # Only one at a time
+        assert_that(start_compaction(self.db, u'site'), is_(False))
+        assert_that(start_compaction(self.db, u'other'), is_(True))
+
+        # Not started if the request fails
+        transaction.abort()
+        transaction.begin()
+        assert_that(start_compaction(self.db, u'site'), is_(True))
+
+        # Released once the compaction job ends
+        transaction.commit()
+        submit_job(lambda: None).result(5)
+        transaction.begin()
+        assert_that(start_compaction(self.db, u'site'), is_(True))
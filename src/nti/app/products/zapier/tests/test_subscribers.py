@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from hamcrest import assert_that
+from hamcrest import contains_inanyorder
+from hamcrest import has_length
+from hamcrest import is_
+
+from zope import interface
+
+from zope.component.hooks import getSite
+
+from zope.lifecycleevent import ObjectAddedEvent
+from zope.lifecycleevent import ObjectModifiedEvent
+
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+
+from nti.app.products.zapier.index import query_subscription_index
+
+from nti.app.products.zapier.subscribers import has_active_subscriptions
+from nti.app.products.zapier.subscribers import subscriptions_to_deliver
+
+from nti.app.testing.application_webtest import ApplicationLayerTest
+
+from nti.app.testing.decorators import WithSharedApplicationMockDS
+
+from nti.coremetadata.interfaces import IUser
+
+from nti.dataserver.tests import mock_dataserver as mock_ds
+
+from nti.dataserver.users import User
+
+from nti.webhooks.api import subscribe_to_resource
+
+
+class TestSubscriptionsToDeliver(ApplicationLayerTest):
+
+    def _subscribe(self, for_, when):
+        return subscribe_to_resource(getSite().getSiteManager(),
+                                     to=str('https://a.com/'),
+                                     for_=for_,
+                                     when=when,
+                                     dialect_id='zapier',
+                                     owner_id=self.default_username,
+                                     permission_id='zope.View')
+
+    @WithSharedApplicationMockDS(users=True)
+    def test_subscriptions_to_deliver(self):
+        with mock_ds.mock_db_trans(self.ds, site_name="janux.ou.edu"):
+            added = [self._subscribe(IUser, IObjectAddedEvent),
+                     self._subscribe(interface.Interface, IObjectAddedEvent)]
+            modified = self._subscribe(IUser, IObjectModifiedEvent)
+            inactive = self._subscribe(IUser, IObjectAddedEvent)
+            sub_manager = inactive.__parent__
+            sub_manager.deactivateSubscription(inactive)
+            assert_that(query_subscription_index(sub_manager), has_length(4))
+
+            user = User.get_user(self.default_username)
+            for event, expected in ((ObjectAddedEvent(user), added),
+                                    (ObjectModifiedEvent(user), [modified])):
+                delivered = subscriptions_to_deliver(sub_manager, user, event)
+                assert_that(delivered, contains_inanyorder(*expected))
+                assert_that(delivered,
+                            contains_inanyorder(*sub_manager.subscriptionsToDeliver(user, event)))
+
+            # Without a complete index, the registry is used
+            query_subscription_index(sub_manager).unindex(added[0].__name__)
+            assert_that(subscriptions_to_deliver(sub_manager, user, ObjectAddedEvent(user)),
+                        contains_inanyorder(*added))
+
+    @WithSharedApplicationMockDS(users=True)
+    def test_has_active_subscriptions(self):
+        with mock_ds.mock_db_trans(self.ds, site_name="janux.ou.edu"):
+            user = User.get_user(self.default_username)
+            assert_that(has_active_subscriptions(user, IObjectRemovedEvent), is_(False))
+
+            subscription = self._subscribe(IUser, IObjectRemovedEvent)
+            assert_that(has_active_subscriptions(user, IObjectRemovedEvent), is_(True))
+
+            subscription.__parent__.deactivateSubscription(subscription)
+            assert_that(has_active_subscriptions(user, IObjectRemovedEvent), is_(False))
@@ -5,20 +5,24 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import csv
 import json
 import uuid
 
 import time
 
 import shutil
+import unittest
 
 from hamcrest import anything
 from hamcrest import assert_that
 from hamcrest import contains
+from hamcrest import greater_than_or_equal_to
 from hamcrest import has_entries
 from hamcrest import has_key
 from hamcrest import has_length
 from hamcrest import is_
+from hamcrest import none
 from hamcrest import not_
 from hamcrest import not_none
 
@@ -26,12 +30,36 @@ from zope import component
 
 from zope.component.hooks import getSite
 
+from zope.event import notify
+
+from zope.lifecycleevent import ObjectModifiedEvent
+
+from zope.securitypolicy.interfaces import IPrincipalPermissionManager
 from zope.securitypolicy.interfaces import IPrincipalRoleManager
 
 from nti.app.products.courseware.tests import PersistentInstructedCourseApplicationTestLayer
 
+from nti.app.products.zapier.attempts import attempt_payload
+
+from nti.app.products.zapier.batching import flush_batch
+
+from nti.app.products.zapier.coalescing import query_pending_flushes
+from nti.app.products.zapier.coalescing import sweep_flushes
+
+from nti.app.products.zapier.interfaces import IDeliveryAttemptRetentionPolicy
+from nti.app.products.zapier.interfaces import IDeliveryBatching
+from nti.app.products.zapier.interfaces import IDeliveryCoalescing
+from nti.app.products.zapier.interfaces import ISubscriptionIndex
+
+from nti.app.products.zapier.retention import DEFAULT_MAX_AGE
+from nti.app.products.zapier.retention import DEFAULT_RETENTION_POLICY
+from nti.app.products.zapier.retention import DeliveryAttemptRetentionPolicy
+
 from nti.app.products.zapier.tests import ZapierTestMixin
 
+from nti.app.products.zapier.views import _BATCH_PLACEHOLDER
+from nti.app.products.zapier.views import _BatchWindow
+
 from nti.app.testing.application_webtest import ApplicationLayerTest
 
 from nti.app.testing.decorators import WithSharedApplicationMockDS
@@ -62,6 +90,26 @@ from nti.webhooks.testing import begin_synchronous_delivery
 from nti.webhooks.testing import mock_delivery_to
 
 
+class TestBatchWindow(unittest.TestCase):
+
+    def test_window(self):
+        window = _BatchWindow(10, 4, [u'a', u'b'])
+        assert_that(window, has_length(10))
+        assert_that(window[4], is_(u'a'))
+        assert_that(window[-5], is_(u'b'))
+        assert_that(window[0], is_(_BATCH_PLACEHOLDER))
+        assert_that(window[3:6],
+                    contains(_BATCH_PLACEHOLDER, u'a', u'b'))
+        assert_that(list(window)[4:7],
+                    contains(u'a', u'b', _BATCH_PLACEHOLDER))
+        with self.assertRaises(IndexError):
+            window[10]  # pylint: disable=pointless-statement
+
+        # Only as far as the next batch is needed
+        assert_that(window.needed(2), is_(8))
+        assert_that(window.needed(10), is_(10))
+
+
 class TestResolveMe(ApplicationLayerTest, ZapierTestMixin):
 
     default_origin = 'https://alpha.nextthought.com'
@@ -96,6 +144,14 @@ class TestResolveMe(ApplicationLayerTest, ZapierTestMixin):
             u"LastLogin": not_none(),
         }))
 
+        res = self._call_FUT(extra_environ=user_env,
+                             params={'fields': 'Username,Email'})
+        assert_that(res.json_body, has_entries({
+            u"Username": u"booradley",
+            u"Email": u"boo@maycomb.com",
+        }))
+        assert_that(res.json_body, not_(has_key(u"Realname")))
+
     @WithSharedApplicationMockDS(testapp=True)
     def test_failure(self):
         self.testapp.get(b'/dataserver2/zapier/resolve_me',
@@ -114,6 +170,9 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
                              created_time=None,
                              status_message=None,
                              active=True,
+                             coalesce_window=None,
+                             batch_size=None,
+                             batch_window=None,
                              **kwargs):
         workspace_kwargs = dict()
         if 'extra_environ' in kwargs:
@@ -122,10 +181,15 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
                                                    **workspace_kwargs)
 
         path = b'/'.join(filter(None, (base_create_path, obj_type, event_type)))
+        data = {"target": target_url}
+        if coalesce_window:
+            data["coalesce_window"] = coalesce_window
+        if batch_size:
+            data["batch_size"] = batch_size
+        if batch_window:
+            data["batch_window"] = batch_window
         res = self.testapp.post_json(path,
-                                     {
-                                         "target": target_url
-                                     },
+                                     data,
                                      **kwargs)
 
         if created_time or status_message or not active:
@@ -142,6 +206,8 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
                 if status_message:
                     subscription.status_message = status_message
 
+                notify(ObjectModifiedEvent(subscription))
+
         return res
 
     @WithSharedApplicationMockDS(users=True,
@@ -425,6 +491,112 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
             subscription = find_object_with_ntiid(subscription_ntiid)
             assert_that(subscription, has_length(0))
 
+        self._update_progress()
+
+        with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
+            subscription = find_object_with_ntiid(subscription_ntiid)
+            assert_that(subscription, has_length(1))
+
+    @WithSharedApplicationMockDS(users=True,
+                                 testapp=True,
+                                 default_authenticate=True)
+    def test_course_progress_coalesced(self):
+        target_url = "https://localhost/handle_new_user"
+        res = self._create_subscription("course", "progress_updated", target_url,
+                                        coalesce_window=3600)
+        assert_that(res.json_body, has_entries("CoalesceWindow", 3600))
+
+        subscription_ntiid = res.json_body['Id']
+        self._update_progress()
+
+        # Held until the window ends
+        with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
+            subscription = find_object_with_ntiid(subscription_ntiid)
+            assert_that(subscription, has_length(0))
+            assert_that(IDeliveryCoalescing(subscription), has_length(1))
+            # Recorded so any process can flush it
+            assert_that(query_pending_flushes(subscription.__parent__),
+                        has_length(1))
+
+        # Not swept before the window ends...
+        assert_that(sweep_flushes(self.ds.db), is_(0))
+        # ...but once it has
+        assert_that(sweep_flushes(self.ds.db, now=time.time() + 3600),
+                    is_(1))
+
+        with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
+            subscription = find_object_with_ntiid(subscription_ntiid)
+            assert_that(subscription, has_length(1))
+            assert_that(IDeliveryCoalescing(subscription), has_length(0))
+            assert_that(query_pending_flushes(subscription.__parent__),
+                        has_length(0))
+            assert_that(json.loads(attempt_payload(subscription.values()[0])),
+                        has_entries('UpdateCount', greater_than_or_equal_to(1)))
+
+        # Only some event types support coalescing
+        res = self._create_subscription("user", "created", target_url,
+                                        coalesce_window=3600,
+                                        status=422)
+        assert_that(res.json_body, has_entries({
+            "message": "Deliveries for this event type cannot be coalesced.",
+        }))
+
+    @WithSharedApplicationMockDS(users=True,
+                                 testapp=True,
+                                 default_authenticate=True)
+    def test_user_created_batched(self):
+        target_url = "https://localhost/handle_new_user_batch"
+        res = self._create_subscription("user", "created", target_url,
+                                        batch_size=2,
+                                        batch_window=3600)
+        assert_that(res.json_body, has_entries(BatchSize=2, BatchWindow=3600))
+        subscription_ntiid = res.json_body['Id']
+
+        _clear_mocks()
+        mock_delivery_to(target_url, status=200)
+        self._do_create_user(u'batch.one', u'Batch One')
+
+        # Held until the batch fills
+        with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
+            subscription = find_object_with_ntiid(subscription_ntiid)
+            assert_that(subscription, has_length(1))
+            assert_that([x.status for x in subscription.values()],
+                        contains('pending'))
+            assert_that(IDeliveryBatching(subscription), has_length(1))
+
+        self._do_create_user(u'batch.two', u'Batch Two')
+
+        # Each attempt resolved by the one request
+        with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
+            subscription = find_object_with_ntiid(subscription_ntiid)
+            assert_that([x.status for x in subscription.values()],
+                        contains('successful', 'successful'))
+            assert_that(IDeliveryBatching(subscription), has_length(0))
+            assert_that(json.loads(subscription.values()[0].request.body),
+                        has_entries('Data', has_entries('Username', 'batch.one')))
+            oid = subscription._p_oid
+
+        # Or until the window ends
+        self._do_create_user(u'batch.three', u'Batch Three')
+        next_deadline = flush_batch(self.ds.db, 'janux.ou.edu', oid,
+                                    now=time.time() + 3600)
+        assert_that(next_deadline, is_(none()))
+
+        with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
+            subscription = find_object_with_ntiid(subscription_ntiid)
+            assert_that([x.status for x in subscription.values()],
+                        contains('successful', 'successful', 'successful'))
+
+        # Not along with coalescing
+        res = self._create_subscription("course", "progress_updated", target_url,
+                                        coalesce_window=3600,
+                                        batch_size=10,
+                                        status=422)
+        assert_that(res.json_body, has_entries({
+            "message": "Deliveries cannot be both coalesced and batched.",
+        }))
+
+    def _update_progress(self):
         with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
             import uuid
             user = self._create_user(uuid.uuid4().hex,
@@ -452,10 +624,6 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
                 path = enumeration.root.absolute_path + "/Courses/ZapierTestKey"
                 shutil.rmtree(path, True)
 
-        with mock_ds.mock_db_trans(site_name="janux.ou.edu"):
-            subscription = find_object_with_ntiid(subscription_ntiid)
-            assert_that(subscription, has_length(1))
-
     @WithSharedApplicationMockDS(users=('site.admin.one',
                                         'site.admin.two',
                                         'non.admin'),
@@ -474,9 +642,10 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
 
         target_one = "https://localhost/handle_new_user_one"
         created_time = time.time()
-        self._create_subscription("user", "created", target_one,
-                                  extra_environ=site_admin_one_env,
-                                  created_time=created_time)
+        subscription_one_ntiid = \
+            self._create_subscription("user", "created", target_one,
+                                      extra_environ=site_admin_one_env,
+                                      created_time=created_time).json_body['Id']
 
         res = self.testapp.get(b'/dataserver2/zapier/subscriptions',
                                extra_environ=site_admin_one_env).json_body
@@ -544,6 +713,54 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
         self.forbid_link_with_rel(res, 'batch-next')
         self.require_link_href_with_rel(res, 'batch-prev')
 
+        #   Conditional requests
+        res = self.testapp.get(subscription_url)
+        list_etag = res.headers['ETag']
+        self.testapp.get(subscription_url,
+                         headers={'If-None-Match': list_etag},
+                         status=304)
+        self.testapp.get(subscription_url,
+                         params={'batchSize': '1'},
+                         headers={'If-None-Match': list_etag},
+                         status=200)
+
+        #   Counts
+        for params in ({'count_only': 'true'}, {'batchSize': '0'}):
+            res = self.testapp.get(subscription_url, params=params).json_body
+            assert_that(res, has_entries(Total=3, ItemCount=0, Items=has_length(0)))
+        res = self.testapp.get(subscription_url,
+                               params={'count_only': 'true'},
+                               extra_environ=site_admin_two_env).json_body
+        assert_that(res, has_entries(Total=1, ItemCount=0))
+
+        #   Cursors
+        res = self.testapp.get(subscription_url,
+                               params={'batchSize': '2',
+                                       'cursor': '',
+                                       'sortOrder': 'descending'}).json_body
+        assert_that(res['Total'], is_(3))
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(target_three, target_two))
+        next_url = self.require_link_href_with_rel(res, 'next')
+        res = self.testapp.get(next_url).json_body
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(target_one))
+        self.forbid_link_with_rel(res, 'next')
+
+        #   Offset batches may continue with a cursor
+        res = self.testapp.get(subscription_url,
+                               params={'batchSize': '1'}).json_body
+        next_url = self.require_link_href_with_rel(res, 'next')
+        res = self.testapp.get(next_url).json_body
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(target_two))
+
+        #   Cursors are only valid for the ordering they were created for
+        self.testapp.get(next_url + '&sortOn=target', status=422)
+        self.testapp.get(subscription_url,
+                         params={'cursor': 'invalid'},
+                         status=422)
+
         # Test sorting
         def assert_order(params, expected, key='Target'):
             res_ = self.testapp.get(subscription_url,
@@ -573,6 +790,246 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
                      (False, True, True),
                      key='Active')
 
+        # Filtering
+        assert_order({'active': 'false'}, (target_three,))
+        assert_order({'active': 'true'}, (target_one, target_two))
+        assert_order({'owner': 'site.admin.one'}, (target_one,))
+        assert_order({'target_host': 'LOCALHOST'},
+                     (target_one, target_two, target_three))
+        assert_order({'target_host': 'example.com'}, ())
+        assert_order({'event': 'user.created', 'active': 'true',
+                      'sortOrder': 'descending'},
+                     (target_two, target_one))
+        assert_order({'event': 'course.progress_updated'}, ())
+        res = self.testapp.get(subscription_url,
+                               params={'active': 'true',
+                                       'count_only': 'true'}).json_body
+        assert_that(res, has_entries(Total=2, ItemCount=0))
+        res = self.testapp.get(subscription_url,
+                               params={'active': 'true'},
+                               extra_environ=site_admin_two_env).json_body
+        assert_that(res['Total'], is_(1))
+        res = self.testapp.get(subscription_url,
+                               params={'owner': 'site.admin.one'},
+                               extra_environ=site_admin_two_env).json_body
+        assert_that(res['Total'], is_(0))
+        self.testapp.get(subscription_url,
+                         params={'event': 'user.invalid'},
+                         status=422)
+
+        # Projection
+        res = self.testapp.get(subscription_url,
+                               params={'fields': 'Id,Target,CreatedTime,href,to'})
+        res = res.json_body
+        assert_that(res['Items'], has_length(3))
+        assert_that(res['Items'][0], has_entries({
+            "Target": target_one,
+            "Id": not_none(),
+            "CreatedTime": not_none(),
+            "href": not_none(),
+        }))
+        assert_that(res['Items'][0], not_(has_key("Active")))
+        assert_that(res['Items'][0], not_(has_key("OwnerId")))
+        assert_that(res['Items'][0], not_(has_key("to")))
+        assert_that(res['Items'][0], not_(has_key("Links")))
+
+        # Subscriptions with custom grants are checked in full
+        res = self.testapp.get(subscription_url,
+                               extra_environ=site_admin_two_env).json_body
+        assert_that(res['Total'], is_(1))
+        with mock_ds.mock_db_trans():
+            subscription = find_object_with_ntiid(subscription_one_ntiid)
+            prin_perm = IPrincipalPermissionManager(subscription)
+            prin_perm.grantPermissionToPrincipal('zope.View', 'site.admin.two')
+            index = ISubscriptionIndex(subscription.__parent__)
+            index.mark_custom_security(subscription.__name__)
+
+        res = self.testapp.get(subscription_url,
+                               extra_environ=site_admin_two_env).json_body
+        assert_that(res['Total'], is_(2))
+
+        # Changes to the index change the ETag
+        self.testapp.get(subscription_url,
+                         headers={'If-None-Match': list_etag},
+                         status=200)
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(target_one, target_two))
+
+        # Grants on the manager apply to every subscription with the
+        # default grants, changing the ETag
+        res = self.testapp.get(subscription_url,
+                               params={'sortOn': 'target'},
+                               extra_environ=site_admin_two_env)
+        site_admin_etag = res.headers['ETag']
+        self.testapp.get(subscription_url,
+                         params={'sortOn': 'target'},
+                         headers={'If-None-Match': site_admin_etag},
+                         extra_environ=site_admin_two_env,
+                         status=304)
+        with mock_ds.mock_db_trans():
+            subscription = find_object_with_ntiid(subscription_one_ntiid)
+            prin_perm = IPrincipalPermissionManager(subscription.__parent__)
+            prin_perm.grantPermissionToPrincipal('zope.View', 'site.admin.two')
+
+        res = self.testapp.get(subscription_url,
+                               params={'sortOn': 'target'},
+                               headers={'If-None-Match': site_admin_etag},
+                               extra_environ=site_admin_two_env,
+                               status=200).json_body
+        assert_that(res['Total'], is_(3))
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(target_one, target_three, target_two))
+        res = self.testapp.get(subscription_url,
+                               params={'count_only': 'true'},
+                               extra_environ=site_admin_two_env).json_body
+        assert_that(res['Total'], is_(3))
+
+        # As do changes to the grants of subscriptions with custom grants
+        res = self.testapp.get(subscription_url,
+                               extra_environ=site_admin_two_env)
+        site_admin_etag = res.headers['ETag']
+        with mock_ds.mock_db_trans():
+            subscription = find_object_with_ntiid(subscription_one_ntiid)
+            prin_perm = IPrincipalPermissionManager(subscription)
+            prin_perm.denyPermissionToPrincipal('zope.View', 'site.admin.two')
+
+        res = self.testapp.get(subscription_url,
+                               headers={'If-None-Match': site_admin_etag},
+                               extra_environ=site_admin_two_env,
+                               status=200).json_body
+        assert_that(res['Total'], is_(2))
+
+    @WithSharedApplicationMockDS(users=('site.admin.one',),
+                                 testapp=True,
+                                 default_authenticate=True)
+    def test_list_all_sites(self):
+        site_admin_env = self._make_extra_environ(username='site.admin.one')
+        with mock_ds.mock_db_trans(site_name='janux.ou.edu'):
+            self._make_site_admins('site.admin.one')
+
+        janux_target = "https://localhost/handle_janux_user"
+        alpha_target = "https://localhost/handle_alpha_user"
+        self._create_subscription("user", "created", janux_target)
+        alpha_env = self._make_extra_environ(HTTP_ORIGIN='https://alpha.nextthought.com')
+        self._create_subscription("user", "created", alpha_target,
+                                  extra_environ=alpha_env)
+
+        subscription_url = b'/dataserver2/zapier/subscriptions'
+        res = self.testapp.get(subscription_url).json_body
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(janux_target))
+
+        res = self.testapp.get(subscription_url,
+                               params={'all_sites': 'true',
+                                       'sortOn': 'target'}).json_body
+        assert_that(res['Total'], is_(2))
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(alpha_target, janux_target))
+
+        # Paging across sites
+        res = self.testapp.get(subscription_url,
+                               params={'all_sites': 'true',
+                                       'sortOn': 'target',
+                                       'sortOrder': 'descending',
+                                       'batchSize': '1',
+                                       'cursor': ''}).json_body
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(janux_target))
+        res = self.testapp.get(self.require_link_href_with_rel(res, 'next')).json_body
+        assert_that([item['Target'] for item in res['Items']],
+                    contains(alpha_target))
+        self.forbid_link_with_rel(res, 'next')
+
+        # Only NTI admins may list all sites
+        self.testapp.get(subscription_url,
+                         params={'all_sites': 'true'},
+                         extra_environ=site_admin_env,
+                         status=403)
+
+    @WithSharedApplicationMockDS(users=('site.admin.one',),
+                                 testapp=True,
+                                 default_authenticate=True)
+    def test_export(self):
+        site_admin_env = self._make_extra_environ(username='site.admin.one')
+        with mock_ds.mock_db_trans(site_name='janux.ou.edu'):
+            self._make_site_admins('site.admin.one')
+
+        target_one = "https://localhost/handle_new_user_one"
+        target_two = "https://localhost/handle_new_user_two"
+        ntiids = [self._create_subscription("user", "created", target).json_body['Id']
+                  for target in (target_one, target_two)]
+
+        _clear_mocks()
+        mock_delivery_to(target_one, status=200)
+        mock_delivery_to(target_two, status=200)
+        self._do_create_user(u'user.one', u'User One')
+
+        export_url = b'/dataserver2/zapier/export_subscriptions'
+        res = self.testapp.get(export_url)
+        assert_that(res.content_type, is_('application/x-ndjson'))
+        lines = [json.loads(line) for line in res.body.splitlines()]
+        assert_that(sorted(line['Id'] for line in lines),
+                    contains(*sorted(ntiids)))
+        assert_that(lines[0], has_entries({
+            "Class": "WebhookSubscription",
+            "Target": anything(),
+            "OwnerId": not_none(),
+        }))
+        assert_that(lines[0], not_(has_key("Links")))
+
+        res = self.testapp.get(export_url, params={'attempts': 'true'})
+        lines = [json.loads(line) for line in res.body.splitlines()]
+        assert_that(lines, has_length(4))
+        for subscription, attempt in (lines[:2], lines[2:]):
+            assert_that(attempt, has_entries({
+                "Subscription": subscription['Id'],
+                "status": "successful",
+            }))
+
+        # Only NTI admins may export
+        self.testapp.get(export_url, extra_environ=site_admin_env, status=403)
+
+    @WithSharedApplicationMockDS(users=('site.admin.one',),
+                                 testapp=True,
+                                 default_authenticate=True)
+    def test_compact_dry_run(self):
+        site_admin_env = self._make_extra_environ(username='site.admin.one')
+        with mock_ds.mock_db_trans(site_name='janux.ou.edu'):
+            self._make_site_admins('site.admin.one')
+
+        target = "https://localhost/handle_new_user"
+        ntiid = self._create_subscription("user", "created", target).json_body['Id']
+
+        _clear_mocks()
+        mock_delivery_to(target, status=200)
+        self._do_create_user(u'user.one', u'User One')
+        self._do_create_user(u'user.two', u'User Two')
+
+        compact_url = b'/dataserver2/zapier/compact_delivery_attempts'
+        res = self.testapp.post(compact_url, params={'dry_run': 'true'}).json_body
+        assert_that(res, has_entries(DryRun=True,
+                                     MaxAttempts=None,
+                                     MaxAge=DEFAULT_MAX_AGE,
+                                     Total=0))
+
+        policy = DeliveryAttemptRetentionPolicy(max_attempts=1)
+        component.provideUtility(policy, IDeliveryAttemptRetentionPolicy)
+        try:
+            res = self.testapp.post(compact_url,
+                                    params={'dry_run': 'true'}).json_body
+        finally:
+            component.getGlobalSiteManager().registerUtility(
+                DEFAULT_RETENTION_POLICY, IDeliveryAttemptRetentionPolicy)
+        assert_that(res, has_entries(DryRun=True, MaxAttempts=1, Total=1))
+
+        # Nothing was removed
+        with mock_ds.mock_db_trans(site_name='janux.ou.edu'):
+            subscription = find_object_with_ntiid(ntiid)
+            assert_that(subscription, has_length(2))
+
+        # Only NTI admins may compact
+        self.testapp.post(compact_url, extra_environ=site_admin_env, status=403)
+
     @WithSharedApplicationMockDS(users=("site.admin.one",
                                         "site.admin.two"),
                                  testapp=True,
@@ -621,6 +1078,92 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
         admin_res = self.testapp.get(res.json_body['href'], extra_environ=admin_env)
         history_url = self.require_link_href_with_rel(admin_res.json_body, "delivery_history")
 
+        # Health
+        health_url = self.require_link_href_with_rel(res.json_body, "health")
+        self.testapp.get(health_url, extra_environ=site_admin_two_env, status=403)
+        health = self.testapp.get(health_url,
+                                  extra_environ=site_admin_one_env).json_body
+        assert_that(health, has_entries({
+            "Attempts": 2,
+            "Successes": 1,
+            "Failures": 1,
+            "SuccessRate": 0.5,
+            "ConsecutiveFailures": 0,
+            "LastSuccess": not_none(),
+            "LastFailure": not_none(),
+            "LatencyP50": anything(),
+            "LatencyP95": anything(),
+        }))
+
+        site_health_url = b'/dataserver2/zapier/subscription_health'
+        self.testapp.get(site_health_url,
+                         extra_environ=site_admin_one_env,
+                         status=403)
+        site_health = self.testapp.get(site_health_url,
+                                       extra_environ=admin_env).json_body
+        assert_that(site_health, has_entries({
+            "Attempts": 2,
+            "Successes": 1,
+            "FailingCount": 0,
+            "Failing": has_length(0),
+        }))
+        assert_that(site_health, not_(has_key("ConsecutiveFailures")))
+
+        # Delivery statistics
+        stats_url = self.require_link_href_with_rel(res.json_body, "delivery_stats")
+        self.testapp.get(stats_url, extra_environ=site_admin_two_env, status=403)
+        stats = self.testapp.get(stats_url,
+                                 params={'interval': 'day'},
+                                 extra_environ=site_admin_one_env).json_body
+        assert_that(stats, has_entries(Interval='day', Items=has_length(1)))
+        assert_that(stats['Items'][0], has_entries({
+            "Start": not_none(),
+            "Attempts": 2,
+            "Successes": 1,
+            "Failures": 1,
+        }))
+        self.testapp.get(stats_url,
+                         params={'interval': 'week'},
+                         extra_environ=site_admin_one_env,
+                         status=422)
+        stats = self.testapp.get(stats_url,
+                                 params={'until': '2000-01-01T00:00:00Z'},
+                                 extra_environ=site_admin_one_env).json_body
+        assert_that(stats['Items'], has_length(0))
+
+        site_stats_url = b'/dataserver2/zapier/delivery_stats'
+        self.testapp.get(site_stats_url,
+                         extra_environ=site_admin_one_env,
+                         status=403)
+        stats = self.testapp.get(site_stats_url, extra_environ=admin_env).json_body
+        assert_that(sum(x['Attempts'] for x in stats['Items']), is_(2))
+
+        # Site delivery failures
+        failures_url = b'/dataserver2/zapier/delivery_failures'
+        self.testapp.get(failures_url,
+                         extra_environ=site_admin_one_env,
+                         status=403)
+        failures = self.testapp.get(failures_url,
+                                    params={'batchSize': 1},
+                                    extra_environ=admin_env).json_body
+        assert_that(failures, has_entries(Total=1, ItemCount=1))
+        assert_that(failures['Items'][0], has_entries(status='failed',
+                                                      Subscription=subscription_ntiid))
+        self.forbid_link_with_rel(failures, "next")
+        failures = self.testapp.get(failures_url,
+                                    params={'until': '2000-01-01T00:00:00Z'},
+                                    extra_environ=admin_env).json_body
+        assert_that(failures, has_entries(Total=0, Items=has_length(0)))
+        res = self.testapp.get(failures_url,
+                               headers={'Accept': 'text/csv'},
+                               extra_environ=admin_env)
+        assert_that(res.content_type, is_('text/csv'))
+        rows = list(csv.DictReader(res.text.splitlines()))
+        assert_that(rows, has_length(1))
+        assert_that(rows[0], has_entries(Subscription=subscription_ntiid,
+                                          Status='failed',
+                                          StatusCode='403'))
+
         # Only owner and nti admins can fetch
         self.testapp.get(history_url, extra_environ=site_admin_two_env, status=403)
 
@@ -656,10 +1199,65 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
         assert_that(res['Items'], has_length(1))
         assert_that(res['Items'][0], has_entries(status='successful'))
 
+        res = self.testapp.get(history_url,
+                               params={
+                                   'search': 'ok',
+                                   'cursor': '',
+                                   'sortOrder': 'descending'
+                               },
+                               extra_environ=admin_env).json_body
+        assert_that(res, has_entries(Total=1, ItemCount=1))
+        assert_that(res['Items'][0], has_entries(status='successful'))
+
+        # CSV
+        res = self.testapp.get(history_url,
+                               params={'sortOrder': 'descending'},
+                               headers={'Accept': 'text/csv'},
+                               extra_environ=admin_env)
+        assert_that(res.content_type, is_('text/csv'))
+        rows = list(csv.DictReader(res.text.splitlines()))
+        assert_that([row['Status'] for row in rows],
+                    contains('pending', 'successful', 'failed'))
+        assert_that(rows[1], has_entries(Subscription=subscription_ntiid,
+                                          StatusCode='200'))
+        res = self.testapp.get(history_url,
+                               params={'search': 'ok'},
+                               headers={'Accept': 'text/csv'},
+                               extra_environ=admin_env)
+        assert_that(list(csv.DictReader(res.text.splitlines())), has_length(1))
+        self.testapp.get(history_url,
+                         headers={'Accept': 'text/csv'},
+                         extra_environ=site_admin_two_env,
+                         status=403)
+
+        # Time windows
+        def history_total(params):
+            params = dict(params, count_only='true')
+            return self.testapp.get(history_url,
+                                    params=params,
+                                    extra_environ=admin_env).json_body['Total']
+        assert_that(history_total({'since': '2000-01-01T00:00:00Z'}), is_(3))
+        assert_that(history_total({'since': '2000-01-01T00:00:00Z',
+                                   'search': 'ok'}), is_(1))
+        assert_that(history_total({'until': '2000-01-01T00:00:00Z'}), is_(0))
+        assert_that(history_total({'since': '2999-01-01T00:00'}), is_(0))
+        res = self.testapp.get(history_url,
+                               params={'since': '2000-01-01T00:00:00Z',
+                                       'sortOn': 'status'},
+                               extra_environ=admin_env).json_body
+        assert_that([item['status'] for item in res['Items']],
+                    contains('failed', 'pending', 'successful'))
+        self.testapp.get(history_url,
+                         params={'since': 'yesterday'},
+                         extra_environ=admin_env,
+                         status=422)
+
         # Fetch delivery response
         response_url = self.require_link_href_with_rel(res['Items'][0], 'delivery_response')
         res = self.testapp.get(response_url, extra_environ=admin_env).json_body
         assert_that(res['status_code'], is_(200))
+        assert_that(res, has_entries(BodyLength=anything(),
+                                     BodyTruncated=False))
 
         # Again, only NTI admins and owners can access
         self.testapp.get(response_url, extra_environ=site_admin_two_env, status=403)
@@ -696,6 +1294,59 @@ class TestSubscriptions(ApplicationLayerTest, ZapierTestMixin):
         assert_order({'sortOn': 'status', 'sortOrder': 'ascending'},
                      (usernames[0], None, usernames[1]))
 
+        # Batches from the attempt index
+        res = self.testapp.get(history_url,
+                               params={'sortOn': 'status',
+                                       'batchSize': '1',
+                                       'batchStart': '1'},
+                               extra_environ=admin_env).json_body
+        assert_that(res, has_entries(Total=3, ItemCount=1))
+        assert_that([item['status'] for item in res['Items']],
+                    contains('pending'))
+        next_url = self.require_link_href_with_rel(res, 'next')
+        res = self.testapp.get(next_url, extra_environ=admin_env).json_body
+        assert_that([item['status'] for item in res['Items']],
+                    contains('successful'))
+
+        # Conditional requests
+        res = self.testapp.get(history_url, extra_environ=admin_env)
+        history_etag = res.headers['ETag']
+        self.testapp.get(history_url,
+                         headers={'If-None-Match': history_etag},
+                         extra_environ=admin_env,
+                         status=304)
+
+        # Counts
+        res = self.testapp.get(history_url,
+                               params={'count_only': 'true'},
+                               extra_environ=admin_env).json_body
+        assert_that(res, has_entries(Total=3, ItemCount=0, Items=has_length(0)))
+        res = self.testapp.get(history_url,
+                               params={'batchSize': '0', 'search': 'OK'},
+                               extra_environ=admin_env).json_body
+        assert_that(res, has_entries(Total=1, ItemCount=0))
+
+        # Cursors
+        res = self.testapp.get(history_url,
+                               params={'batchSize': '2',
+                                       'cursor': '',
+                                       'sortOrder': 'descending'},
+                               extra_environ=admin_env).json_body
+        assert_that([item['status'] for item in res['Items']],
+                    contains('pending', 'successful'))
+        next_url = self.require_link_href_with_rel(res, 'next')
+        res = self.testapp.get(next_url, extra_environ=admin_env).json_body
+        assert_that([item['status'] for item in res['Items']],
+                    contains('failed'))
+        self.forbid_link_with_rel(res, 'next')
+
+        # New delivery attempts change the ETag
+        self._do_create_user(u'user.four', u'User Four')
+        self.testapp.get(history_url,
+                         headers={'If-None-Match': history_etag},
+                         extra_environ=admin_env,
+                         status=200)
+
     def _make_site_admins(self, *users):
         prm = IPrincipalRoleManager(getSite())
         for user in users:
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import calendar
+
+from pyramid import httpexceptions as hexc
+
+from zope.cachedescriptors.property import Lazy
+
+from zope.schema.interfaces import ValidationError
+
+from nti.app.externalization.error import raise_json_error
+
+from nti.app.products.zapier import MessageFactory as _
+
+from nti.app.products.zapier.externalization import requested_fields
+from nti.app.products.zapier.externalization import to_external_fields
+
+from nti.externalization.datetime import datetime_from_string
+
+from nti.externalization.interfaces import StandardExternalFields
+
+ITEMS = StandardExternalFields.ITEMS
+
+logger = __import__('logging').getLogger(__name__)
+
+
+class ChangeTokenETagMixin(object):
+    """
+    Answer conditional ``GET`` requests from a cheap change token, before
+    doing any of the work of producing the representation.
+
+    The ETag combines the change token with the remote user and the query
+    string, as those also determine what is returned.
+    """
+
+    def _change_token(self):
+        """
+        Return a tuple of simple values that changes whenever the content
+        of the listing does, or None if no such token is available.
+        """
+        raise NotImplementedError()
+
+    def _etag(self):
+        token = self._change_token()
+        if token is None:
+            return None
+        token = (token,
+                 self.remoteUser.username if self.remoteUser is not None else None,
+                 self.request.query_string)
+        return hashlib.md5(repr(token).encode('utf-8')).hexdigest()
+
+    def _check_not_modified(self):
+        """
+        Raise :class:`pyramid.httpexceptions.HTTPNotModified` if the
+        request's ``If-None-Match`` matches our current ETag. Otherwise,
+        set the ETag on the response.
+        """
+        etag = self._etag()
+        if etag is None:
+            return
+        if etag in self.request.if_none_match:
+            not_modified = hexc.HTTPNotModified()
+            not_modified.etag = etag
+            raise not_modified
+        self.request.response.etag = etag
+
+
+class FieldProjectionMixin(object):
+    """
+    Return only the external fields requested with the ``fields``
+    parameter, computing no others.
+    """
+
+    #: The name of the externalizers to use.
+    _projection_name = ''
+
+    _projection_policy_name = 'zapier'
+
+    @Lazy
+    def requested_fields(self):
+        return requested_fields(self.request)
+
+    def _project(self, obj):
+        return to_external_fields(obj, self.requested_fields,
+                                  name=self._projection_name,
+                                  policy_name=self._projection_policy_name)
+
+    def _project_result(self, result):
+        """
+        If fields were requested, return the projection of *result*, or,
+        if it is a mapping of ``Items``, replace those with their
+        projections. Otherwise, return *result* as is.
+        """
+        if self.requested_fields is None:
+            return result
+        if isinstance(result, dict):
+            if ITEMS in result:
+                result[ITEMS] = [self._project(x) for x in result[ITEMS]]
+            return result
+        return self._project(result)
+
+
+class TimeWindowMixin(object):
+    """
+    Read the ``since`` and ``until`` parameters, ISO 8601 times taken to
+    be in UTC if they have no timezone, as timestamps.
+    """
+
+    def _time_param(self, name):
+        value = self.request.params.get(name)
+        if not value:
+            return None
+        try:
+            value = datetime_from_string(value)
+        except (ValidationError, ValueError):
+            raise_json_error(self.request,
+                             hexc.HTTPUnprocessableEntity,
+                             {
+                                 'message': _(u"Invalid time."),
+                                 'field': name,
+                             },
+                             None)
+        return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+
+    @Lazy
+    def time_window(self):
+        """
+        The ``(since, until)`` timestamps requested, either may be None.
+        """
+        return self._time_param('since'), self._time_param('until')
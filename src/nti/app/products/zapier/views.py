@@ -5,7 +5,16 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from operator import attrgetter
+import time
+import numbers
+
+from binascii import unhexlify
+
+from itertools import chain
+from itertools import islice
+from itertools import repeat
+
+import six
 
 from pyramid import httpexceptions as hexc
 
@@ -19,8 +28,6 @@ from zope.cachedescriptors.property import Lazy
 
 from zope.component.hooks import getSite
 
-from zope.security import checkPermission
-
 from nti.app.base.abstract_views import AbstractAuthenticatedView
 
 from nti.app.externalization.error import raise_json_error
@@ -29,17 +36,71 @@ from nti.app.externalization.view_mixins import BatchingUtilsMixin
 from nti.app.externalization.view_mixins import ModeledContentUploadRequestUtilsMixin
 
 from nti.app.products.zapier import MessageFactory as _
+from nti.app.products.zapier import DELIVERY_STATS_VIEW
+from nti.app.products.zapier import HEALTH_VIEW
+from nti.app.products.zapier import SITE_DELIVERY_FAILURES_VIEW
+from nti.app.products.zapier import SITE_DELIVERY_STATS_VIEW
+from nti.app.products.zapier import SUBSCRIPTION_HEALTH_VIEW
 from nti.app.products.zapier import SUBSCRIPTIONS_VIEW
 
+from nti.app.products.zapier.attempts import stored_body_length
+
+from nti.app.products.zapier.batching import DEFAULT_BATCH_SIZE
+from nti.app.products.zapier.batching import DEFAULT_BATCH_WINDOW
+
+from nti.app.products.zapier.export_views import delivery_attempt_csv_response
+from nti.app.products.zapier.export_views import wants_csv
+
+from nti.app.products.zapier.health import STATS_INTERVALS
+from nti.app.products.zapier.health import DeliveryHealth
+from nti.app.products.zapier.health import health_summary
+from nti.app.products.zapier.health import merged_buckets
+from nti.app.products.zapier.health import query_delivery_stats
+from nti.app.products.zapier.health import query_manager_health
+from nti.app.products.zapier.health import query_subscription_health
+from nti.app.products.zapier.health import stats_summary
+
+from nti.app.products.zapier.index import DeliveryFailureIndex
+from nti.app.products.zapier.index import SubscriptionIndex
+from nti.app.products.zapier.index import decode_cursor
+from nti.app.products.zapier.index import encode_cursor
+from nti.app.products.zapier.index import get_delivery_change_count
+from nti.app.products.zapier.index import manager_token
+from nti.app.products.zapier.index import merge_sorted
+from nti.app.products.zapier.index import message_matches
+from nti.app.products.zapier.index import message_terms
+from nti.app.products.zapier.index import query_delivery_attempt_index
+from nti.app.products.zapier.index import query_delivery_failure_index
+from nti.app.products.zapier.index import query_subscription_index
+from nti.app.products.zapier.index import trigger_key
+
+from nti.app.products.zapier.interfaces import IDeliveryBatching
+from nti.app.products.zapier.interfaces import IDeliveryCoalescing
 from nti.app.products.zapier.interfaces import IWebhookSubscriber
 from nti.app.products.zapier.interfaces import IUserDetails
 
 from nti.app.products.zapier.model import SubscriptionRequest
 
+from nti.app.products.zapier.retention import query_delivery_rollup
+
+from nti.app.products.zapier.sites import scan_host_sites
+
+from nti.app.products.zapier.subscribers import has_default_security
+
 from nti.app.products.zapier.traversal import IntegrationProviderPathAdapter
 
+from nti.app.products.zapier.view_mixins import ChangeTokenETagMixin
+from nti.app.products.zapier.view_mixins import FieldProjectionMixin
+from nti.app.products.zapier.view_mixins import TimeWindowMixin
+
+from nti.app.products.zapier.zope_security import BulkSubscriptionReadEvaluator
+
 from nti.appserver.ugd_edit_views import UGDDeleteView
 
+from nti.base._compat import text_
+
+from nti.common.string import is_true
+
 from nti.dataserver import authorization as nauth
 
 from nti.dataserver.authorization import ACT_READ
@@ -51,6 +112,10 @@ from nti.externalization import to_external_object
 from nti.externalization.interfaces import LocatedExternalDict
 from nti.externalization.interfaces import StandardExternalFields
 
+from nti.links import Link
+
+from nti.ntiids.oids import to_external_ntiid_oid
+
 from nti.webhooks.interfaces import IWebhookDeliveryAttempt
 from nti.webhooks.interfaces import IWebhookSubscription
 from nti.webhooks.interfaces import IWebhookSubscriptionManager
@@ -60,6 +125,9 @@ MIMETYPE = StandardExternalFields.MIMETYPE
 ITEMS = StandardExternalFields.ITEMS
 TOTAL = StandardExternalFields.TOTAL
 ITEM_COUNT = StandardExternalFields.ITEM_COUNT
+LINKS = StandardExternalFields.LINKS
+
+_BATCH_PLACEHOLDER = object()
 
 logger = __import__('logging').getLogger(__name__)
 
@@ -70,14 +138,19 @@ logger = __import__('logging').getLogger(__name__)
              context=IntegrationProviderPathAdapter,
              permission=ACT_READ,
              name="resolve_me")
-class AuthenticatedUserView(AbstractAuthenticatedView):
+class AuthenticatedUserView(AbstractAuthenticatedView,
+                            FieldProjectionMixin):
 
     def __call__(self):
-        return to_external_object(IUserDetails(self.remoteUser),
+        result = self._project_result(IUserDetails(self.remoteUser))
+        return to_external_object(result,
                                   policy_name='zapier')
 
 
-class SubscriptionViewMixin(AbstractAuthenticatedView):
+class SubscriptionViewMixin(AbstractAuthenticatedView,
+                            FieldProjectionMixin):
+
+    _projection_name = "zapier-webhook"
 
     @Lazy
     def is_admin(self):
@@ -91,6 +164,7 @@ class SubscriptionViewMixin(AbstractAuthenticatedView):
         raise NotImplementedError()
 
     def externalize_result(self, result):
+        result = self._project_result(result)
         return to_external_object(result,
                                   policy_name='zapier',
                                   name="zapier-webhook")
@@ -149,10 +223,34 @@ class AddSubscriptionView(AbstractSubscriptionUploadView):
         subscription = self.readCreateUpdateContentObject(creator)
         site_manager = getSite().getSiteManager()
         subscriber = self._subscriber()
+        window = getattr(subscription, 'coalesce_window', None)
+        if window and not getattr(subscriber, 'coalescable', False):
+            raise_json_error(self.request,
+                             hexc.HTTPUnprocessableEntity,
+                             {
+                                 'message': _(u"Deliveries for this event type cannot be coalesced."),
+                             },
+                             None)
+        size = getattr(subscription, 'batch_size', None)
+        batch_window = getattr(subscription, 'batch_window', None)
+        batched = bool(size or batch_window)
+        if window and batched:
+            raise_json_error(self.request,
+                             hexc.HTTPUnprocessableEntity,
+                             {
+                                 'message': _(u"Deliveries cannot be both coalesced and batched."),
+                             },
+                             None)
 
         internal_subscription = \
             subscriber.subscribe(site_manager,
                                  subscription.target)
+        if window:
+            IDeliveryCoalescing(internal_subscription).window = window
+        if batched:
+            batching = IDeliveryBatching(internal_subscription)
+            batching.size = size or DEFAULT_BATCH_SIZE
+            batching.window = batch_window or DEFAULT_BATCH_WINDOW
 
         self.request.response.status_int = 201
 
@@ -182,14 +280,351 @@ class GetSubscriptionView(SubscriptionViewMixin):
         return self.context
 
 
+@view_config(route_name='objects.generic.traversal',
+             request_method='GET',
+             renderer='rest',
+             context=IWebhookSubscription,
+             name=HEALTH_VIEW,
+             permission=nauth.ACT_READ)
+class GetSubscriptionHealthView(SubscriptionViewMixin):
+    """
+    Summarize the delivery health of the subscription: its success rate,
+    last success and failure, consecutive failures and delivery latency
+    percentiles, in seconds. The outcomes of compacted delivery attempts
+    are counted by day in ``Daily``.
+    """
+
+    def _do_call(self):
+        health = query_subscription_health(self.context) or DeliveryHealth()
+        result = health_summary(health)
+        rollup = query_delivery_rollup(self.context)
+        if rollup is not None:
+            result['Daily'] = [{'Date': day,
+                                'Successes': successes,
+                                'Failures': failures}
+                               for day, successes, failures in rollup.days()]
+        return result
+
+
+@view_config(route_name='objects.generic.traversal',
+             request_method='GET',
+             renderer='rest',
+             context=IntegrationProviderPathAdapter,
+             name=SUBSCRIPTION_HEALTH_VIEW)
+class SubscriptionHealthView(SubscriptionViewMixin):
+    """
+    Summarize the delivery health of all subscriptions for the current
+    site, along with those whose latest attempt failed. Only available to
+    NTI admins.
+    """
+
+    def _predicate(self):
+        if not self.is_admin:
+            raise hexc.HTTPForbidden(_('Cannot view subscription health.'))
+
+    def _do_call(self):
+        total = DeliveryHealth()
+        failing = []
+        evaluator = BulkSubscriptionReadEvaluator(self.remoteUser.username,
+                                                  self.is_admin)
+        utilities_in_site = component.getUtilitiesFor(IWebhookSubscriptionManager)
+        for unused_name, sub_manager in utilities_in_site:
+            health = query_manager_health(sub_manager)
+            if health is None:
+                continue
+            total.merge(health)
+            denied = evaluator.denied_names(sub_manager,
+                                            _subscription_index(sub_manager))
+            failing.extend(sub_manager[name] for name in health.failing
+                           if name not in denied and name in sub_manager)
+
+        result = health_summary(total)
+        # Not meaningful across subscriptions
+        result.pop('ConsecutiveFailures', None)
+        result['FailingCount'] = len(failing)
+        result['Failing'] = failing
+        return result
+
+
+class DeliveryStatsMixin(TimeWindowMixin):
+    """
+    Return delivery statistics by the hour or day.
+
+    interval
+            Either ``hour``, the default, or ``day``.
+
+    since
+            An ISO 8601 time from which to return statistics. Defaults to
+            24 hours, or 30 days by the day, before ``until``, or now.
+
+    until
+            An ISO 8601 time before which to return statistics.
+    """
+
+    _DEFAULT_WINDOWS = {
+        'hour': 24 * 60 * 60,
+        'day': 30 * 24 * 60 * 60,
+    }
+
+    # The statistics are not objects that may be projected
+    requested_fields = None
+
+    @Lazy
+    def interval(self):
+        interval = (self.request.params.get('interval') or 'hour').lower()
+        if interval not in STATS_INTERVALS:
+            raise_json_error(self.request,
+                             hexc.HTTPUnprocessableEntity,
+                             {
+                                 'message': _(u"Invalid interval."),
+                                 'field': 'interval',
+                             },
+                             None)
+        return interval
+
+    def _stats_result(self, all_stats):
+        since, until = self.time_window
+        if since is None:
+            since = (until or time.time()) - self._DEFAULT_WINDOWS[self.interval]
+        result = LocatedExternalDict()
+        result[MIMETYPE] = 'application/vnd.nextthought.zapier.deliverystats'
+        result[CLASS] = 'DeliveryStats'
+        result['Interval'] = self.interval
+        result[ITEMS] = [stats_summary(start, bucket)
+                         for start, bucket
+                         in merged_buckets(all_stats, self.interval, since, until)]
+        return result
+
+
+@view_config(route_name='objects.generic.traversal',
+             request_method='GET',
+             renderer='rest',
+             context=IWebhookSubscription,
+             name=DELIVERY_STATS_VIEW,
+             permission=nauth.ACT_READ)
+class GetDeliveryStatsView(DeliveryStatsMixin, SubscriptionViewMixin):
+    __doc__ = DeliveryStatsMixin.__doc__
+
+    def _do_call(self):
+        stats = query_delivery_stats(self.context)
+        return self._stats_result([stats] if stats is not None else [])
+
+
+@view_config(route_name='objects.generic.traversal',
+             request_method='GET',
+             renderer='rest',
+             context=IntegrationProviderPathAdapter,
+             name=SITE_DELIVERY_STATS_VIEW)
+class SiteDeliveryStatsView(DeliveryStatsMixin, SubscriptionViewMixin):
+    """
+    Return delivery statistics for all subscriptions for the current site,
+    as for a single subscription. Only available to NTI admins.
+    """
+
+    def _predicate(self):
+        if not self.is_admin:
+            raise hexc.HTTPForbidden(_('Cannot view delivery statistics.'))
+
+    def _do_call(self):
+        utilities_in_site = component.getUtilitiesFor(IWebhookSubscriptionManager)
+        all_stats = [query_delivery_stats(sub_manager)
+                     for unused_name, sub_manager in utilities_in_site]
+        return self._stats_result([x for x in all_stats if x is not None])
+
+
+def _count_only(request):
+    """
+    Whether only the total number of items is requested, either with the
+    ``count_only`` parameter or a ``batchSize`` of zero.
+    """
+    params = request.params
+    return is_true(params.get('count_only')) or params.get('batchSize') == '0'
+
+
+def _in_window(timestamp, since=None, until=None):
+    return (since is None or timestamp >= since) \
+        and (until is None or timestamp < until)
+
+
+def _subscription_index(sub_manager):
+    """
+    The :class:`ISubscriptionIndex` of the subscription manager, for
+    reading. Managers without one (e.g. never given a subscription) get
+    one built from their subscriptions that isn't stored, so reading
+    never stores an index.
+    """
+    index = query_subscription_index(sub_manager)
+    if index is None:
+        index = SubscriptionIndex()
+        index.rebuild(sub_manager, has_default_security)
+    return index
+
+
+def _failure_index(sub_manager):
+    """
+    The :class:`IDeliveryFailureIndex` of the subscription manager, for
+    reading, as for :func:`_subscription_index`.
+    """
+    index = query_delivery_failure_index(sub_manager)
+    if index is None:
+        index = DeliveryFailureIndex()
+        index.rebuild(sub_manager)
+    return index
+
+
+class _BatchWindow(object):
+    """
+    A sequence standing in for ``total`` sorted items of which only the
+    requested batch has been loaded. Positions outside of the batch are
+    filled with a placeholder so the batching machinery (and its links)
+    behave exactly as they would for the fully materialized sequence.
+
+    Indexing and slicing only ever touch the requested positions, and
+    iteration produces the placeholders without a Python loop. Batch it
+    with :meth:`needed`, so the batching machinery stops iterating just
+    past the batch.
+    """
+
+    def __init__(self, total, batch_start, page):
+        self.total = total
+        self.batch_start = batch_start
+        self.page = page
+
+    @property
+    def batch_end(self):
+        return self.batch_start + len(self.page)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.total))]
+        if index < 0:
+            index += self.total
+        if not 0 <= index < self.total:
+            raise IndexError(index)
+        if self.batch_start <= index < self.batch_end:
+            return self.page[index - self.batch_start]
+        return _BATCH_PLACEHOLDER
+
+    def __iter__(self):
+        return chain(repeat(_BATCH_PLACEHOLDER, min(self.batch_start, self.total)),
+                     self.page,
+                     repeat(_BATCH_PLACEHOLDER, max(self.total - self.batch_end, 0)))
+
+    def needed(self, batch_size):
+        """
+        The ``number_items_needed`` to batch with: the batch and the
+        items needed to tell whether a next batch exists.
+        """
+        return min(self.total, self.batch_start + (batch_size or 0) + 2)
+
+
+class CursorBatchingMixin(object):
+    """
+    Keyset pagination for listings ordered by a ``(value, name)`` sort key,
+    optionally followed by further string tie breakers.
+
+    When a ``cursor`` parameter is given (it may be empty for the first
+    page), the batch begins with the first item following the sort key the
+    cursor encodes, rather than at an offset. Whenever more items follow a
+    batch, a ``next`` link with the cursor for its last item is provided.
+    """
+
+    #: The types a decoded sort value may have, by sort attribute.
+    _CURSOR_VALUE_TYPES = {}
+
+    #: The number of elements in the sort key.
+    _CURSOR_KEY_LENGTH = 2
+
+    def _sort_state(self):
+        """
+        The ``(sort_on, descending)`` ordering of the listing.
+        """
+        raise NotImplementedError()
+
+    @Lazy
+    def use_cursor(self):
+        return 'cursor' in self.request.params
+
+    @Lazy
+    def cursor_key(self):
+        """
+        The sort key from which the requested batch resumes, if any.
+        """
+        cursor = self.request.params.get('cursor')
+        if not cursor:
+            return None
+        sort_on, descending = self._sort_state()
+        try:
+            key = decode_cursor(cursor, sort_on, descending)
+            if len(key) != self._CURSOR_KEY_LENGTH:
+                raise ValueError('Invalid cursor')
+            value = key[0]
+            value_types = self._CURSOR_VALUE_TYPES.get(sort_on, six.string_types)
+            if isinstance(value, bool) \
+                    or not isinstance(value, value_types) \
+                    or not all(isinstance(x, six.string_types) for x in key[1:]):
+                raise ValueError('Invalid cursor')
+        except ValueError:
+            raise_json_error(self.request,
+                             hexc.HTTPUnprocessableEntity,
+                             {
+                                 'message': _(u"Invalid cursor."),
+                             },
+                             None)
+        return key
+
+    def _add_next_link(self, result, last_key, batch_size):
+        sort_on, descending = self._sort_state()
+        params = dict(self.request.params)
+        params.pop('batchStart', None)
+        params['batchSize'] = batch_size
+        params['cursor'] = encode_cursor(sort_on, descending, last_key)
+        links = result.setdefault(LINKS, [])
+        links.append(Link(self.request.path,
+                          rel='next',
+                          params=params))
+
+
 @view_config(route_name='objects.generic.traversal',
              request_method='GET',
              renderer='rest',
              context=IntegrationProviderPathAdapter,
              name=SUBSCRIPTIONS_VIEW)
 class ListSubscriptions(SubscriptionViewMixin,
-                        AbstractAuthenticatedView,
-                        BatchingUtilsMixin):
+                        BatchingUtilsMixin,
+                        CursorBatchingMixin,
+                        ChangeTokenETagMixin):
+    """
+    List the subscriptions the remote user may read, ordered by a sort key
+    of ``(value, name, manager)``, where the manager is identified by
+    :func:`.manager_token`, to order the subscriptions of different
+    managers that tie.
+
+    all_sites
+            If true, list the subscriptions of all host sites rather than
+            just the current site. Only available to NTI admins.
+
+    count_only
+            If true, only return the total number of subscriptions, as does
+            a ``batchSize`` of zero.
+
+    active
+            If given, only list active (``true``) or inactive (``false``)
+            subscriptions.
+
+    owner
+            If given, only list subscriptions with this owner.
+
+    event
+            If given, only list subscriptions for this object and event
+            type, e.g. ``user.created``.
+
+    target_host
+            If given, only list subscriptions whose target has this host.
+    """
 
     _DEFAULT_BATCH_SIZE = 30
     _DEFAULT_BATCH_START = 0
@@ -207,6 +642,13 @@ class ListSubscriptions(SubscriptionViewMixin,
 
     _DEFAULT_SORT = 'createdTime'
 
+    _CURSOR_VALUE_TYPES = {
+        'active': numbers.Number,
+        'createdTime': numbers.Number,
+    }
+
+    _CURSOR_KEY_LENGTH = 3
+
     @Lazy
     def params(self):
         return CaseInsensitiveDict(**self.request.params)
@@ -223,25 +665,324 @@ class ListSubscriptions(SubscriptionViewMixin,
         # pylint: disable=no-member
         return self.params.get('sortOrder', 'ascending')
 
-    def get_subscriptions(self):
+    @property
+    def sort_descending(self):
+        return self.sortOrder == "descending"
+
+    @Lazy
+    def all_sites(self):
+        # pylint: disable=no-member
+        return is_true(self.params.get('all_sites'))
+
+    def _sort_state(self):
+        return self.sortOn, self.sort_descending
+
+    def _predicate(self):
+        super(ListSubscriptions, self)._predicate()
+        if self.all_sites and not self.is_admin:
+            raise hexc.HTTPForbidden(_('Cannot view subscriptions for all sites.'))
+
+    @Lazy
+    def _managers(self):
+        """
+        The subscription managers we've seen, by :func:`.manager_token`.
+        """
+        return {}
+
+    def _manager(self, token):
+        try:
+            return self._managers[token]
+        except KeyError:
+            # Found by another connection while scanning all sites
+            sub_manager = getSite()._p_jar.get(unhexlify(token))
+            self._managers[token] = sub_manager
+            return sub_manager
+
+    @Lazy
+    def subscription_indexes(self):
         utilities_in_current_site = component.getUtilitiesFor(IWebhookSubscriptionManager)
-        subscriptions = [subscription
-                         for _, sub_manager in utilities_in_current_site
-                         for subscription in sub_manager.values()
-                         if checkPermission(ACT_READ.id, subscription)]
+        result = []
+        for unused_name, sub_manager in utilities_in_current_site:
+            token = manager_token(sub_manager)
+            self._managers[token] = sub_manager
+            result.append((token, sub_manager, _subscription_index(sub_manager)))
+        return result
+
+    @Lazy
+    def read_evaluator(self):
+        return BulkSubscriptionReadEvaluator(self.remoteUser.username,
+                                             self.is_admin)
+
+    @Lazy
+    def filter_query(self):
+        """
+        The index query for the requested filters, if any.
+        """
+        # pylint: disable=no-member
+        query = {}
+        active = self.params.get('active')
+        if active:
+            query['active'] = int(is_true(active))
+        owner = self.params.get('owner')
+        if owner:
+            query['owner'] = text_(owner)
+        host = self.params.get('target_host')
+        if host:
+            query['target_host'] = text_(host.strip().lower())
+        event = self.params.get('event')
+        if event:
+            subscriber = component.queryAdapter(self.request,
+                                                IWebhookSubscriber,
+                                                name=event)
+            if subscriber is None:
+                raise_json_error(self.request,
+                                 hexc.HTTPUnprocessableEntity,
+                                 {
+                                     'message': _(u"Unsupported event type."),
+                                 },
+                                 None)
+            query['trigger'] = trigger_key(subscriber.for_, subscriber.when)
+        return query
+
+    def _filtered_names(self, index):
+        """
+        The names of the subscriptions in the index matching the requested
+        filters, or None if there are no filters.
+        """
+        if not self.filter_query:
+            return None
+        return set(index.filter_names(self.filter_query))
+
+    def _sorted_names(self, token, index, names, after=None):
+        """
+        Return a list of the ``(value, name, manager)`` sort keys of the
+        named subscriptions, in the requested order. If *after* is given,
+        the keys start following it.
+        """
+        sort_on, descending = self._sort_state()
+        keys = sorted((index.sort_key(name, sort_on) + (token,)
+                       for name in names),
+                      reverse=descending)
+        if after is not None:
+            if descending:
+                keys = [key for key in keys if key < after]
+            else:
+                keys = [key for key in keys if key > after]
+        return keys
+
+    def _index_keys(self, token, index, after=None, names=None):
+        """
+        Iterate the ``(value, name, manager)`` sort keys of all
+        subscriptions in the index, or those named, in the requested order.
+        If *after* is given, the keys start following it.
+        """
+        if names is not None:
+            # Typically a small subset, so we sort it from the index values
+            return self._sorted_names(token, index, names, after)
+
+        sort_on, descending = self._sort_state()
+        if after is None:
+            keys = index.sort_keys(sort_on, descending)
+        else:
+            value, name, after_token = after
+            keys = index.sort_keys(sort_on, descending, after=(value, name))
+            # A subscription of ours tying with the cursor's may still be due
+            if (token < after_token if descending else token > after_token) \
+                    and name in index \
+                    and index.sort_key(name, sort_on) == (value, name):
+                keys = chain(((value, name),), keys)
+        return ((value, name, token) for value, name in keys)
+
+    def _readable_keys(self, token, sub_manager, index, after=None):
+        """
+        Return the number of subscriptions in the manager the remote user
+        may read that match the requested filters, and their
+        ``(value, name, manager)`` sort keys in the requested order. If
+        *after* is given, the keys start following it.
+        """
+        evaluator = self.read_evaluator
+        denied = evaluator.denied_names(sub_manager, index)
+        names = self._filtered_names(index)
+        if evaluator.reads_unowned(sub_manager, index):
+            if names is None:
+                count = len(index) - len(denied)
+                keys = self._index_keys(token, index, after)
+                if denied:
+                    keys = (key for key in keys if key[1] not in denied)
+                return count, keys
+            names.difference_update(denied)
+        else:
+            readable = evaluator.readable_names(sub_manager, index)
+            names = readable if names is None else names.intersection(readable)
+        return len(names), self._sorted_names(token, index, names, after)
+
+    def _site_keys(self, after=None):
+        """
+        Return ``(count, keys)`` for each subscription manager in the
+        current site, as for :meth:`_readable_keys`.
+        """
+        return [self._readable_keys(token, sub_manager, index, after)
+                for token, sub_manager, index in self.subscription_indexes]
+
+    def _all_sites_keys(self, after, limit):
+        """
+        Return ``(count, keys)`` for each subscription manager of every host
+        site, as for :meth:`_readable_keys`, but with, at most, the first
+        *limit* keys.
+
+        Sites are scanned concurrently, each in its own connection, and
+        only the keys of the leading subscriptions are returned. As only
+        NTI admins may do this, all but those denied by custom grants are
+        readable; those are checked afterwards, in our own connection.
+        """
+        def scan(unused_site):
+            result = []
+            utilities_in_site = component.getUtilitiesFor(IWebhookSubscriptionManager)
+            for unused_name, sub_manager in utilities_in_site:
+                token = manager_token(sub_manager)
+                index = _subscription_index(sub_manager)
+                names = self._filtered_names(index)
+                custom = [name for name in index.custom_security_names()
+                          if names is None or name in names]
+                keys = list(islice(self._index_keys(token, index, after, names),
+                                   limit + len(custom)))
+                count = len(index) if names is None else len(names)
+                result.append((token, count, keys, custom))
+            return result
+
+        # Make sure we've read everything needed from the request
+        self._sort_state()
+        self.filter_query  # pylint: disable=pointless-statement
+        scanned = scan_host_sites(getSite()._p_jar.db(), scan)
+
+        result = []
+        seen = set()
+        for unused_site_name, site_result in scanned:
+            for token, count, keys, custom in site_result:
+                # Managers of parent sites are found in each child site
+                if token in seen:
+                    continue
+                seen.add(token)
+                if custom:
+                    sub_manager = self._manager(token)
+                    denied = self.read_evaluator.denied_names(sub_manager,
+                                                              _subscription_index(sub_manager))
+                    denied = denied.intersection(custom)
+                    count -= len(denied)
+                    keys = [key for key in keys if key[1] not in denied]
+                result.append((count, keys[:limit]))
+        return result
 
-        reverse = self.sortOrder == "descending"
-        return sorted(subscriptions, key=attrgetter(self.sortOn), reverse=reverse)
+    def _sorted_keys(self, after=None, limit=None):
+        """
+        Return the number of subscriptions the remote user may read and an
+        iteration of the ``(value, name, manager)`` sort key for each, in
+        the requested order, without loading any subscriptions. If *after*
+        is given, the iteration starts following that key. At least
+        *limit* keys are iterated, if available.
+        """
+        if self.all_sites:
+            manager_keys = self._all_sites_keys(after, limit)
+        else:
+            manager_keys = self._site_keys(after)
+        total = sum(count for count, unused_keys in manager_keys)
+        return total, merge_sorted([keys for unused_count, keys in manager_keys],
+                                   reverse=self.sort_descending)
+
+    def _load(self, keys):
+        return [(key, self._manager(key[2])[key[1]]) for key in keys]
+
+    def get_subscriptions(self, batch_start, batch_size):
+        """
+        Return the total number of subscriptions visible to the remote user
+        and the ``(value, name, manager)`` sort key and subscription for
+        each subscription in the requested batch. Only the subscriptions in
+        the batch are loaded.
+        """
+        total, keys = self._sorted_keys(limit=batch_start + batch_size)
+        keys = islice(keys, batch_start, batch_start + batch_size)
+        return total, self._load(keys)
+
+    def get_subscriptions_after(self, after, batch_size):
+        """
+        Return the total number of subscriptions visible to the remote user
+        and the ``(value, name, manager)`` sort key and subscription for,
+        at most, ``batch_size + 1`` of them following the sort key *after*.
+        """
+        total, keys = self._sorted_keys(after, limit=batch_size + 1)
+        keys = islice(keys, batch_size + 1)
+        return total, self._load(keys)
+
+    def _do_cursor_call(self, result):
+        batch_size, _ = self._get_batch_size_start()
+        total, page = self.get_subscriptions_after(self.cursor_key, batch_size)
+        if batch_size and len(page) > batch_size:
+            page = page[:batch_size]
+            self._add_next_link(result, page[-1][0], batch_size)
+        result[ITEMS] = [subscription for _, subscription in page]
+        result[ITEM_COUNT] = len(page)
+        result[TOTAL] = total
+        return result
+
+    def count_subscriptions(self):
+        """
+        The number of subscriptions visible to the remote user, from the
+        index counts, without sorting or loading any subscriptions.
+        """
+        if self.all_sites:
+            return sum(count for count, unused_keys
+                       in self._all_sites_keys(None, 0))
+        if self.filter_query:
+            return sum(count for count, unused_keys in self._site_keys())
+        evaluator = self.read_evaluator
+        return sum(evaluator.readable_count(sub_manager, index)
+                   for unused_token, sub_manager, index in self.subscription_indexes)
+
+    def _change_token(self):
+        if self.all_sites:
+            # Not worth scanning every site for
+            return None
+        # Which subscriptions may be read also depends on grants and
+        # roles, on the subscriptions with custom grants, and on the
+        # managers and their parents for the rest, which the index
+        # doesn't track. Those are decided once per manager.
+        for unused_token, sub_manager, unused_index in self.subscription_indexes:
+            if query_subscription_index(sub_manager) is None:
+                # Built for this request, so has no meaningful count
+                return None
+        evaluator = self.read_evaluator
+        changes = tuple((token,
+                         index.change_count,
+                         evaluator.reads_unowned(sub_manager, index),
+                         tuple(sorted(evaluator.denied_names(sub_manager, index))))
+                        for token, sub_manager, index in self.subscription_indexes)
+        return changes, self.is_admin
 
     def _do_call(self):
-        self._predicate()
+        self._check_not_modified()
         result = LocatedExternalDict()
-        items = self.get_subscriptions()
-        total_len = len(items)
+        if _count_only(self.request):
+            result[ITEMS] = []
+            result[ITEM_COUNT] = 0
+            result[TOTAL] = self.count_subscriptions()
+            return result
+
+        if self.use_cursor:
+            return self._do_cursor_call(result)
+
+        batch_size, batch_start = self._get_batch_size_start()
+        total_len, page = self.get_subscriptions(batch_start, batch_size)
+        items = _BatchWindow(total_len,
+                             batch_start,
+                             [subscription for _, subscription in page])
         self._batch_items_iterable(result, items,
-                                   number_items_needed=total_len)
+                                   number_items_needed=items.needed(batch_size))
         result[TOTAL] = total_len
 
+        # Allow switching to cursors to continue from here
+        if page and batch_start + batch_size < total_len:
+            self._add_next_link(result, page[-1][0], batch_size)
+
         return result
 
 
@@ -252,7 +993,10 @@ class ListSubscriptions(SubscriptionViewMixin,
              name='DeliveryHistory',
              permission=nauth.ACT_READ)
 class GetSubscriptionHistoryView(SubscriptionViewMixin,
-                                 BatchingUtilsMixin):
+                                 BatchingUtilsMixin,
+                                 CursorBatchingMixin,
+                                 ChangeTokenETagMixin,
+                                 TimeWindowMixin):
     """
     Return the delivery attempts for the subscription.
 
@@ -272,7 +1016,28 @@ class GetSubscriptionHistoryView(SubscriptionViewMixin,
             ``descending``. Sort order is ascending by default.
 
     search
-            String to use for searching messages of the delivery attempts.
+            Words to search for in the messages of the delivery attempts.
+            Attempts match if, for each of these words, their message has a
+            word (ignoring case) beginning with it.
+
+    since
+            An ISO 8601 time; only attempts created at or after it are
+            returned. Times without a timezone are taken to be UTC.
+
+    until
+            An ISO 8601 time; only attempts created before it are returned.
+
+    cursor
+            An opaque token from the ``next`` link of a previous batch,
+            from which to resume. Supersedes ``batchStart``; it may be
+            empty to request the first batch.
+
+    count_only
+            If true, only return the total number of delivery attempts, as
+            does a ``batchSize`` of zero.
+
+    Requests accepting ``text/csv`` ahead of JSON receive all of the
+    matching delivery attempts, in order, streamed as CSV.
     """
 
     _DEFAULT_BATCH_SIZE = 30
@@ -284,6 +1049,10 @@ class GetSubscriptionHistoryView(SubscriptionViewMixin,
         'status': lambda x: x.status,
     }
 
+    _CURSOR_VALUE_TYPES = {
+        'createdtime': numbers.Number,
+    }
+
     def _get_sorted_result_set(self, items, sort_key, sort_desc=False):
         """
         Get the sorted result set.
@@ -291,42 +1060,107 @@ class GetSubscriptionHistoryView(SubscriptionViewMixin,
         items = sorted(items, key=sort_key, reverse=sort_desc)
         return items
 
-    def _get_sort_params(self):
+    def _sort_state(self):
         sort_on = self.request.params.get('sortOn') or ''
         sort_on = sort_on.lower()
         sort_on = sort_on if sort_on in self._sort_keys else self._default_sort
-        sort_key = self._sort_keys.get(sort_on)
 
         # Ascending is default
         sort_order = self.request.params.get('sortOrder')
         sort_descending = bool(
             sort_order and sort_order.lower() == 'descending')
 
+        return sort_on, sort_descending
+
+    def _get_sort_params(self):
+        sort_on, sort_descending = self._sort_state()
+        sort_value = self._sort_keys.get(sort_on)
+
+        # Ties are broken by name, which is our iteration order
+        def sort_key(item):
+            return sort_value(item), item.__name__
+
         return sort_key, sort_descending
 
     def _search_items(self, search_param, items):
         """
-        For the given search_param, return the results for those users
-        if it matches realname, alias, or displayable username.
+        For the given search_param, return the items whose messages have,
+        for each word of it, a word beginning with that word.
         """
+        terms = message_terms(search_param)
+        if not terms:
+            return []
+        return [x for x in items if message_matches(x.message, terms)]
+
+    @Lazy
+    def search_param(self):
+        search = self.request.params.get('search')
+        return search and search.lower()
 
-        def matches(item):
-            return item.message and search_param in item.message.lower()
+    @property
+    def windowed(self):
+        since, until = self.time_window
+        return since is not None or until is not None
 
-        results = [x for x in items if matches(x)]
+    def _indexed_names(self, index):
+        """
+        The names of the indexed delivery attempts matching the search and
+        time window, or None if all match.
+        """
+        names = None
+        if self.search_param:
+            names = index.search(self.search_param)
+        if self.windowed:
+            window = index.created_between(*self.time_window)
+            names = window if names is None else names & window
+        return names
+
+    def _matching_items(self):
+        """
+        The delivery attempts matching the search and time window, found
+        without the index.
+        """
+        items = self.context.values()
+        if self.search_param:
+            items = self._search_items(self.search_param, items)
+        if self.windowed:
+            since, until = self.time_window
+            items = [x for x in items if _in_window(x.createdTime, since, until)]
+        return items
 
-        return results
+    def _sorted_names(self):
+        """
+        The names of all delivery attempts matching the search and time
+        window, in the requested order, loading the attempts only if they
+        are not indexed.
+        """
+        index = self._attempt_index()
+        if index is not None:
+            return [name for unused_value, name
+                    in self._indexed_keys(index, self._indexed_names(index))]
+        sort_key, sort_descending = self._get_sort_params()
+        return [x.__name__ for x in self._get_sorted_result_set(self._matching_items(),
+                                                                sort_key,
+                                                                sort_descending)]
 
     def _get_items(self, result_dict):
         """
         Sort and batch records.
         """
-        search = self.request.params.get('search')
-        search_param = search and search.lower()
+        index = self._attempt_index()
+        if index is not None:
+            names = self._indexed_names(index)
+            if _count_only(self.request):
+                return self._count_items(result_dict,
+                                         len(index if names is None else names))
+            return self._get_indexed_items(result_dict, index, names)
 
-        items = self.context.values()
-        if search_param:
-            items = self._search_items(search_param, items)
+        if not self.search_param and not self.windowed and _count_only(self.request):
+            return self._count_items(result_dict, len(self.context))
+
+        items = self._matching_items()
+        if _count_only(self.request):
+            return self._count_items(result_dict, len(items))
 
         sort_key, sort_descending = self._get_sort_params()
 
@@ -335,13 +1169,118 @@ class GetSubscriptionHistoryView(SubscriptionViewMixin,
                                                  sort_descending)
 
         total_items = result_dict[TOTAL] = len(result_set)
+        if self.use_cursor:
+            return self._get_cursor_batch(result_dict,
+                                          result_set,
+                                          sort_key,
+                                          sort_descending)
+
         self._batch_items_iterable(result_dict,
                                    result_set,
                                    number_items_needed=total_items)
 
+        batch_size, batch_start = self._get_batch_size_start()
+        if batch_size and batch_start + batch_size < total_items:
+            last_item = result_set[batch_start + batch_size - 1]
+            self._add_next_link(result_dict, sort_key(last_item), batch_size)
+
         return [record for record in result_dict.get(ITEMS)]
 
+    def _count_items(self, result_dict, total_items):
+        result_dict[TOTAL] = total_items
+        result_dict[ITEM_COUNT] = 0
+        return []
+
+    def _attempt_index(self):
+        """
+        The delivery attempt index of the subscription, if it is complete.
+        Subscriptions whose attempts predate the index are sorted (and
+        searched) in full.
+        """
+        index = query_delivery_attempt_index(self.context)
+        if index is not None and len(index) == len(self.context):
+            return index
+        return None
+
+    def _indexed_keys(self, index, names=None, after=None):
+        sort_on, sort_descending = self._sort_state()
+        if names is None:
+            return index.sort_keys(sort_on, reverse=sort_descending, after=after)
+        # Search results are few enough to sort their keys, still without
+        # loading the attempts.
+        keys = sorted((index.sort_key(name, sort_on) for name in names),
+                      reverse=sort_descending)
+        if after is not None:
+            if sort_descending:
+                keys = [x for x in keys if x < after]
+            else:
+                keys = [x for x in keys if x > after]
+        return iter(keys)
+
+    def _get_indexed_items(self, result_dict, index, names=None):
+        """
+        Batch records from the index, loading only those in the batch. If
+        given, only those with the given *names* are included.
+        """
+        batch_size, batch_start = self._get_batch_size_start()
+        total_items = result_dict[TOTAL] = len(index if names is None else names)
+
+        if self.use_cursor:
+            keys = list(islice(self._indexed_keys(index, names, self.cursor_key),
+                               batch_size + 1))
+            if batch_size and len(keys) > batch_size:
+                keys = keys[:batch_size]
+                self._add_next_link(result_dict, keys[-1], batch_size)
+            items = [self.context[name] for unused_value, name in keys]
+            result_dict[ITEM_COUNT] = len(items)
+            return items
+
+        keys = list(islice(self._indexed_keys(index, names),
+                           batch_start, batch_start + batch_size))
+        page = [self.context[name] for unused_value, name in keys]
+        items = _BatchWindow(total_items, batch_start, page)
+        self._batch_items_iterable(result_dict, items,
+                                   number_items_needed=items.needed(batch_size))
+        # Only the leading items were batched
+        result_dict[TOTAL] = total_items
+
+        if keys and batch_start + batch_size < total_items:
+            self._add_next_link(result_dict, keys[-1], batch_size)
+
+        return [record for record in result_dict.get(ITEMS)]
+
+    def _get_cursor_batch(self, result_dict, result_set, sort_key, sort_descending):
+        after = self.cursor_key
+        if after is not None:
+            if sort_descending:
+                result_set = [x for x in result_set if sort_key(x) < after]
+            else:
+                result_set = [x for x in result_set if sort_key(x) > after]
+
+        batch_size, _ = self._get_batch_size_start()
+        items = result_set[:batch_size]
+        if batch_size and len(result_set) > batch_size:
+            self._add_next_link(result_dict, sort_key(items[-1]), batch_size)
+        result_dict[ITEM_COUNT] = len(items)
+        return items
+
+    def _change_token(self):
+        changes = get_delivery_change_count(self.context)
+        if changes is None:
+            return None
+        return changes, self.is_admin
+
+    def __call__(self):
+        if not wants_csv(self.request):
+            return super(GetSubscriptionHistoryView, self).__call__()
+        self._predicate()
+        return delivery_attempt_csv_response(self.request,
+                                             [(self.context, name)
+                                              for name in self._sorted_names()],
+                                             'delivery_history.csv')
+
     def _do_call(self):
+        self._check_not_modified()
         result_dict = LocatedExternalDict()
 
         result_dict[MIMETYPE] = 'application/vnd.nextthought.zapier.subscriptiondeliveryhistory'
@@ -351,13 +1290,189 @@ class GetSubscriptionHistoryView(SubscriptionViewMixin,
         return result_dict
 
 
+@view_config(route_name='objects.generic.traversal',
+             request_method='GET',
+             renderer='rest',
+             context=IntegrationProviderPathAdapter,
+             name=SITE_DELIVERY_FAILURES_VIEW)
+class SiteDeliveryFailuresView(SubscriptionViewMixin,
+                               BatchingUtilsMixin,
+                               CursorBatchingMixin,
+                               TimeWindowMixin):
+    """
+    List the failed delivery attempts of all subscriptions for the current
+    site, most recently created first, each with the ``Id`` of its
+    ``Subscription``. Only available to NTI admins.
+
+    Attempts are read from the failure index of each subscription manager,
+    ordered by a sort key of ``(created, subscription, name, manager)``,
+    so only those in the batch are loaded.
+
+    batchSize
+            The size of the batch.  Defaults to 30.
+
+    since
+            An ISO 8601 time; only attempts created at or after it are
+            returned. Times without a timezone are taken to be UTC.
+
+    until
+            An ISO 8601 time; only attempts created before it are returned.
+
+    cursor
+            An opaque token from the ``next`` link of a previous batch,
+            from which to resume.
+
+    Requests accepting ``text/csv`` ahead of JSON receive all of the
+    failed delivery attempts in the window, streamed as CSV.
+    """
+
+    _DEFAULT_BATCH_SIZE = 30
+    _DEFAULT_BATCH_START = 0
+
+    _CURSOR_VALUE_TYPES = {
+        'createdtime': numbers.Number,
+    }
+
+    _CURSOR_KEY_LENGTH = 4
+
+    def _predicate(self):
+        if not self.is_admin:
+            raise hexc.HTTPForbidden(_('Cannot view delivery failures.'))
+
+    def _sort_state(self):
+        return 'createdtime', True
+
+    @Lazy
+    def failure_indexes(self):
+        evaluator = BulkSubscriptionReadEvaluator(self.remoteUser.username,
+                                                  self.is_admin)
+        result = []
+        utilities_in_site = component.getUtilitiesFor(IWebhookSubscriptionManager)
+        for unused_name, sub_manager in utilities_in_site:
+            denied = evaluator.denied_names(sub_manager,
+                                            _subscription_index(sub_manager))
+            result.append((manager_token(sub_manager),
+                           sub_manager,
+                           _failure_index(sub_manager),
+                           denied))
+        return result
+
+    def _failure_keys(self, token, index, denied, after=None):
+        """
+        Iterate the ``(created, subscription, name, manager)`` sort keys of
+        the failed delivery attempts in the index, most recent first. If
+        *after* is given, the keys start following it.
+        """
+        since, until = self.time_window
+        # Our key tying with the cursor's, if any, sorts before it, so is
+        # still iterated, and only kept if due.
+        keys = (key + (token,) for key
+                in index.failure_keys(True, after, since, until)
+                if key[1] not in denied)
+        if after is not None:
+            keys = (key for key in keys if key < after)
+        return keys
+
+    def _sorted_keys(self, after=None):
+        """
+        Iterate the sort keys of the failed delivery attempts of all
+        subscription managers, most recent first.
+        """
+        return merge_sorted([self._failure_keys(token, index, denied, after)
+                             for token, unused_manager, index, denied
+                             in self.failure_indexes],
+                            reverse=True)
+
+    @Lazy
+    def _managers(self):
+        return dict((token, sub_manager) for token, sub_manager, unused_index, unused_denied
+                    in self.failure_indexes)
+
+    def _subscription(self, token, subscription_name):
+        return self._managers[token][subscription_name]
+
+    def _total(self):
+        since, until = self.time_window
+        if since is not None or until is not None:
+            return sum(1 for unused_token, unused_manager, index, denied
+                       in self.failure_indexes
+                       for key in index.failure_keys(True, None, since, until)
+                       if key[1] not in denied)
+        return sum(len(index) - sum(index.subscription_count(name) for name in denied)
+                   for unused_token, unused_manager, index, denied
+                   in self.failure_indexes)
+
+    def _do_call(self):
+        result = LocatedExternalDict()
+        result[MIMETYPE] = 'application/vnd.nextthought.zapier.deliveryfailures'
+        result[CLASS] = 'DeliveryFailures'
+
+        batch_size, _ = self._get_batch_size_start()
+        keys = list(islice(self._sorted_keys(self.cursor_key), batch_size + 1))
+        if batch_size and len(keys) > batch_size:
+            keys = keys[:batch_size]
+            self._add_next_link(result, keys[-1], batch_size)
+
+        result[ITEMS] = [self._subscription(token, subscription_name)[name]
+                         for unused_created, subscription_name, name, token in keys]
+        result[ITEM_COUNT] = len(keys)
+        result[TOTAL] = self._total()
+        return result
+
+    def _csv_response(self):
+        subscriptions = {}
+        attempts = []
+        for unused_created, subscription_name, name, token in self._sorted_keys():
+            key = (token, subscription_name)
+            if key not in subscriptions:
+                subscriptions[key] = self._subscription(token, subscription_name)
+            attempts.append((subscriptions[key], name))
+        return delivery_attempt_csv_response(self.request, attempts,
+                                             'delivery_failures.csv')
+
+    def __call__(self):
+        if not wants_csv(self.request):
+            return super(SiteDeliveryFailuresView, self).__call__()
+        self._predicate()
+        return self._csv_response()
+
+    def externalize_result(self, result):
+        attempts = result[ITEMS]
+        result = super(SiteDeliveryFailuresView, self).externalize_result(result)
+        if self.requested_fields is None:
+            for attempt, ext in zip(attempts, result[ITEMS]):
+                ext['Subscription'] = to_external_ntiid_oid(attempt.__parent__)
+        return result
+
+
+class _StoredBodyMixin(object):
+    """
+    Report the original length of the body of the externalized request or
+    response, as ``BodyLength``, and whether it was truncated when stored,
+    as ``BodyTruncated``.
+    """
+
+    #: The attribute holding the body.
+    _body_name = None
+
+    def externalize_result(self, result):
+        ext = super(_StoredBodyMixin, self).externalize_result(result)
+        if self.requested_fields is None:
+            length, truncated = stored_body_length(result, self._body_name)
+            ext['BodyLength'] = length
+            ext['BodyTruncated'] = truncated
+        return ext
+
+
 @view_config(route_name='objects.generic.traversal',
              request_method='GET',
              renderer='rest',
              context=IWebhookDeliveryAttempt,
              name='Request',
              permission=nauth.ACT_READ)
-class GetDeliveryAttemptRequest(SubscriptionViewMixin):
+class GetDeliveryAttemptRequest(_StoredBodyMixin, SubscriptionViewMixin):
+
+    _body_name = 'body'
 
     def _do_call(self):
         return self.context.request
@@ -369,7 +1484,9 @@ class GetDeliveryAttemptRequest(SubscriptionViewMixin):
              context=IWebhookDeliveryAttempt,
              name='Response',
              permission=nauth.ACT_READ)
-class GetDeliveryAttemptResponse(SubscriptionViewMixin):
+class GetDeliveryAttemptResponse(_StoredBodyMixin, SubscriptionViewMixin):
+
+    _body_name = 'content'
 
     def _do_call(self):
         if self.context.response is None:
@@ -10,6 +10,8 @@ from zope import interface
 
 from zope.cachedescriptors.property import Lazy
 
+from zope.security import checkPermission
+
 from zope.securitypolicy.interfaces import Allow
 from zope.securitypolicy.interfaces import IPrincipalPermissionMap
 
@@ -21,6 +23,8 @@ from nti.app.users.utils import get_site_admins
 
 from nti.coremetadata.interfaces import IUser
 
+from nti.dataserver.authorization import ACT_READ
+
 from nti.dataserver.interfaces import ISiteAdminUtility
 
 
@@ -78,3 +82,88 @@ class UserPrincipalPermissionMap(object):
                 result.append((principal_id, perm, Allow))
 
         return result
+
+
+class BulkSubscriptionReadEvaluator(object):
+    """
+    Determine which of the subscriptions in a subscription manager a
+    principal may read, without consulting the security policy for each.
+
+    Subscriptions that still have the grants made when they were added
+    (see :func:`nti.app.products.zapier.subscribers.has_default_security`)
+    are readable by their owner. Whether the principal may read the rest
+    of them is decided by its effective roles and grants on the manager,
+    found by the security policy through the role and permission managers
+    of the manager and its parents, and by the grants those subscriptions
+    all share. So this is checked once for each manager, with one of
+    them. Only the subscriptions the index marks as having custom grants
+    are loaded and checked in full. Anything changing the grants of an
+    existing subscription must mark it with
+    :meth:`~.ISubscriptionIndex.mark_custom_security`.
+
+    NTI admins may read every subscription with the default grants,
+    which need not be checked.
+    """
+
+    permission_id = ACT_READ.id
+
+    def __init__(self, principal_id, is_admin=False):
+        self.principal_id = principal_id
+        self.is_admin = is_admin
+        self._denied = {}
+        self._reads_unowned = {}
+
+    def denied_names(self, sub_manager, index):
+        """
+        The names of the subscriptions with custom grants that may not
+        be read.
+        """
+        key = id(sub_manager)
+        if key not in self._denied:
+            self._denied[key] = frozenset(
+                name for name in index.custom_security_names()
+                if not checkPermission(self.permission_id, sub_manager[name]))
+        return self._denied[key]
+
+    def _unowned_default_name(self, index):
+        owned = set(index.owned_by(self.principal_id))
+        custom = set(index.custom_security_names())
+        for unused_value, name in index.sort_keys('owner_id'):
+            if name not in owned and name not in custom:
+                return name
+        return None
+
+    def reads_unowned(self, sub_manager, index):
+        """
+        Whether the principal may read the subscriptions with the default
+        grants it does not own, and so every subscription not in
+        :meth:`denied_names`.
+        """
+        if self.is_admin:
+            return True
+        key = id(sub_manager)
+        if key not in self._reads_unowned:
+            name = self._unowned_default_name(index)
+            subscription = sub_manager.get(name) if name is not None else None
+            self._reads_unowned[key] = subscription is not None \
+                and bool(checkPermission(self.permission_id, subscription))
+        return self._reads_unowned[key]
+
+    def readable_names(self, sub_manager, index):
+        """
+        The names of all readable subscriptions. When
+        :meth:`reads_unowned`, use :meth:`denied_names` and the index
+        itself, rather than collecting this set.
+        """
+        if self.reads_unowned(sub_manager, index):
+            names = set(name for unused_value, name in index.sort_keys('owner_id'))
+        else:
+            names = set(index.owned_by(self.principal_id))
+            names.update(index.custom_security_names())
+        names.difference_update(self.denied_names(sub_manager, index))
+        return names
+
+    def readable_count(self, sub_manager, index):
+        if self.reads_unowned(sub_manager, index):
+            return len(index) - len(self.denied_names(sub_manager, index))
+        return len(self.readable_names(sub_manager, index))